@@ -1,15 +1,80 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from groq import Groq
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from typing import List, Optional
+import asyncio
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+import re
+from safycore_backend import diagnostics, fastjson, metrics, traffic
+from safycore_backend.groq_client import (
+    cancel_stream,
+    create_chat_completion,
+    new_groq_client,
+    record_usage,
+    usage_from_chunk,
+)
+from chat.catalog import FileCatalog, catalog_cache, direct_answer
+from chat.messages import Message as HistoryMessage, Role, to_payload
+from chat.prompts import build_system_prompt
+from chat.streaming import Coalescer
+from safycore_backend.limiter import Overloaded, chat_limiter, upstream_queue_seconds
+from safycore_backend.routing import set_route
+from safycore_backend.websocket import ChatSocket, TurnError
+from safycore_backend.resilience import (
+    breaker_states,
+    current_deadline,
+    deadline_scope,
+    upstream_error_status,
+)
 
-app = FastAPI(title="SafyCore Chatbot API")
+# Serverless platforms inject env vars directly; only read .env when one exists
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+if os.path.exists(ENV_FILE):
+    from dotenv import load_dotenv
+    load_dotenv(ENV_FILE)
+
+# Completion budget of a chat reply
+MAX_COMPLETION_TOKENS = 100
+
+# Largest catalog POST /catalogs accepts, as for the Django catalog API
+CATALOG_MAX_BYTES = int(os.getenv("CATALOG_MAX_BYTES", "2097152"))
+
+# Markdown stripping patterns, compiled once per process
+MARKDOWN_PATTERNS = [
+    (re.compile(r'\*\*([^*]+)\*\*'), r'\1'),                  # Remove bold
+    (re.compile(r'\*([^*]+)\*'), r'\1'),                        # Remove italic
+    (re.compile(r'__([^_]+)__'), r'\1'),                        # Remove bold underscore
+    (re.compile(r'_([^_]+)_'), r'\1'),                          # Remove italic underscore
+    (re.compile(r'\|.*\|'), ''),                                # Remove table rows
+    (re.compile(r'^[-=]+$', re.MULTILINE), ''),                 # Remove separators
+    (re.compile(r'^\s*[-*+]\s+', re.MULTILINE), ''),            # Remove bullets
+    (re.compile(r'^\s*\d+\.\s+', re.MULTILINE), ''),            # Remove numbered lists
+]
+
+def strip_markdown(text: str) -> str:
+    """Strip ALL markdown formatting"""
+    for pattern, replacement in MARKDOWN_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+@asynccontextmanager
+async def lifespan(app):
+    """Warm up before the first request: build the pooled Groq client"""
+    if os.getenv("GROQ_API_KEY") and os.getenv("WARMUP", "1") != "0":
+        pooled_groq_client(os.getenv("GROQ_API_KEY"))
+    yield
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson when installed (handles datetime and UUID natively)"""
+
+    def render(self, content) -> bytes:
+        return fastjson.dumps(content)
+
+app = FastAPI(title="SafyCore Chatbot API", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # CORS middleware for frontend connection
 app.add_middleware(
@@ -20,9 +85,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    Close the body generator as soon as the response ends
+    On a client disconnect Starlette only cancels the send loop, which would
+    leave the generator (and the Groq stream behind it) open until collected
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+@app.middleware("http")
+async def request_deadline(request, call_next):
+    """Give every request a deadline budget that upstream calls inherit"""
+    with deadline_scope():
+        return await call_next(request)
+
 # In-memory conversation storage (use Redis/DB for production)
+# Each session is a list of compact chat.messages.Message objects
 conversations = {}
 
+# training_data.txt, re-read only when the file changes
+training_file = FileCatalog("training_data.txt")
+
+diagnostics.register("conversations.sessions", lambda: len(conversations))
+diagnostics.register("conversations.messages", lambda: sum(len(history) for history in list(conversations.values())))
+
 class Message(BaseModel):
     role: str
     content: str
@@ -32,23 +123,43 @@ class ChatRequest(BaseModel):
     session_id: Optional[str] = "default"
     api_key: Optional[str] = None
     training_data: Optional[str] = None
+    catalog_id: Optional[str] = None
     use_streaming: Optional[bool] = True
 
+class CatalogRequest(BaseModel):
+    content: str
+    name: Optional[str] = None
+
 class ChatResponse(BaseModel):
     response: str
     session_id: str
 
-def get_system_prompt(training_data: Optional[str] = None) -> str:
-    """Generate system prompt with optional training data"""
-    base_prompt = """You are a car sales assistant. CRITICAL RULES:
-1. ONLY answer questions using the car data provided below
-2. If asked about something NOT in the data, say "I only have information about the cars listed"
-3. Answer in plain text, NO markdown, NO tables, NO bullets, NO formatting (no **, *, _, |)
-4. Keep answers SHORT (1-2 sentences max)
-5. Be conversational and helpful"""
-    if training_data:
-        return f"{base_prompt}\n\nCAR DATA:\n{training_data}"
-    return base_prompt
+@lru_cache(maxsize=32)
+def pooled_groq_client(api_key: str):
+    """One client per API key, so connections are reused across requests"""
+    return new_groq_client(api_key)
+
+def session_training_data(training_data: Optional[str] = None, catalog_id: Optional[str] = None):
+    """Training data of a request, resolving catalog_id to the cached catalog text"""
+    if not catalog_id:
+        return training_data
+    catalog = find_catalog(catalog_id)
+    if catalog is None:
+        raise HTTPException(status_code=404, detail="Catalog not found")
+    return catalog.text
+
+def find_catalog(catalog_id: str):
+    """
+    Uploaded catalog or training file by content hash, or None
+    Uploads live in this process's bounded catalog_cache, so an id is only
+    valid on the worker that received the upload, and only until evicted
+    """
+    catalog = catalog_cache.peek(catalog_id)
+    if catalog is None:
+        _, catalog = training_file.load()
+        if catalog is None or catalog.content_hash != catalog_id:
+            return None
+    return catalog
 
 def get_groq_client(api_key: Optional[str] = None):
     """Initialize Groq client with API key from request or environment"""
@@ -58,144 +169,307 @@ def get_groq_client(api_key: Optional[str] = None):
             status_code=400,
             detail="GROQ_API_KEY not provided in request or environment variables"
         )
-    # Simple initialization - just pass api_key
-    return Groq(api_key=key)
+    return pooled_groq_client(key)
+
+def admit_turn(session_id: str, http_request: Request):
+    """Admit a turn or answer 503; the event loop must not wait for a slot"""
+    try:
+        return chat_limiter.acquire(
+            session_id in conversations,
+            upstream_queue_seconds(http_request.headers.get("x-request-start")),
+            wait=False
+        )
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def record_turn(request: ChatRequest, stream: bool):
+    """Start recording the shape of a chat turn when TRAFFIC_RECORD_PATH is set (safycore_backend/traffic.py)"""
+    return traffic.start_turn("fastapi", None, request.session_id, request.message, stream,
+                              request.training_data, bool(request.catalog_id))
 
 @app.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, response: Response, http_request: Request):
     """
     Non-streaming chat endpoint - returns complete response at once
     Faster for short responses, better for simple integrations
     """
+    turn = record_turn(request, stream=False)
+    try:
+        reply = await chat_turn(request, response, http_request)
+    except HTTPException as e:
+        if turn is not None:
+            turn.finish(e.status_code)
+        raise
+    if turn is not None:
+        turn.finish(200, reply.response)
+    return reply
+
+async def chat_turn(request: ChatRequest, response: Response, http_request: Request):
+    ticket = admit_turn(request.session_id, http_request)
     try:
         client = get_groq_client(request.api_key)
 
+        training_data = session_training_data(request.training_data, request.catalog_id)
+
         # Initialize or retrieve conversation history
         if request.session_id not in conversations:
             conversations[request.session_id] = []
 
         # Add system prompt with training data if this is first message
-        if len(conversations[request.session_id]) == 0 and request.training_data:
-            conversations[request.session_id].append({
-                "role": "system",
-                "content": get_system_prompt(request.training_data)
-            })
+        if len(conversations[request.session_id]) == 0 and training_data:
+            conversations[request.session_id].append(
+                HistoryMessage(Role.SYSTEM, build_system_prompt(training_data, persona='car_sales'))
+            )
 
         # Add user message to conversation history
-        conversations[request.session_id].append({
-            "role": "user",
-            "content": request.message
-        })
+        conversations[request.session_id].append(HistoryMessage(Role.USER, request.message))
 
-        # Get completion from Groq
-        completion = client.chat.completions.create(
-            model="openai/gpt-oss-120b",
-            messages=conversations[request.session_id],
-            temperature=0.3,
-            max_completion_tokens=100,
-            top_p=0.9,
-            stream=False
-        )
+        messages = to_payload(conversations[request.session_id])
+
+        # Simple lookups on a tabular catalog are answered from its index
+        assistant_message = direct_answer(messages)
+        if assistant_message is None:
+            # Get completion from Groq, off the event loop
+            completion = await run_in_threadpool(
+                create_chat_completion,
+                client,
+                model="openai/gpt-oss-120b",
+                messages=messages,
+                temperature=0.3,
+                max_completion_tokens=MAX_COMPLETION_TOKENS,
+                top_p=0.9,
+                stream=False
+            )
 
-        assistant_message = completion.choices[0].message.content
+            record_usage(completion.usage)
+            assistant_message = completion.choices[0].message.content
 
         # Strip ALL markdown formatting
-        import re
-        assistant_message = re.sub(r'\*\*([^*]+)\*\*', r'\1', assistant_message)  # Remove bold
-        assistant_message = re.sub(r'\*([^*]+)\*', r'\1', assistant_message)      # Remove italic
-        assistant_message = re.sub(r'__([^_]+)__', r'\1', assistant_message)      # Remove bold underscore
-        assistant_message = re.sub(r'_([^_]+)_', r'\1', assistant_message)        # Remove italic underscore
-        assistant_message = re.sub(r'\|.*\|', '', assistant_message)              # Remove table rows
-        assistant_message = re.sub(r'^[-=]+$', '', assistant_message, flags=re.MULTILINE)  # Remove separators
-        assistant_message = re.sub(r'^\s*[-*+]\s+', '', assistant_message, flags=re.MULTILINE)  # Remove bullets
-        assistant_message = re.sub(r'^\s*\d+\.\s+', '', assistant_message, flags=re.MULTILINE)  # Remove numbered lists
-        assistant_message = assistant_message.strip()
+        assistant_message = strip_markdown(assistant_message)
 
         # Add assistant response to conversation history
-        conversations[request.session_id].append({
-            "role": "assistant",
-            "content": assistant_message
-        })
+        conversations[request.session_id].append(HistoryMessage(Role.ASSISTANT, assistant_message))
 
+        # History lives on this node only; point the balancer at the session's node
+        set_route(response, request.session_id)
         return ChatResponse(
             response=assistant_message,
             session_id=request.session_id
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=upstream_error_status(e), detail=str(e))
+    finally:
+        ticket.release()
 
 @app.post("/chat/stream")
-async def chat_stream(request: ChatRequest):
+async def chat_stream(request: ChatRequest, http_request: Request):
     """
     Streaming chat endpoint - returns response token by token
     Better UX for long responses, feels more responsive
     """
+    turn = record_turn(request, stream=True)
+    try:
+        return await stream_turn(request, http_request, turn)
+    except HTTPException as e:
+        if turn is not None:
+            turn.finish(e.status_code)
+        raise
+
+async def stream_turn(request: ChatRequest, http_request: Request, turn=None):
+    ticket = admit_turn(request.session_id, http_request)
     try:
         client = get_groq_client(request.api_key)
 
+        training_data = session_training_data(request.training_data, request.catalog_id)
+
         # Initialize or retrieve conversation history
         if request.session_id not in conversations:
             conversations[request.session_id] = []
 
         # Add system prompt with training data if this is first message
-        if len(conversations[request.session_id]) == 0 and request.training_data:
-            conversations[request.session_id].append({
-                "role": "system",
-                "content": get_system_prompt(request.training_data)
-            })
+        if len(conversations[request.session_id]) == 0 and training_data:
+            conversations[request.session_id].append(
+                HistoryMessage(Role.SYSTEM, build_system_prompt(training_data, persona='car_sales'))
+            )
 
         # Add user message to conversation history
-        conversations[request.session_id].append({
-            "role": "user",
-            "content": request.message
-        })
+        conversations[request.session_id].append(HistoryMessage(Role.USER, request.message))
+
+        # The generator runs after the handler returns, so carry the deadline along
+        deadline = current_deadline()
+
+        messages = to_payload(conversations[request.session_id])
 
         async def generate():
-            import re
+            # Simple lookups on a tabular catalog are answered from its index
+            reply = direct_answer(messages)
+            if reply is not None:
+                yield reply
+                save_reply(request.session_id, reply)
+                return
+
             full_response = ""
-            completion = client.chat.completions.create(
-                model="openai/gpt-oss-120b",
-                messages=conversations[request.session_id],
-                temperature=0.3,
-                max_completion_tokens=100,
-                top_p=0.9,
-                stream=True
-            )
+            chunks = 0
+            # Fewer, word-aligned writes; the first token still goes out at once
+            coalescer = Coalescer()
+            with deadline_scope(deadline):
+                # The worker thread inherits a copy of the deadline scope
+                completion = await run_in_threadpool(
+                    create_chat_completion,
+                    client,
+                    model="openai/gpt-oss-120b",
+                    messages=messages,
+                    temperature=0.3,
+                    max_completion_tokens=MAX_COMPLETION_TOKENS,
+                    top_p=0.9,
+                    stream=True
+                )
+
+            try:
+                # Pull chunks in a worker thread so the event loop notices a disconnect
+                async for chunk in iterate_in_threadpool(completion):
+                    record_usage(usage_from_chunk(chunk))
+                    if not chunk.choices:
+                        continue
+                    content = chunk.choices[0].delta.content or ""
+                    full_response += content
+                    chunks += 1
+                    text = coalescer.add(content) if content else None
+                    if text:
+                        yield text
+                tail = coalescer.flush()
+                if tail:
+                    yield tail
+            except (asyncio.CancelledError, GeneratorExit):
+                # Client went away: stop Groq now and keep what was generated
+                cancel_stream(completion, chunks, MAX_COMPLETION_TOKENS)
+                save_reply(request.session_id, full_response, truncated=True)
+                raise
+
+            save_reply(request.session_id, full_response)
+
+        # The turn keeps its slot until the stream ends or is closed
+        body, ticket = ticket.hold(generate()), None
+        if turn is not None:
+            body = turn.watch(body)
+        return set_route(ClosingStreamingResponse(body, media_type="text/plain"), request.session_id)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=upstream_error_status(e), detail=str(e))
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+def save_reply(session_id: str, full_response: str, truncated: bool = False) -> str:
+    """Strip markdown and append the assistant's reply to the session history"""
+    cleaned_response = strip_markdown(full_response)
+    if cleaned_response or not truncated:
+        conversations[session_id].append(HistoryMessage(Role.ASSISTANT, cleaned_response, truncated))
+    return cleaned_response
+
+def authenticate_socket(frame):
+    """Resolve the Groq client once per WebSocket connection"""
+    try:
+        return get_groq_client(frame.get("api_key"))
+    except HTTPException as e:
+        raise ValueError(e.detail)
+
+def start_socket_turn(client, frame):
+    """Record the user's message and return a generator streaming the reply"""
+    session_id = frame["session_id"]
+    try:
+        training_data = session_training_data(frame.get("training_data"), frame.get("catalog_id"))
+    except HTTPException as e:
+        raise TurnError(e.detail, e.status_code)
+
+    if session_id not in conversations:
+        conversations[session_id] = []
+
+    if len(conversations[session_id]) == 0 and training_data:
+        conversations[session_id].append(HistoryMessage(Role.SYSTEM, build_system_prompt(training_data, persona='car_sales')))
+
+    conversations[session_id].append(HistoryMessage(Role.USER, frame["message"]))
+
+    messages = to_payload(conversations[session_id])
+    reply = direct_answer(messages)
+    if reply is not None:
+        def answer():
+            yield reply
+            return save_reply(session_id, reply)
+
+        return answer()
+
+    with deadline_scope():
+        completion = create_chat_completion(
+            client,
+            model="openai/gpt-oss-120b",
+            messages=messages,
+            temperature=0.3,
+            max_completion_tokens=MAX_COMPLETION_TOKENS,
+            top_p=0.9,
+            stream=True
+        )
 
+    def generate():
+        full_response = ""
+        chunks = 0
+        coalescer = Coalescer()
+        try:
             for chunk in completion:
+                record_usage(usage_from_chunk(chunk))
+                if not chunk.choices:
+                    continue
                 content = chunk.choices[0].delta.content or ""
-                full_response += content
-                yield content
-
-            # Strip ALL markdown formatting from full response
-            cleaned_response = re.sub(r'\*\*([^*]+)\*\*', r'\1', full_response)
-            cleaned_response = re.sub(r'\*([^*]+)\*', r'\1', cleaned_response)
-            cleaned_response = re.sub(r'__([^_]+)__', r'\1', cleaned_response)
-            cleaned_response = re.sub(r'_([^_]+)_', r'\1', cleaned_response)
-            cleaned_response = re.sub(r'\|.*\|', '', cleaned_response)
-            cleaned_response = re.sub(r'^[-=]+$', '', cleaned_response, flags=re.MULTILINE)
-            cleaned_response = re.sub(r'^\s*[-*+]\s+', '', cleaned_response, flags=re.MULTILINE)
-            cleaned_response = re.sub(r'^\s*\d+\.\s+', '', cleaned_response, flags=re.MULTILINE)
-            cleaned_response = cleaned_response.strip()
-
-            # Save cleaned response to conversation history
-            conversations[request.session_id].append({
-                "role": "assistant",
-                "content": cleaned_response
-            })
-
-        return StreamingResponse(generate(), media_type="text/plain")
+                if content:
+                    full_response += content
+                    chunks += 1
+                    text = coalescer.add(content)
+                    if text:
+                        yield text
+            tail = coalescer.flush()
+            if tail:
+                yield tail
+        except GeneratorExit:
+            cancel_stream(completion, chunks, MAX_COMPLETION_TOKENS)
+            save_reply(session_id, full_response, truncated=True)
+            raise
+
+        return save_reply(session_id, full_response)
+
+    return generate()
+
+@app.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    """
+    Multiplexed streaming chat over one connection
+    See safycore_backend/websocket.py for the frame protocol
+    """
+    await websocket.accept()
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async def receive_text():
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return None
+        if message.get("text") is not None:
+            return message["text"]
+        return (message.get("bytes") or b"").decode("utf-8", errors="replace")
+
+    async def close(code):
+        await websocket.close(code)
+
+    await ChatSocket(receive_text, websocket.send_text, authenticate_socket, start_socket_turn, close).run()
 
 @app.get("/conversation/{session_id}")
 async def get_conversation(session_id: str):
     """Get conversation history for a session"""
     if session_id not in conversations:
         return {"messages": []}
-    return {"messages": conversations[session_id]}
+    return {"messages": [message.as_dict() for message in conversations[session_id]]}
 
 @app.delete("/conversation/{session_id}")
 async def clear_conversation(session_id: str):
@@ -205,39 +479,141 @@ async def clear_conversation(session_id: str):
     return {"message": "Conversation cleared"}
 
 @app.post("/train")
-async def set_training_data(session_id: str, training_data: str):
+async def set_training_data(session_id: str, training_data: Optional[str] = None, catalog_id: Optional[str] = None):
     """
     Set or update training data for a session
     This will be prepended as system message
     """
+    training_data = session_training_data(training_data, catalog_id)
+    if not training_data:
+        raise HTTPException(status_code=400, detail="training_data or catalog_id is required")
+
     if session_id not in conversations:
         conversations[session_id] = []
 
     # Update or add system message
-    system_message = {
-        "role": "system",
-        "content": get_system_prompt(training_data)
-    }
+    system_message = HistoryMessage(Role.SYSTEM, build_system_prompt(training_data, persona='car_sales'))
 
-    if len(conversations[session_id]) > 0 and conversations[session_id][0]["role"] == "system":
+    if len(conversations[session_id]) > 0 and conversations[session_id][0].role is Role.SYSTEM:
         conversations[session_id][0] = system_message
     else:
         conversations[session_id].insert(0, system_message)
 
     return {"message": "Training data updated"}
 
+def etag_response(request: Request, content_hash: str, body: dict):
+    """Serve body with a content-hash ETag, or 304 when the client already has it"""
+    etag = f'"{content_hash}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        metrics.incr("catalog.not_modified")
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(body, headers=headers)
+
+@app.post("/catalogs", status_code=201)
+async def upload_catalog(request: CatalogRequest):
+    """
+    Upload a catalog once and reference it from chats by its id
+    The id is the content hash, so re-uploading the same catalog is a no-op
+    Catalogs are kept in this worker's bounded cache; see find_catalog()
+    """
+    if not request.content.strip():
+        raise HTTPException(status_code=400, detail="content is required")
+    if len(request.content.encode("utf-8")) > CATALOG_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Catalogs are limited to {CATALOG_MAX_BYTES} bytes")
+    catalog = catalog_cache.parse(request.content)
+    return {"id": catalog.content_hash, "name": request.name, "size_bytes": len(catalog.text.encode("utf-8"))}
+
+@app.get("/catalogs/{catalog_id}")
+async def get_catalog(catalog_id: str, request: Request):
+    """Get an uploaded catalog's normalized text"""
+    catalog = find_catalog(catalog_id)
+    if catalog is None:
+        raise HTTPException(status_code=404, detail="Catalog not found")
+    return etag_response(request, catalog.content_hash, {"id": catalog.content_hash, "content": catalog.text})
+
 @app.get("/training-data")
-async def get_training_data():
+async def get_training_data(request: Request):
     """
     Serve the training data text file
     This fixes CORS issues when loading from file system
+    The file is re-read only when it changes and is also usable as catalog_id
     """
-    try:
-        with open("training_data.txt", "r", encoding="utf-8") as f:
-            content = f.read()
-        return {"training_data": content}
-    except FileNotFoundError:
+    raw, catalog = training_file.load()
+    if catalog is None:
         return {"training_data": None}
+    return etag_response(request, catalog.content_hash, {"training_data": raw, "catalog_id": catalog.content_hash})
+
+@app.get("/metrics")
+async def get_metrics():
+    """Process-local counters, latencies and circuit breaker states"""
+    data = metrics.snapshot()
+    data["breakers"] = breaker_states()
+    return data
+
+def diagnostics_access(x_diagnostics_token: Optional[str] = Header(None)):
+    """Admin-only endpoints: 404 while DIAGNOSTICS_TOKEN is unset, 403 on a wrong token"""
+    if not diagnostics.DIAGNOSTICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not diagnostics.authorized(x_diagnostics_token):
+        raise HTTPException(status_code=403, detail="Invalid diagnostics token")
+
+@app.get("/diagnostics", dependencies=[Depends(diagnostics_access)])
+async def get_diagnostics(types: str = ""):
+    """Live counts; ?types=Groq,Client also counts instances of those classes"""
+    data = await run_in_threadpool(diagnostics.counts, [name for name in types.split(",") if name])
+    data["groq_clients"] = pooled_groq_client.cache_info().currsize
+    return data
+
+@app.get("/diagnostics/profile", dependencies=[Depends(diagnostics_access)])
+async def get_profile(seconds: float = 10.0, mode: str = "cpu", format: str = "collapsed"):
+    """Sample all threads, the event loop's included, and return collapsed stacks"""
+    if seconds <= 0 or mode not in ("cpu", "wall"):
+        raise HTTPException(status_code=400, detail="seconds must be positive and mode cpu or wall")
+    try:
+        # Sampled from a worker thread so the loop keeps serving while it is profiled
+        result = await run_in_threadpool(diagnostics.profile, seconds, mode)
+    except diagnostics.Busy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "json":
+        return {
+            "samples": result["samples"],
+            "seconds": result["seconds"],
+            "mode": mode,
+            "stacks": [{"stack": stack, "count": count} for stack, count in result["stacks"].most_common()],
+        }
+    return PlainTextResponse(
+        diagnostics.collapsed(result["stacks"]),
+        headers={"Content-Disposition": f'attachment; filename="profile-{mode}.collapsed"'}
+    )
+
+@app.get("/diagnostics/memory", dependencies=[Depends(diagnostics_access)])
+async def get_memory():
+    return diagnostics.memory_status()
+
+@app.post("/diagnostics/memory/start", dependencies=[Depends(diagnostics_access)])
+async def start_memory_tracing(frames: int = 1):
+    return diagnostics.start_tracing(frames)
+
+@app.post("/diagnostics/memory/snapshot", dependencies=[Depends(diagnostics_access)])
+async def take_memory_snapshot(top: int = 20, group_by: str = "lineno"):
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback")
+    try:
+        return await run_in_threadpool(diagnostics.take_snapshot, top, group_by)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/diagnostics/memory/diff", dependencies=[Depends(diagnostics_access)])
+async def diff_memory_snapshots(old: int = Query(alias="from"), new: int = Query(alias="to"), top: int = 20):
+    try:
+        return await run_in_threadpool(diagnostics.diff_snapshots, old, new, top)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown snapshot id")
+
+@app.post("/diagnostics/memory/stop", dependencies=[Depends(diagnostics_access)])
+async def stop_memory_tracing():
+    return diagnostics.stop_tracing()
 
 @app.get("/")
 async def root():
@@ -246,10 +622,15 @@ async def root():
         "endpoints": {
             "POST /chat": "Non-streaming chat",
             "POST /chat/stream": "Streaming chat",
+            "WS /ws": "Multiplexed streaming chat over one WebSocket",
             "GET /conversation/{session_id}": "Get conversation history",
             "DELETE /conversation/{session_id}": "Clear conversation",
             "POST /train": "Set training data",
-            "GET /training-data": "Get training data file"
+            "POST /catalogs": "Upload a catalog once, then chat with catalog_id",
+            "GET /catalogs/{catalog_id}": "Get an uploaded catalog",
+            "GET /training-data": "Get training data file",
+            "GET /metrics": "Upstream latency, breaker state and counters",
+            "GET /diagnostics": "Live counts, profiles and memory snapshots (DIAGNOSTICS_TOKEN)"
         }
     }
 
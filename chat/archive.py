@@ -0,0 +1,207 @@
+"""
+Compaction and archival of old message rows
+Old turns are replaced in Supabase by a single summary row and the raw rows
+are kept compressed in ArchivedMessageBatch so history can still page into them
+"""
+import gzip
+import json
+import time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from safycore_backend.groq_client import create_chat_completion
+from safycore_backend.resilience import execute
+from .models import ArchivedMessageBatch, ConversationSession
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+# Content prefix that marks a compaction summary row in the messages table
+SUMMARY_PREFIX = 'Summary of earlier conversation: '
+
+SUMMARY_PROMPT = (
+    'Summarize the following conversation in at most 5 plain-text sentences. '
+    'Keep names, numbers and facts the assistant may need later.'
+)
+
+
+def is_summary(message: dict) -> bool:
+    """True for summary rows written by compaction"""
+    return message.get('role') == 'system' and message.get('content', '').startswith(SUMMARY_PREFIX)
+
+
+def row_size(row: dict) -> int:
+    """Approximate storage size of a row in bytes"""
+    return len(json.dumps(row, default=str).encode('utf-8'))
+
+
+def pack_messages(rows: list) -> tuple:
+    """
+    Compress rows as JSONL
+
+    Returns:
+        tuple: (codec, payload bytes)
+    """
+    jsonl = ''.join(json.dumps(row, default=str) + '\n' for row in rows).encode('utf-8')
+    if zstandard is not None:
+        return ArchivedMessageBatch.CODEC_ZSTD, zstandard.ZstdCompressor(level=10).compress(jsonl)
+    return ArchivedMessageBatch.CODEC_GZIP, gzip.compress(jsonl, compresslevel=9)
+
+
+def unpack_messages(codec: str, payload: bytes) -> list:
+    """Decompress a JSONL payload written by pack_messages()"""
+    payload = bytes(payload)
+    if codec == ArchivedMessageBatch.CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError('zstandard is required to read zstd archives')
+        jsonl = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        jsonl = gzip.decompress(payload)
+    return [json.loads(line) for line in jsonl.decode('utf-8').splitlines() if line]
+
+
+def iter_archived_messages(user_id: str, session_id: str, before=None, after=None):
+    """
+    Yield archived rows for a session in chronological order
+    Only one batch is decompressed in memory at a time
+
+    Args:
+        user_id: Supabase user id, archives are filtered by owner like RLS does
+        session_id: Conversation session id
+        before: Optional datetime, only rows created before it are returned
+        after: Optional datetime, only rows created after it are returned
+    """
+    batches = ArchivedMessageBatch.objects.filter(user_id=user_id, session_id=session_id)
+    if before is not None:
+        batches = batches.filter(first_created_at__lt=before)
+    if after is not None:
+        batches = batches.filter(last_created_at__gt=after)
+
+    for batch_id in batches.order_by('first_created_at').values_list('id', flat=True):
+        batch = ArchivedMessageBatch.objects.get(id=batch_id)
+        for row in unpack_messages(batch.codec, batch.payload):
+            created_at = parse_datetime(row['created_at'])
+            if before is not None and created_at >= before:
+                continue
+            if after is not None and created_at <= after:
+                continue
+            if not is_summary(row):
+                yield row
+
+
+def archived_messages(user_id: str, session_id: str, before=None, after=None) -> list:
+    """List form of iter_archived_messages()"""
+    return list(iter_archived_messages(user_id, session_id, before=before, after=after))
+
+
+def summarize(rows: list, use_llm: bool = True) -> str:
+    """
+    Summarize old turns for the replacement row
+    Falls back to an extractive summary when the LLM is unavailable
+    """
+    transcript = '\n'.join(
+        f"{row['role']}: {row['content']}" for row in rows if row['role'] != 'system' or is_summary(row)
+    )
+    if use_llm:
+        try:
+            completion = create_chat_completion(
+                messages=[
+                    {'role': 'system', 'content': SUMMARY_PROMPT},
+                    {'role': 'user', 'content': transcript},
+                ],
+                model="openai/gpt-oss-120b",
+                temperature=0.2,
+                max_completion_tokens=200,
+                stream=False
+            )
+            return completion.choices[0].message.content.strip()
+        except Exception:
+            pass
+
+    questions = [row['content'].strip() for row in rows if row['role'] == 'user']
+    return 'The user previously asked: ' + ' | '.join(q[:120] for q in questions[-10:])
+
+
+def time_history_query(supabase, session_id: str) -> float:
+    """Seconds taken by the per-turn history query for a session"""
+    start = time.perf_counter()
+    execute(supabase.table('messages').select('*').eq('session_id', session_id).order('created_at'))
+    return time.perf_counter() - start
+
+
+def compact_session(supabase, session_id: str, keep_last: int = 6, use_llm: bool = True,
+                    dry_run: bool = False) -> dict:
+    """
+    Replace all but the last keep_last turns of a session with a summary row
+
+    The leading system prompt is always kept. Raw rows are archived before
+    they are deleted from Supabase, so a failure never loses messages.
+
+    Args:
+        supabase: Client with access to the session (service role for batch jobs)
+        session_id: Session to compact
+        keep_last: Number of most recent user/assistant rows left untouched
+
+    Returns:
+        dict: Counts and byte sizes describing what was (or would be) compacted
+    """
+    response = execute(supabase.table('messages').select('*').eq(
+        'session_id', session_id
+    ).order('created_at'), read=True)
+    rows = response.data or []
+
+    prompt_rows = []
+    for row in rows:
+        if row['role'] != 'system' or is_summary(row):
+            break
+        prompt_rows.append(row)
+    turns = rows[len(prompt_rows):]
+    old_rows = turns[:-keep_last] if keep_last else turns
+
+    report = {
+        'session_id': session_id,
+        'archived_messages': 0,
+        'raw_bytes': 0,
+        'archive_bytes': 0,
+        'bytes_reclaimed': 0,
+    }
+    if len(old_rows) < 2:
+        return report
+
+    raw_bytes = sum(row_size(row) for row in old_rows)
+    codec, payload = pack_messages(old_rows)
+    summary_row = {
+        'user_id': old_rows[-1]['user_id'],
+        'session_id': session_id,
+        'role': 'system',
+        'content': SUMMARY_PREFIX + summarize(old_rows, use_llm=use_llm and not dry_run),
+        'created_at': old_rows[-1]['created_at'],
+    }
+    report.update({
+        'archived_messages': len(old_rows),
+        'raw_bytes': raw_bytes,
+        'archive_bytes': len(payload),
+        'bytes_reclaimed': raw_bytes - row_size(summary_row),
+    })
+    if dry_run:
+        return report
+
+    ArchivedMessageBatch.objects.create(
+        session_id=session_id,
+        user_id=old_rows[0]['user_id'],
+        first_created_at=parse_datetime(old_rows[0]['created_at']),
+        last_created_at=parse_datetime(old_rows[-1]['created_at']),
+        message_count=len(old_rows),
+        raw_bytes=raw_bytes,
+        codec=codec,
+        payload=payload,
+    )
+    execute(supabase.table('messages').insert(summary_row))
+    execute(supabase.table('messages').delete().in_('id', [row['id'] for row in old_rows]))
+
+    # The history changed shape, so cached history ETags must not match
+    ConversationSession.objects.filter(session_id=session_id).update(updated_at=timezone.now())
+    return report
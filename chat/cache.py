@@ -0,0 +1,136 @@
+"""
+Per-process cache of rendered conversation history and session lists
+Bodies are stored with the ETag they were built for and only served while
+that ETag is current, so any write to a session (which bumps updated_at)
+makes its entries unreachable without explicit invalidation
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Count, Max
+
+from safycore_backend import metrics
+from safycore_backend.conditional import make_etag
+from safycore_backend.resilience import deadline_scope
+from safycore_backend.supabase_client import get_user_supabase_client
+from .history import load_history
+from .models import ConversationSession
+from .turns import expand_catalog_row
+
+# Login warm-ups run here so the login response does not wait for them
+_warm_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-warm')
+
+
+def cached_body(key: str, etag: str, name: str):
+    """Return the cached body for key if it was built for etag, else None"""
+    entry = cache.get(key)
+    if entry is not None and entry[0] == etag:
+        metrics.incr(f'{name}.cache_hits')
+        return entry[1]
+    metrics.incr(f'{name}.cache_misses')
+    return None
+
+
+def store_body(key: str, etag: str, data) -> None:
+    cache.set(key, (etag, data), settings.RESPONSE_CACHE_SECONDS)
+
+
+def history_key(user_profile, session_id, limit, before) -> str:
+    return f'history:{user_profile.pk}:{session_id}:{limit}:{before}'
+
+
+def history_etag(user_profile, session_id, limit=None, before=None):
+    """
+    ETag of a history page, or None if the session is unknown
+    Every write to a session bumps updated_at, so it validates the history
+    without reading it from Supabase
+    """
+    updated_at = ConversationSession.objects.filter(
+        session_id=session_id, user=user_profile
+    ).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return make_etag('history', session_id, updated_at.isoformat(), limit, before)
+
+
+def session_cleared_at(user_profile, session_id):
+    """When the session was last cleared, or None"""
+    return ConversationSession.objects.filter(
+        session_id=session_id, user=user_profile
+    ).values_list('deleted_at', flat=True).first()
+
+
+def history_body(supabase, user_profile, supabase_user_id, session_id, limit=None, before=None,
+                 cleared_at=None) -> dict:
+    """History response body (RLS filters the rows), including compacted turns"""
+    messages, next_before = load_history(
+        supabase, supabase_user_id, session_id, limit=limit, before=before, cleared_at=cleared_at
+    )
+    data = {
+        'session_id': session_id,
+        'messages': [expand_catalog_row(user_profile, message) for message in messages]
+    }
+    if limit is not None:
+        data['next_before'] = next_before
+    return data
+
+
+def sessions_key(user_profile) -> str:
+    return f'sessions:{user_profile.pk}'
+
+
+def sessions_etag(user_profile) -> str:
+    """
+    Creating, updating or deleting a session changes the count or the latest
+    updated_at; a new title or summary changes the latest described_at
+    """
+    summary = ConversationSession.objects.filter(user=user_profile).visible().aggregate(
+        latest=Max('updated_at'), count=Count('id'), described=Max('described_at')
+    )
+    latest = summary['latest'].isoformat() if summary['latest'] else ''
+    described = summary['described'].isoformat() if summary['described'] else ''
+    return make_etag('sessions', user_profile.pk, latest, summary['count'], described)
+
+
+def sessions_body(user_profile) -> dict:
+    return {
+        'sessions': [{
+            'session_id': session.session_id,
+            'title': session.title,
+            'summary': session.summary,
+            'created_at': session.created_at,
+            'updated_at': session.updated_at
+        } for session in ConversationSession.objects.filter(user=user_profile).visible()]
+    }
+
+
+def warm_user(user_profile, supabase_user_id, token) -> None:
+    """
+    Build the session list and the default session's first history page
+    so the first chat screen after login is served from the cache
+    """
+    try:
+        store_body(sessions_key(user_profile), sessions_etag(user_profile), sessions_body(user_profile))
+
+        session_id = user_profile.default_session_id
+        etag = history_etag(user_profile, session_id) if session_id else None
+        if etag is not None:
+            with deadline_scope():
+                data = history_body(
+                    get_user_supabase_client(token), user_profile, supabase_user_id, session_id,
+                    cleared_at=session_cleared_at(user_profile, session_id)
+                )
+            store_body(history_key(user_profile, session_id, None, None), etag, data)
+        metrics.incr('cache.login_warmups')
+    except Exception:
+        metrics.incr('cache.login_warmup_failures')
+    finally:
+        close_old_connections()
+
+
+def warm_user_later(user_profile, supabase_user_id, token) -> None:
+    """Run warm_user() in the background"""
+    _warm_executor.submit(contextvars.copy_context().run, warm_user, user_profile, supabase_user_id, token)
@@ -0,0 +1,446 @@
+"""
+Parsed training-data catalogs, cached by content hash
+A catalog is parsed once per process however many sessions use it; the
+Django catalog API and the FastAPI app both go through catalog_cache
+
+Tabular catalogs (CSV, TSV, pipe tables) also get a columnar index that
+answers simple lookups ("price of the Civic", "cheapest car", "is #2 newer
+than #5") without calling the model; see direct_answer()
+
+This module has no Django imports so app.py can use it too.
+"""
+import csv
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from safycore_backend import diagnostics, metrics
+from .prompts import content_hash, data_blocks, normalize_whitespace
+
+# Parsed catalogs kept per process
+CATALOG_CACHE_SIZE = int(os.getenv('CATALOG_CACHE_SIZE', '64'))
+
+# Answer simple lookups on tabular catalogs directly instead of calling the model
+CATALOG_DIRECT_ANSWERS = os.getenv('CATALOG_DIRECT_ANSWERS', '0') == '1'
+
+# Columns used to name a row, in order of preference
+LABEL_COLUMNS = ('name', 'title', 'model', 'car', 'vehicle', 'product', 'item')
+
+# Question words that refer to a column, keyed by a word of the column header
+ATTRIBUTE_ALIASES = {
+    'price': ('price', 'cost', 'costs', 'how much', 'cheap', 'cheaper', 'cheapest',
+              'expensive', 'pricier', 'priciest'),
+    'mileage': ('mileage', 'miles', 'mile', 'km', 'kilometers', 'kilometres', 'odometer'),
+    'miles': ('mileage', 'miles', 'mile', 'odometer'),
+    'km': ('mileage', 'km', 'kilometers', 'kilometres', 'odometer'),
+    'year': ('year', 'how old', 'older', 'newer', 'oldest', 'newest'),
+    'color': ('color', 'colour'),
+    'colour': ('color', 'colour'),
+}
+
+# Superlatives and comparatives, with the direction they select
+LOWEST = ('cheapest', 'lowest', 'least', 'fewest', 'smallest', 'oldest', 'minimum')
+HIGHEST = ('priciest', 'highest', 'most', 'largest', 'biggest', 'newest', 'latest', 'maximum')
+LOWER = ('cheaper', 'less', 'fewer', 'lower', 'smaller', 'older')
+HIGHER = ('pricier', 'more', 'higher', 'larger', 'bigger', 'newer')
+
+# Questions the index must not guess at
+_UNSUPPORTED = re.compile(r"\b(not|n't|without|except|under|over|below|above|between|average|total|sum|all|list|every)\b")
+
+_TOKEN = re.compile(r"#?\w+")
+_NUMBER = re.compile(r'^[^\d\-]{0,3}(-?[\d,]*\.?\d+)\s*[a-zA-Z%]{0,10}$')
+_STOPWORDS = frozenset(
+    'a an and are at be by car cars do does for from has have how i in is it me of on or '
+    'than that the this to what which with'.split()
+)
+
+# Words that carry no meaning of their own in a lookup question; any other
+# word must name the column, a row or the direction, or the model answers
+_FILLER = _STOPWORDS | frozenset(
+    'about any can could did expensive get give know many me much my one please s show tell '
+    'there us want was we whats who would you your'.split()
+)
+
+
+def _words(text: str) -> list:
+    return _TOKEN.findall(text.lower())
+
+
+def _number(value: str):
+    match = _NUMBER.match(value.strip())
+    if match is None:
+        return None
+    try:
+        return float(match.group(1).replace(',', ''))
+    except ValueError:
+        return None
+
+
+def _split_rows(text: str):
+    """Rows of a delimited table, or None if the text is not tabular"""
+    lines = [line for line in text.split('\n') if line.strip()]
+    if len(lines) < 2:
+        return None
+
+    # Markdown tables: drop the outer pipes and the |---| separator row
+    if lines[0].lstrip().startswith('|'):
+        lines = [line.strip().strip('|') for line in lines if not re.fullmatch(r'[\s|:\-]+', line)]
+
+    best = None
+    for delimiter in (',', '\t', '|', ';'):
+        rows = [[cell.strip() for cell in row] for row in csv.reader(lines, delimiter=delimiter)]
+        width = len(rows[0])
+        if width < 2:
+            continue
+        # Tolerate a few ragged lines (notes, footers) but not a different format
+        consistent = [row for row in rows if len(row) == width]
+        if len(consistent) >= max(2, 0.9 * len(rows)) and (best is None or len(consistent) > len(best)):
+            best = consistent
+    return best
+
+
+class ColumnarIndex:
+    """
+    Column-oriented view of a tabular catalog
+
+    Numeric columns are stored as array('d') (NaN where a cell is not a
+    number) next to the original strings, so superlatives and comparisons
+    scan one flat array and answers quote the catalog's own formatting.
+    """
+
+    def __init__(self, header: list, rows: list):
+        self.header = header
+        self.size = len(rows)
+        self.text_columns = [[row[i] for row in rows] for i in range(len(header))]
+        self.numeric_columns = {}
+        for i in range(len(header)):
+            values = [_number(cell) for cell in self.text_columns[i]]
+            if sum(value is not None for value in values) >= 0.8 * self.size:
+                self.numeric_columns[i] = array('d', (math.nan if v is None else v for v in values))
+
+        self.label_column = self._label_column()
+        self.labels = self.text_columns[self.label_column]
+        self.columns_by_phrase = self._aliases()
+        # One alternation, longest phrase first, finds every column mentioned in a single scan
+        phrases = sorted(self.columns_by_phrase, key=len, reverse=True)
+        self.column_pattern = re.compile(
+            r'(?<![\w#])(' + '|'.join(re.escape(phrase) for phrase in phrases) + r')(?!\w)'
+        ) if phrases else None
+
+        # Row lookup: full labels, and label words that name exactly one row
+        self.max_label_words = 1
+        self.rows_by_phrase = {}
+        owners = {}
+        for row, label in enumerate(self.labels):
+            words = _words(label)
+            if not words:
+                continue
+            self.max_label_words = max(self.max_label_words, len(words))
+            self.rows_by_phrase.setdefault(' '.join(words), row)
+            for word in set(words):
+                if word not in _STOPWORDS and not word.isdigit():
+                    owners.setdefault(word, set()).add(row)
+        for word, rows_with_word in owners.items():
+            if len(rows_with_word) == 1:
+                self.rows_by_phrase.setdefault(word, next(iter(rows_with_word)))
+
+    @classmethod
+    def build(cls, text: str):
+        """Index a catalog, or return None if it is not a table"""
+        rows = _split_rows(text)
+        if rows is None:
+            return None
+        header, rows = rows[0], rows[1:]
+        if any(_number(cell) is not None for cell in header):
+            return None
+        return cls([cell.lower() for cell in header], rows)
+
+    def _label_column(self) -> int:
+        for name in LABEL_COLUMNS:
+            for i, column in enumerate(self.header):
+                if name in _words(column):
+                    return i
+        for i in range(len(self.header)):
+            if i not in self.numeric_columns:
+                return i
+        return 0
+
+    def _aliases(self) -> dict:
+        """Phrases recognized in questions, mapped to their column"""
+        aliases = {}
+        for i, column in enumerate(self.header):
+            if i == self.label_column:
+                continue
+            phrases = {column.replace('_', ' ')}
+            for word in _words(column.replace('_', ' ')):
+                phrases.update(ATTRIBUTE_ALIASES.get(word, (word,)))
+            for phrase in phrases:
+                if phrase:
+                    aliases.setdefault(phrase, i)
+        return aliases
+
+    def find_rows(self, question: str) -> list:
+        """Rows named in the question, in order of mention"""
+        words = _words(question)
+        found = []
+        i = 0
+        while i < len(words):
+            for n in range(min(self.max_label_words, len(words) - i), 0, -1):
+                row = self.rows_by_phrase.get(' '.join(words[i:i + n]))
+                if row is not None:
+                    if row not in found:
+                        found.append(row)
+                    i += n
+                    break
+            else:
+                i += 1
+        return found
+
+    def find_columns(self, question: str) -> list:
+        """Columns referred to in the question, in order of mention"""
+        return [column for column, _ in self._column_mentions(question)]
+
+    def _column_mentions(self, question: str) -> list:
+        """(column, words of the phrases naming it) pairs, in order of mention"""
+        mentions = OrderedDict()
+        if self.column_pattern is not None:
+            for match in self.column_pattern.finditer(question):
+                column = self.columns_by_phrase[match.group(1)]
+                mentions.setdefault(column, set()).update(_words(match.group(1)))
+        return list(mentions.items())
+
+    def _unexplained(self, words, column_words, rows) -> set:
+        """Words of the question that name neither the column, a row nor a direction"""
+        words = set(words) - _FILLER - column_words
+        words.difference_update(LOWEST, HIGHEST, LOWER, HIGHER)
+        for row in rows:
+            words.difference_update(_words(self.labels[row]))
+        return words
+
+    def answer(self, question: str):
+        """Answer a simple lookup, superlative or comparison, or return None"""
+        question = question.lower()
+        if _UNSUPPORTED.search(question):
+            return None
+        mentions = self._column_mentions(question)
+        if len(mentions) != 1:
+            return None
+        column, column_words = mentions[0]
+        rows = self.find_rows(question)
+        words = set(_words(question))
+        # "the corolla discount" mentions price via "how much" but asks for
+        # something the table may not hold; only fully understood questions qualify
+        if self._unexplained(words, column_words, rows):
+            return None
+        name = self.header[column].replace('_', ' ')
+
+        if not rows:
+            direction = self._direction(words, LOWEST, HIGHEST, question)
+            if direction is None or column not in self.numeric_columns:
+                return None
+            values = self.numeric_columns[column]
+            candidates = [i for i in range(self.size) if not math.isnan(values[i])]
+            if not candidates:
+                return None
+            pick = (min if direction < 0 else max)(candidates, key=values.__getitem__)
+            return f"{self.labels[pick]} has the {'lowest' if direction < 0 else 'highest'} {name}: {self.text_columns[column][pick]}."
+
+        if len(rows) == 1:
+            if self._direction(words, LOWEST + LOWER, HIGHEST + HIGHER, question) is not None:
+                return None
+            row = rows[0]
+            value = self.text_columns[column][row]
+            if not value:
+                return None
+            return f"The {name} of {self.labels[row]} is {value}."
+
+        if len(rows) == 2 and column in self.numeric_columns:
+            direction = self._direction(words, LOWER, HIGHER, question)
+            first, second = rows
+            values = self.numeric_columns[column]
+            a, b = values[first], values[second]
+            if direction is None or math.isnan(a) or math.isnan(b):
+                return None
+            facts = (f"{self.labels[first]} has {name} {self.text_columns[column][first]} and "
+                     f"{self.labels[second]} has {self.text_columns[column][second]}")
+            if a == b:
+                return f"They are the same: {facts}."
+            if question.startswith('which'):
+                winner = first if (a < b) == (direction < 0) else second
+                return f"{self.labels[winner]}. {facts}."
+            return f"{'Yes' if (a < b) == (direction < 0) else 'No'}, {facts}."
+
+        return None
+
+    @staticmethod
+    def _direction(words, low, high, question):
+        """-1 or 1 when the question asks for one direction only, else None"""
+        lower = any(word in words for word in low) or 'less expensive' in question
+        higher = any(word in words for word in high) or 'more expensive' in question
+        if 'least expensive' in question:
+            lower, higher = True, False
+        if lower == higher:
+            return None
+        return -1 if lower else 1
+
+
+class ParsedCatalog:
+    """
+    A catalog's normalized text and content hash
+    The hash matches the DATA [hash] label in the system prompt; the
+    columnar index is built on first use
+    """
+    __slots__ = ('content_hash', 'text', '_index', '_indexed')
+
+    def __init__(self, text: str):
+        self.text = normalize_whitespace(text)
+        self.content_hash = content_hash(self.text)
+        self._index = None
+        self._indexed = False
+
+    @property
+    def index(self):
+        """ColumnarIndex of the catalog, or None if it is not tabular"""
+        if not self._indexed:
+            self._index = ColumnarIndex.build(self.text)
+            self._indexed = True
+        return self._index
+
+
+def catalog_hash(text: str) -> str:
+    """Content hash a catalog is stored and cached under"""
+    return content_hash(normalize_whitespace(text))
+
+
+class CatalogCache:
+    """
+    Thread-safe LRU of parsed catalogs keyed by content hash
+
+    Entries never go stale: new content has a new hash, so an edited
+    catalog is simply a miss and the old entry ages out.
+    """
+
+    def __init__(self, max_size: int = CATALOG_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, digest: str, load) -> ParsedCatalog:
+        """
+        Return the parsed catalog for a hash, parsing it on a miss
+
+        Args:
+            digest: Content hash of the catalog
+            load: () -> str, fetches the raw text; only called on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                metrics.incr('catalog.cache_hits')
+                return entry
+
+        metrics.incr('catalog.cache_misses')
+        entry = ParsedCatalog(load())
+        with self._lock:
+            self._entries[digest] = entry
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def peek(self, digest: str):
+        """The parsed catalog for a hash if it is cached, else None"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+            return entry
+
+    def parse(self, text: str) -> ParsedCatalog:
+        """Parse raw text through the cache"""
+        return self.get(catalog_hash(text), lambda: text)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+catalog_cache = CatalogCache()
+diagnostics.register('catalog_cache.entries', catalog_cache.__len__)
+
+
+class FileCatalog:
+    """
+    A catalog read from a file, re-read only when its mtime or size changes
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._catalog = None
+        self._raw = None
+
+    def load(self):
+        """
+        Return (raw text, ParsedCatalog), or (None, None) if the file is missing
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None, None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if stamp == self._stamp:
+                return self._raw, self._catalog
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            raw = f.read()
+        catalog = catalog_cache.parse(raw)
+        metrics.incr('catalog.file_reloads')
+        with self._lock:
+            self._stamp, self._raw, self._catalog = stamp, raw, catalog
+        return raw, catalog
+
+
+def direct_answer(messages, enabled: bool = None):
+    """
+    Answer the last user message from the catalog in the system prompt
+
+    Only sessions with exactly one tabular catalog qualify. Anything the
+    index does not recognize returns None and goes to the model. Hits,
+    misses and lookup latency are recorded per catalog hash.
+
+    Args:
+        messages: Provider payload, system prompt first and the question last
+        enabled: Overrides CATALOG_DIRECT_ANSWERS
+    """
+    if not (CATALOG_DIRECT_ANSWERS if enabled is None else enabled):
+        return None
+    if len(messages) < 2 or messages[0]['role'] != 'system' or messages[-1]['role'] != 'user':
+        return None
+    blocks = data_blocks(messages[0]['content'])
+    if len(blocks) != 1:
+        return None
+
+    digest, text = blocks[0]
+    start = time.perf_counter()
+    index = catalog_cache.get(digest, lambda: text).index
+    if index is None:
+        return None
+    reply = index.answer(messages[-1]['content'])
+    elapsed = time.perf_counter() - start
+
+    outcome = 'direct_hits' if reply is not None else 'direct_misses'
+    metrics.incr(f'catalog.{outcome}')
+    metrics.incr(f'catalog.{digest}.{outcome}')
+    metrics.observe(f'catalog.{digest}.direct_latency', elapsed)
+    hits = metrics.counter(f'catalog.{digest}.direct_hits')
+    metrics.set_gauge(f'catalog.{digest}.direct_hit_ratio',
+                      hits / (hits + metrics.counter(f'catalog.{digest}.direct_misses')))
+    return reply
@@ -0,0 +1,116 @@
+"""
+Session deletion
+Clearing only marks sessions with deleted_at and returns; reads skip the
+messages up to the marker from then on, and one background worker per
+process purges them from Supabase, the compaction archive and the Django
+table in batches. A session written to again after it was cleared keeps
+its new messages and its row.
+
+Purges interrupted by a restart are finished by the purge_sessions command.
+"""
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from safycore_backend import metrics
+from safycore_backend.resilience import deadline_scope, execute
+from .models import ArchivedMessageBatch, ConversationSession, SessionJob
+from .search import unindex_session
+from .turns import hot_history
+
+logger = logging.getLogger(__name__)
+
+# One worker, so bulk deletes reach Supabase one batch at a time
+_purge_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='session-purge')
+
+
+def clear_sessions(supabase, user_profile, session_ids=None, before=None) -> list:
+    """
+    Mark a user's sessions deleted and schedule their purge
+
+    Args:
+        supabase: User-scoped Supabase client, used by the purge
+        session_ids: Sessions to clear, or None for all
+        before: Optional datetime, only sessions last updated before it
+
+    Returns:
+        list: Ids of the sessions cleared; unknown and already cleared ones are left out
+    """
+    sessions = ConversationSession.objects.filter(user=user_profile).visible()
+    if session_ids is not None:
+        sessions = sessions.filter(session_id__in=session_ids)
+    if before is not None:
+        sessions = sessions.filter(updated_at__lt=before)
+    cleared = list(sessions.values_list('session_id', flat=True))
+    if not cleared:
+        return []
+
+    # update() skips auto_now; bumping updated_at invalidates cached bodies and hot histories.
+    # Summaries describe the cleared messages, so they go too
+    now = timezone.now()
+    ConversationSession.objects.filter(user=user_profile, session_id__in=cleared).update(
+        deleted_at=now, updated_at=now,
+        summary=None, title_generated=False, summarized_through=None, described_at=None
+    )
+    SessionJob.objects.filter(session__user=user_profile, session__session_id__in=cleared).delete()
+    for session_id in cleared:
+        # Local and cheap, so search stops finding the messages right away too
+        unindex_session(user_profile.user_id, session_id)
+        hot_history.discard((user_profile.pk, session_id))
+
+    metrics.incr('sessions.cleared', len(cleared))
+    _purge_executor.submit(contextvars.copy_context().run, _purge_quietly, supabase, user_profile, now)
+    return cleared
+
+
+def purge(supabase, user_profile, cleared_at, batch_size: int = None) -> int:
+    """
+    Delete what was cleared at cleared_at
+
+    Messages and training data are deleted up to cleared_at only, so turns
+    sent to a session after it was cleared survive.
+
+    Returns:
+        int: Number of sessions purged
+    """
+    batch_size = batch_size or settings.SESSION_PURGE_BATCH_SIZE
+    session_ids = list(ConversationSession.objects.filter(
+        user=user_profile, deleted_at=cleared_at
+    ).values_list('session_id', flat=True))
+    user_id = user_profile.user_id
+    cutoff = cleared_at.isoformat()
+
+    for start in range(0, len(session_ids), batch_size):
+        batch = session_ids[start:start + batch_size]
+        with deadline_scope():
+            # user_id is redundant under RLS but scopes the admin client used by purge_sessions
+            execute(supabase.table('messages').delete().eq('user_id', user_id).in_(
+                'session_id', batch
+            ).lte('created_at', cutoff))
+            execute(supabase.table('training_data').delete().eq('user_id', user_id).in_(
+                'session_id', batch
+            ).lte('created_at', cutoff))
+        ArchivedMessageBatch.objects.filter(
+            user_id=user_id, session_id__in=batch, last_created_at__lte=cleared_at
+        ).delete()
+
+        sessions = ConversationSession.objects.filter(user=user_profile, session_id__in=batch, deleted_at=cleared_at)
+        sessions.filter(updated_at__gt=cleared_at).update(deleted_at=None)
+        sessions.delete()
+        metrics.incr('sessions.purged', len(batch))
+
+    return len(session_ids)
+
+
+def _purge_quietly(supabase, user_profile, cleared_at):
+    try:
+        purge(supabase, user_profile, cleared_at)
+    except Exception as e:
+        metrics.incr('sessions.purge_failures')
+        logger.warning('Could not purge sessions of %s cleared at %s: %s', user_profile.user_id, cleared_at, e)
+    finally:
+        close_old_connections()
@@ -0,0 +1,110 @@
+"""
+Conversation history reads
+Merges live Supabase rows with rows archived by compaction, so callers see
+one continuous timeline regardless of where the messages are stored
+"""
+import heapq
+from contextlib import nullcontext
+
+from django.utils.dateparse import parse_datetime
+
+from safycore_backend.resilience import deadline_scope, execute
+from .archive import archived_messages, is_summary, iter_archived_messages
+
+
+def _created_at(message: dict):
+    return parse_datetime(message['created_at'])
+
+
+def load_history(supabase, user_id: str, session_id: str, limit: int = None, before: str = None,
+                 cleared_at=None) -> tuple:
+    """
+    Load a session's messages, paging transparently into archived data
+
+    Args:
+        supabase: User-scoped Supabase client (RLS applies)
+        user_id: Supabase user id, used to scope archived rows
+        session_id: Conversation session id
+        limit: Page size; None returns the full history
+        before: created_at cursor, only older messages are returned
+        cleared_at: Optional datetime; the session was cleared then and
+            messages up to it, while waiting to be purged, are skipped
+
+    Returns:
+        tuple: (messages in chronological order, cursor for the next page or None)
+    """
+    query = supabase.table('messages').select('*').eq('session_id', session_id)
+    if cleared_at is not None:
+        query = query.gt('created_at', cleared_at.isoformat())
+
+    if limit is None:
+        rows = execute(query.order('created_at'), read=True).data or []
+        archived = archived_messages(user_id, session_id, after=cleared_at)
+        if not archived:
+            return rows, None
+        live = [row for row in rows if not is_summary(row)]
+        return sorted(archived + live, key=_created_at), None
+
+    if before:
+        query = query.lt('created_at', before)
+    rows = execute(query.order('created_at', desc=True).limit(limit + 1), read=True).data or []
+    live = [row for row in rows if not is_summary(row)]
+
+    # Only decompress archives that can land on this page
+    before_dt = parse_datetime(before) if before else None
+    after_dt = _created_at(live[limit - 1]) if len(live) >= limit else None
+    if cleared_at is not None and (after_dt is None or after_dt < cleared_at):
+        after_dt = cleared_at
+    archived = archived_messages(user_id, session_id, before=before_dt, after=after_dt)
+
+    merged = sorted(live + archived, key=_created_at, reverse=True)
+    page = merged[:limit]
+    has_more = len(merged) > limit or len(rows) > limit
+    next_before = page[-1]['created_at'] if has_more and page else None
+    page.reverse()
+    return page, next_before
+
+
+def _iter_live_messages(supabase, session_id: str, columns: str, page_size: int, cleared_at=None,
+                        deadline=None):
+    """Keyset-paginate a session's Supabase rows on (created_at, id)"""
+    cursor = None
+    while True:
+        query = supabase.table('messages').select(columns).eq('session_id', session_id)
+        if cleared_at is not None:
+            query = query.gt('created_at', cleared_at.isoformat())
+        if cursor is not None:
+            created_at, row_id = cursor['created_at'], cursor['id']
+            query = query.or_(
+                f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{row_id})'
+            )
+        # Only the read is scoped: the generator may resume in another context
+        with deadline_scope(deadline) if deadline is not None else nullcontext():
+            rows = execute(query.order('created_at').order('id').limit(page_size), read=True).data or []
+        for row in rows:
+            if not is_summary(row):
+                yield row
+        if len(rows) < page_size:
+            return
+        cursor = rows[-1]
+
+
+def iter_session_messages(supabase, user_id: str, session_id: str,
+                          columns: str = 'id,role,content,created_at', page_size: int = 500, cleared_at=None,
+                          deadline=None):
+    """
+    Yield every message of a session in chronological order in bounded memory
+
+    Args:
+        supabase: User-scoped Supabase client (RLS applies)
+        user_id: Supabase user id, used to scope archived rows
+        session_id: Conversation session id
+        columns: Projected columns; must include id and created_at
+        page_size: Rows fetched per round-trip
+        cleared_at: As for load_history()
+        deadline: Deadline each page read runs under, for callers that
+            consume the iterator across yields; default is the current one
+    """
+    live = _iter_live_messages(supabase, session_id, columns, page_size, cleared_at, deadline)
+    archived = iter_archived_messages(user_id, session_id, after=cleared_at)
+    return heapq.merge(archived, live, key=_created_at)
@@ -0,0 +1,86 @@
+"""
+Benchmark direct catalog answers against a realistic question mix
+
+Usage:
+    python manage.py bench_catalog_lookup --rows 200 --questions 5000
+    python manage.py bench_catalog_lookup --budget-us 200   # fail if p99 lookup exceeds 200us
+"""
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.catalog import ParsedCatalog
+from chat.management.commands.bench_prompt_cache import make_catalog
+
+# (template, answerable) pairs; {a} and {b} are row numbers
+QUESTIONS = [
+    ('What is the price of #{a}?', True),
+    ('How many miles on #{a}?', True),
+    ('What year is #{a}?', True),
+    ('What color is #{a}?', True),
+    ('What is the cheapest car?', True),
+    ('Which car has the lowest mileage?', True),
+    ('What is the newest car?', True),
+    ('Is #{a} cheaper than #{b}?', True),
+    ('Which is newer, #{a} or #{b}?', True),
+    ('Any red cars?', False),
+    ('Which cars are under 10000?', False),
+    ('Can I test drive #{a} tomorrow?', False),
+    ('Thanks!', False),
+    ('Do you offer financing?', False),
+    ('How much is the discount on #{a}?', False),
+    ('What is the price of #{a} in euros?', False),
+]
+
+
+class Command(BaseCommand):
+    help = 'Measure hit rate and latency of direct catalog answers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200)
+        parser.add_argument('--questions', type=int, default=5000)
+        parser.add_argument('--budget-us', type=float, default=None,
+                            help='Fail if the p99 lookup latency exceeds this many microseconds')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rows = options['rows']
+
+        start = time.perf_counter()
+        catalog = ParsedCatalog(make_catalog(rng, rows))
+        index = catalog.index
+        build_ms = (time.perf_counter() - start) * 1000
+        if index is None:
+            raise CommandError('The generated catalog was not recognized as a table')
+
+        latencies = []
+        hits = expected_hits = false_hits = 0
+        for _ in range(options['questions']):
+            template, answerable = rng.choice(QUESTIONS)
+            a, b = rng.sample(range(rows), 2)
+            question = template.format(a=a, b=b)
+
+            start = time.perf_counter()
+            reply = index.answer(question)
+            latencies.append((time.perf_counter() - start) * 1e6)
+
+            expected_hits += answerable
+            if reply is not None:
+                hits += 1
+                false_hits += not answerable
+
+        latencies.sort()
+        p99 = latencies[int(0.99 * (len(latencies) - 1))]
+        total = options['questions']
+        self.stdout.write(f"{rows} rows indexed in {build_ms:.1f}ms, {total} questions")
+        self.stdout.write(f"  direct answers {hits / total:6.1%} (answerable {expected_hits / total:6.1%}, "
+                          f"answered when it should not {false_hits})")
+        self.stdout.write(f"  lookup latency p50 {statistics.median(latencies):.1f}us  p99 {p99:.1f}us")
+
+        if false_hits:
+            raise CommandError(f'{false_hits} questions were answered that should have gone to the model')
+        if options['budget_us'] is not None and p99 > options['budget_us']:
+            raise CommandError(f"p99 lookup latency {p99:.1f}us exceeds the {options['budget_us']}us budget")
@@ -0,0 +1,83 @@
+"""
+Benchmark JSON rendering and parsing of large conversation histories
+
+Usage:
+    python manage.py bench_json --messages 10000 --repeat 20
+"""
+import datetime
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from safycore_backend import fastjson
+from safycore_backend.renderers import ORJSONParser, ORJSONRenderer
+
+
+def make_history(count):
+    """History payload shaped like ConversationHistoryView's response"""
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    session_id = uuid.uuid4()
+    messages = []
+    for i in range(count):
+        messages.append({
+            'id': i + 1,
+            'session_id': session_id,
+            'user_id': uuid.UUID(int=i % 50),
+            'role': 'user' if i % 2 == 0 else 'assistant',
+            'content': f'Message {i}: is the Toyota Corolla #{i % 200} still available in red? ' * 2,
+            'created_at': start + datetime.timedelta(seconds=i * 7, microseconds=i),
+        })
+    return {'session_id': session_id, 'messages': messages, 'count': count, 'next_before': None}
+
+
+class _Stream:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, *args):
+        data, self.data = self.data, b''
+        return data
+
+
+def time_it(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+class Command(BaseCommand):
+    help = 'Compare the stock DRF JSON renderer/parser with the orjson-backed ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if not fastjson.HAS_ORJSON:
+            self.stdout.write(self.style.WARNING('orjson is not installed, both columns use the stdlib encoder'))
+
+        history = make_history(options['messages'])
+        repeat = options['repeat']
+        stock_renderer, fast_renderer = JSONRenderer(), ORJSONRenderer()
+
+        stock_body = stock_renderer.render(history)
+        fast_body = fast_renderer.render(history)
+        stock_render = time_it(lambda: stock_renderer.render(history), repeat)
+        fast_render = time_it(lambda: fast_renderer.render(history), repeat)
+
+        context = {'encoding': 'utf-8'}
+        stock_parse = time_it(lambda: JSONParser().parse(_Stream(stock_body), parser_context=context), repeat)
+        fast_parse = time_it(lambda: ORJSONParser().parse(_Stream(fast_body), parser_context=context), repeat)
+
+        self.stdout.write(f"{options['messages']} messages, median of {repeat} runs")
+        self.stdout.write(f"  {'':8} {'stock':>10} {'orjson':>10} {'speedup':>8}")
+        self.stdout.write(f"  {'render':8} {stock_render:8.1f}ms {fast_render:8.1f}ms {stock_render / fast_render:7.1f}x")
+        self.stdout.write(f"  {'parse':8} {stock_parse:8.1f}ms {fast_parse:8.1f}ms {stock_parse / fast_parse:7.1f}x")
+        self.stdout.write(f"  {'bytes':8} {len(stock_body):10} {len(fast_body):10}")
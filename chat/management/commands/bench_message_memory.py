@@ -0,0 +1,106 @@
+"""
+Measure memory retained per message by the in-process history representations
+
+Usage:
+    python manage.py bench_message_memory --sessions 100000 --messages 6
+"""
+import gc
+import json
+import random
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+
+from chat.messages import MESSAGE_COLUMNS, Message, to_payload
+
+WORDS = ('the', 'car', 'price', 'is', 'mileage', 'red', 'civic', 'thanks', 'how', 'much', 'year', 'available')
+
+
+def make_page(rng, session_id, user_id, count):
+    """PostgREST response body of a session's select('*'), as JSON text"""
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(count):
+        rows.append({
+            'id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'user_id': user_id,
+            'session_id': session_id,
+            'role': 'user' if i % 2 else 'assistant',
+            'content': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 16))),
+            'truncated': False,
+            'created_at': (start + timedelta(seconds=i)).isoformat(),
+        })
+    return json.dumps(rows)
+
+
+def project(page):
+    """The same page as select(MESSAGE_COLUMNS) returns it"""
+    columns = MESSAGE_COLUMNS.split(',')
+    return json.dumps([{column: row[column] for column in columns} for row in json.loads(page)])
+
+
+def project_payload(rows):
+    """Provider payload built from message dicts, as before Message objects"""
+    return [{'role': row['role'], 'content': row['content']} for row in rows]
+
+
+def measure(build, pages):
+    """Bytes retained by build() over all pages, and the retained structure"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    retained = {session_id: build(page) for session_id, page in pages}
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, retained
+
+
+class Command(BaseCommand):
+    help = 'Compare bytes per retained message of row dicts, role/content dicts and compact messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=100000)
+        parser.add_argument('--messages', type=int, default=6, help='Messages per session')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        sessions, per_session = options['sessions'], options['messages']
+        user_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(max(1, sessions // 10))]
+        pages = [(f'session-{i}', make_page(rng, f'session-{i}', rng.choice(user_ids), per_session))
+                 for i in range(sessions)]
+        projected = [(session_id, project(page)) for session_id, page in pages]
+        total = sessions * per_session
+        content_bytes = sum(len(row['content']) for _, page in pages[:1000] for row in json.loads(page))
+        content_bytes /= min(1000, sessions) * per_session
+
+        representations = [
+            ("select('*') row dicts", lambda page: json.loads(page), pages),
+            ('role/content dicts', lambda page: [
+                {'role': row['role'], 'content': row['content']} for row in json.loads(page)
+            ], pages),
+            ('compact Message', lambda page: [Message.from_row(row) for row in json.loads(page)], projected),
+        ]
+
+        self.stdout.write(f'{sessions} live sessions x {per_session} messages, '
+                          f'average content {content_bytes:.0f} chars')
+        retained = {}
+        for name, build, source in representations:
+            used, retained[name] = measure(build, source)
+            self.stdout.write(f'  {name:22} {used / total:7.1f} bytes/message  {used / 2 ** 20:8.1f} MiB')
+            if name != 'compact Message':
+                retained.pop(name)
+
+        # Payload for one turn of a 20-message history
+        history = [m for messages in list(retained['compact Message'].values())[:4] for m in messages][:20]
+        dicts = [m.payload() for m in history]
+        for name, build, value in (('dict projection', project_payload, dicts),
+                                   ('to_payload(Message)', to_payload, history)):
+            start = time.perf_counter()
+            for _ in range(10000):
+                build(value)
+            self.stdout.write(f'  {name:22} {(time.perf_counter() - start) / 10000 * 1e6:7.2f}us per turn payload')
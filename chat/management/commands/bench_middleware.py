@@ -0,0 +1,94 @@
+"""
+Benchmark per-request overhead of the full and lean middleware profiles
+
+Requests are dispatched in-process through a WSGIHandler built for each
+profile, so the numbers isolate middleware and authentication cost from
+the network and the upstream services.
+
+Usage:
+    python manage.py bench_middleware --requests 2000
+    python manage.py bench_middleware --session-cookie   # browser-style clients
+"""
+import logging
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+PATHS = {
+    'metrics': '/api/metrics/',
+    'drf_unauthenticated': '/api/chat/sessions/',
+    'admin_login': '/admin/login/',
+}
+
+AUTHENTICATION_CLASSES = {
+    'full': ['users.authentication.SupabaseAuthentication',
+             'rest_framework.authentication.SessionAuthentication'],
+    'lean': ['users.authentication.SupabaseAuthentication'],
+}
+
+
+@contextmanager
+def profile(name):
+    """Install a middleware profile and its DRF authentication chain"""
+    rest_framework = dict(settings.REST_FRAMEWORK, DEFAULT_AUTHENTICATION_CLASSES=AUTHENTICATION_CLASSES[name])
+    original = APIView.authentication_classes
+    with override_settings(MIDDLEWARE=settings.MIDDLEWARE_PROFILES[name], REST_FRAMEWORK=rest_framework):
+        # APIView reads the authentication classes once, at import time
+        APIView.authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        try:
+            yield WSGIHandler()
+        finally:
+            APIView.authentication_classes = original
+
+
+def start_response(status, headers, exc_info=None):
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Compare request overhead of the full and lean API middleware profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--session-cookie', action='store_true',
+                            help='Send a sessionid cookie, as browsers that visited the admin do')
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        extra = {'HTTP_COOKIE': f'{settings.SESSION_COOKIE_NAME}=bench0000000000000000000000000000'} \
+            if options['session_cookie'] else {}
+        count = options['requests']
+        # 4xx responses are expected here, don't log thousands of them
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        self.stdout.write(f'{count} requests per path, median per-request latency')
+        for path_name, path in PATHS.items():
+            results = {}
+            for name in ('full', 'lean'):
+                with profile(name) as handler:
+                    environs = [factory.get(path, **extra).environ for _ in range(count + 1)]
+                    status_code = handler(environs[0], start_response).status_code
+                    timings = []
+                    with CaptureQueriesContext(connection) as queries:
+                        for environ in environs[1:]:
+                            start = time.perf_counter()
+                            handler(environ, start_response)
+                            timings.append(time.perf_counter() - start)
+                results[name] = (statistics.median(timings) * 1e6, len(queries) / count, status_code)
+
+            full_us, full_queries, full_status = results['full']
+            lean_us, lean_queries, lean_status = results['lean']
+            self.stdout.write(
+                f'  {path_name:20} full {full_us:7.1f}us ({full_queries:.1f} queries, {full_status})  '
+                f'lean {lean_us:7.1f}us ({lean_queries:.1f} queries, {lean_status})  '
+                f'saved {full_us - lean_us:6.1f}us'
+            )
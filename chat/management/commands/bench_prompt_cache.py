@@ -0,0 +1,207 @@
+"""
+Benchmark prompt-prefix reuse of the canonical prompt layout
+
+Usage:
+    python manage.py bench_prompt_cache --sessions 2000 --turns 6
+    python manage.py bench_prompt_cache --live 20   # also measure against Groq
+"""
+import hashlib
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.messages import Message, to_payload
+from chat.prompts import build_system_prompt
+
+
+def legacy_django_prompt(training_data):
+    """System prompt as chat/views.py built it before the canonical assembler"""
+    if training_data:
+        return f"""You are a helpful assistant. Use the following information to answer questions:
+
+{training_data}
+
+Rules:
+1. ONLY answer using the provided information
+2. Use plain text, NO markdown formatting
+3. Keep responses to 1-2 sentences maximum
+4. Be conversational and helpful"""
+    return "You are a helpful assistant. Provide concise, plain text responses without markdown formatting."
+
+
+def legacy_app_prompt(training_data):
+    """System prompt as app.py built it before the canonical assembler"""
+    base_prompt = """You are a car sales assistant. CRITICAL RULES:
+1. ONLY answer questions using the car data provided below
+2. If asked about something NOT in the data, say "I only have information about the cars listed"
+3. Answer in plain text, NO markdown, NO tables, NO bullets, NO formatting (no **, *, _, |)
+4. Keep answers SHORT (1-2 sentences max)
+5. Be conversational and helpful"""
+    if training_data:
+        return f"{base_prompt}\n\nCAR DATA:\n{training_data}"
+    return base_prompt
+
+
+def make_catalog(rng, rows):
+    makes = ['Toyota Corolla', 'Honda Civic', 'Ford Focus', 'Mazda 3', 'Kia Rio', 'VW Golf', 'BMW 320i']
+    lines = ['name,year,price,mileage,color']
+    for i in range(rows):
+        lines.append(
+            f"{rng.choice(makes)} #{i},{rng.randint(2010, 2024)},{rng.randint(5, 60) * 500},"
+            f"{rng.randint(1, 200) * 1000},{rng.choice(['red', 'blue', 'black', 'white'])}"
+        )
+    return '\n'.join(lines)
+
+
+def client_variant(rng, text):
+    """Whitespace noise different clients add to the same catalog"""
+    variant = rng.random()
+    if variant < 0.2:
+        return text.replace('\n', '\r\n')
+    if variant < 0.35:
+        return '\n'.join(line + ' ' for line in text.split('\n'))
+    if variant < 0.45:
+        return text + '\n\n'
+    return text
+
+
+class PrefixCache:
+    """
+    Simulated provider prompt cache: prefixes are cached at fixed block
+    boundaries and a request reuses the longest cached prefix
+    """
+
+    def __init__(self, block_bytes, min_bytes):
+        self.block_bytes = block_bytes
+        self.min_bytes = min_bytes
+        self.blocks = set()
+
+    def request(self, payload: bytes) -> int:
+        cached = 0
+        boundaries = range(self.block_bytes, len(payload) + 1, self.block_bytes)
+        digests = []
+        hasher = hashlib.sha1()
+        previous = 0
+        for boundary in boundaries:
+            hasher.update(payload[previous:boundary])
+            previous = boundary
+            digests.append(hasher.copy().digest())
+        for boundary, digest in zip(boundaries, digests):
+            if digest not in self.blocks:
+                break
+            cached = boundary
+        self.blocks.update(digests)
+        return cached if cached >= self.min_bytes else 0
+
+
+class Command(BaseCommand):
+    help = 'Compare provider prompt-cache prefix hit rate of the legacy and canonical prompt layouts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=2000)
+        parser.add_argument('--turns', type=int, default=6)
+        parser.add_argument('--catalogs', type=int, default=5)
+        parser.add_argument('--catalog-rows', type=int, default=200)
+        parser.add_argument('--block-bytes', type=int, default=512,
+                            help='Cache granularity (about 128 tokens)')
+        parser.add_argument('--min-bytes', type=int, default=4096,
+                            help='Shortest cacheable prefix (about 1024 tokens)')
+        parser.add_argument('--prefill-tokens-per-sec', type=float, default=20000,
+                            help='Used to estimate prefill time saved by cached tokens')
+        parser.add_argument('--live', type=int, default=0,
+                            help='Also send this many requests per layout to Groq and measure latency')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        catalogs = [make_catalog(rng, options['catalog_rows']) for _ in range(options['catalogs'])]
+        questions = ['What is the cheapest car?', 'How many miles on #3?', 'Any red cars?',
+                     'What year is #10?', 'Is #2 cheaper than #5?', 'Thanks!']
+
+        sessions = []
+        for _ in range(options['sessions']):
+            catalog = catalogs[min(int(rng.expovariate(0.7)), len(catalogs) - 1)]
+            sessions.append({
+                'service': rng.choice(['django', 'fastapi']),
+                'training_data': client_variant(rng, catalog),
+                'questions': [rng.choice(questions) for _ in range(options['turns'])],
+            })
+
+        results = {}
+        for layout in ('legacy', 'canonical'):
+            cache = PrefixCache(options['block_bytes'], options['min_bytes'])
+            total_bytes = cached_bytes = first_bytes = first_cached = 0
+            # The canonical layout goes through the production payload path
+            message = (lambda role, content: {'role': role, 'content': content}) if layout == 'legacy' else Message
+            for session in sessions:
+                if layout == 'legacy':
+                    legacy = legacy_django_prompt if session['service'] == 'django' else legacy_app_prompt
+                    history = [message('system', legacy(session['training_data']))]
+                else:
+                    persona = 'assistant' if session['service'] == 'django' else 'car_sales'
+                    history = [message('system', build_system_prompt(session['training_data'], persona))]
+                for turn, question in enumerate(session['questions']):
+                    history.append(message('user', question))
+                    messages = history if layout == 'legacy' else to_payload(history)
+                    payload = json.dumps(messages).encode('utf-8')
+                    hit = cache.request(payload)
+                    total_bytes += len(payload)
+                    cached_bytes += hit
+                    if turn == 0:
+                        first_bytes += len(payload)
+                        first_cached += hit
+                    history.append(message('assistant', f'Answer {turn}.'))
+            results[layout] = (total_bytes, cached_bytes, first_bytes, first_cached)
+
+        tokens_per_sec = options['prefill_tokens_per_sec']
+        requests = options['sessions'] * options['turns']
+        self.stdout.write(f"{options['sessions']} sessions x {options['turns']} turns, "
+                          f"{options['catalogs']} catalogs, block {options['block_bytes']}B")
+        for layout, (total_bytes, cached_bytes, first_bytes, first_cached) in results.items():
+            uncached_tokens = (total_bytes - cached_bytes) / 4
+            self.stdout.write(
+                f"  {layout:9} prefix hit rate {cached_bytes / total_bytes:6.1%}  "
+                f"first turn {first_cached / first_bytes:6.1%}  "
+                f"est. prefill per request {uncached_tokens / requests / tokens_per_sec * 1000:6.2f}ms"
+            )
+
+        if options['live']:
+            self.live(rng, catalogs, questions, options['live'])
+
+    def live(self, rng, catalogs, questions, count):
+        from safycore_backend.groq_client import create_chat_completion
+
+        for layout in ('legacy', 'canonical'):
+            latencies, cached, prompt = [], 0, 0
+            for _ in range(count):
+                training_data = client_variant(rng, catalogs[0])
+                if layout == 'legacy':
+                    system = legacy_django_prompt(training_data)
+                    messages = [{'role': 'system', 'content': system},
+                                {'role': 'user', 'content': rng.choice(questions)}]
+                else:
+                    messages = to_payload([
+                        Message('system', build_system_prompt(training_data)),
+                        Message('user', rng.choice(questions)),
+                    ])
+                start = time.perf_counter()
+                completion = create_chat_completion(
+                    messages=messages,
+                    model="openai/gpt-oss-120b",
+                    temperature=0.3,
+                    max_completion_tokens=100,
+                    top_p=0.9,
+                    stream=False
+                )
+                latencies.append(time.perf_counter() - start)
+                usage = completion.usage
+                details = getattr(usage, 'prompt_tokens_details', None)
+                cached += (getattr(details, 'cached_tokens', 0) or 0) if details else 0
+                prompt += usage.prompt_tokens
+            self.stdout.write(
+                f"  live {layout:9} median latency {statistics.median(latencies) * 1000:7.1f}ms  "
+                f"cached tokens {cached}/{prompt}"
+            )
@@ -0,0 +1,139 @@
+"""
+Benchmark conversation search latency at millions of messages
+
+Builds a throwaway SQLite FTS5 index with the schema, owner tokens and
+queries of chat.search (never the app database), filled with synthetic
+messages from many users whose sizes follow a long tail, then times
+searches of a few users, snippets included: frequent, rare and prefix
+terms, and multi-term queries. Building two million messages takes a few
+minutes.
+
+Usage:
+    python manage.py bench_search --messages 2000000 --users 5000
+    python manage.py bench_search --messages 200000 --budget-ms 50   # exit non-zero if p99 is over budget
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.search import (
+    INDEX_DDL, INSERT_ROW_SQL, INSERT_TERMS_SQL, SEARCH_SQL, SEARCH_TABLE,
+    highlight, match_expression, owner_terms, owner_token,
+)
+
+# Rank-ordered so the first words are frequent and the last ones rare
+VOCABULARY = (
+    'the a is price car for with and in of to my what how much does cost year model '
+    'mileage engine fuel insurance loan payment dealer trade value used new sedan suv '
+    'truck hybrid electric battery warranty service repair brake tire transmission '
+    'toyota honda ford bmw audi tesla nissan kia hyundai mazda subaru volkswagen lexus '
+    'corolla civic camry accord mustang model3 outback tucson sportage golf rav4 crv '
+    'leasing depreciation registration inspection turbocharger catalytic alternator'
+).split()
+
+QUERIES = [
+    ('frequent', 'price'),
+    ('rare', 'alternator'),
+    ('prefix', 'insur'),
+    ('two terms', 'honda civic'),
+    ('three terms', 'used toyota warranty'),
+]
+
+
+def make_message(rng, weights) -> str:
+    return ' '.join(rng.choices(VOCABULARY, weights, k=rng.randint(6, 40)))
+
+
+class Command(BaseCommand):
+    help = 'Measure search latency over a synthetic index of millions of messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2_000_000)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--queries', type=int, default=200, help='Timed searches per query kind')
+        parser.add_argument('--limit', type=int, default=20, help='Results per page')
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--budget-ms', type=float, help='Fail when any query kind has a p99 above this')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with tempfile.TemporaryDirectory() as directory:
+            db = sqlite3.connect(os.path.join(directory, 'search.sqlite3'), isolation_level=None)
+            try:
+                users = self.build(db, rng, options)
+                worst = self.measure(db, rng, users, options)
+            finally:
+                db.close()
+
+        if options['budget_ms'] is not None and worst * 1000 > options['budget_ms']:
+            raise CommandError(f"p99 {worst * 1000:.1f}ms is over the {options['budget_ms']:.0f}ms budget")
+
+    def build(self, db, rng, options) -> list:
+        """Fill the index; returns (user_id, message count) sorted by size"""
+        db.execute('PRAGMA journal_mode = OFF')
+        db.execute('PRAGMA synchronous = OFF')
+        for statement in INDEX_DDL:
+            db.execute(statement)
+        weights = [1 / rank for rank in range(1, len(VOCABULARY) + 1)]
+        # Pareto-distributed history sizes: most users have a few sessions, some thousands of messages
+        sizes = [rng.paretovariate(1.2) for _ in range(options['users'])]
+        scale = options['messages'] / sum(sizes)
+        users = [(f'{rng.getrandbits(64):016x}-user', max(1, int(size * scale))) for size in sizes]
+
+        started = time.perf_counter()
+        insert_row, insert_terms = INSERT_ROW_SQL.replace('%s', '?'), INSERT_TERMS_SQL.replace('%s', '?')
+        total = 0
+        db.execute('BEGIN')
+        for user_id, count in users:
+            owner = owner_token(user_id)
+            for i in range(count):
+                content = make_message(rng, weights)
+                row_id = db.execute(insert_row, (
+                    owner, f'session-{i // 20}', 'user' if i % 2 == 0 else 'assistant',
+                    content, '2026-01-01T00:00:00+00:00'
+                )).lastrowid
+                db.execute(insert_terms, (row_id, owner, owner_terms(owner, content)))
+            total += count
+        db.execute('COMMIT')
+        db.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+        size = os.path.getsize(db.execute('PRAGMA database_list').fetchone()[2])
+        self.stdout.write(
+            f'Indexed {total:,} messages of {len(users):,} users in {time.perf_counter() - started:.0f}s '
+            f'({size / 2 ** 20:.0f} MiB)'
+        )
+        return sorted(users, key=lambda user: user[1])
+
+    def measure(self, db, rng, users, options) -> float:
+        """Print latency per user size and query kind; returns the worst p99 in seconds"""
+        sql = SEARCH_SQL.replace('%s', '?')
+        cohorts = [
+            ('median user', users[len(users) // 2]),
+            ('p99 user', users[int(len(users) * 0.99)]),
+            ('largest user', users[-1]),
+        ]
+        worst = 0.0
+        for cohort, (user_id, count) in cohorts:
+            self.stdout.write(f'  {cohort} ({count:,} messages)')
+            for kind, query in QUERIES:
+                expression = match_expression(user_id, query)
+                timings, found = [], 0
+                for _ in range(options['queries']):
+                    # Mostly first pages, some deeper ones
+                    offset = options['limit'] * rng.choice((0, 0, 0, 1, 4))
+                    start = time.perf_counter()
+                    rows = db.execute(sql, (expression, options['limit'] + 1, offset)).fetchall()
+                    [highlight(content, query) for content, *_ in rows]
+                    timings.append(time.perf_counter() - start)
+                    found = max(found, len(rows))
+                timings.sort()
+                p99 = timings[int(len(timings) * 0.99)]
+                worst = max(worst, p99)
+                self.stdout.write(
+                    f'    {kind:12} {query!r:24} p50 {timings[len(timings) // 2] * 1000:7.2f}ms  '
+                    f'p99 {p99 * 1000:7.2f}ms  rows {found}'
+                )
+        return worst
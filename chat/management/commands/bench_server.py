@@ -0,0 +1,243 @@
+"""
+Load-benchmark the gunicorn server profile at several worker counts
+
+Starts gunicorn with gunicorn.conf.py for each worker count and drives it
+over HTTP with two kinds of clients at once: stream clients that hold a
+simulated chat stream open (chunks paced like a Groq generation) and short
+clients that loop on /api/metrics/. The short-request latency shows whether
+in-flight streams starve everyone else, which is what happens when each
+stream pins a sync worker.
+
+The stream is simulated by a wrapper around the real application
+(the wsgi_application() / asgi_application() factories), so no credentials or
+upstream services are needed.
+
+Usage:
+    python manage.py bench_server --workers 1,2,4
+    python manage.py bench_server --worker-class sync --workers 2,4,8 --streams 8
+    python manage.py bench_server --workers 2 --no-preload   # compare worker memory
+"""
+import asyncio
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+STREAM_PATH = '/bench/stream/'
+SHORT_PATH = settings.API_PATH_PREFIX + 'metrics/'
+
+# Pacing of the simulated stream, read by the server processes
+STREAM_CHUNKS = int(os.getenv('BENCH_STREAM_CHUNKS', '40'))
+STREAM_INTERVAL = float(os.getenv('BENCH_STREAM_INTERVAL', '0.05'))
+
+
+def _stream_chunks():
+    for i in range(STREAM_CHUNKS):
+        yield f'data: {{"chunk": {i}}}\n\n'.encode()
+
+
+def wsgi_application():
+    """Gunicorn app factory: the Django WSGI application plus a paced stream at STREAM_PATH"""
+    from safycore_backend.wsgi import application
+
+    def bench_application(environ, start_response):
+        if environ['PATH_INFO'] != STREAM_PATH:
+            return application(environ, start_response)
+
+        def body():
+            for chunk in _stream_chunks():
+                time.sleep(STREAM_INTERVAL)
+                yield chunk
+
+        start_response('200 OK', [('Content-Type', 'text/event-stream')])
+        return body()
+
+    return bench_application
+
+
+def asgi_application():
+    """Gunicorn app factory: the project ASGI application plus a paced stream at STREAM_PATH"""
+    from safycore_backend.asgi import application
+
+    async def bench_application(scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != STREAM_PATH:
+            return await application(scope, receive, send)
+
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream')]})
+        for chunk in _stream_chunks():
+            await asyncio.sleep(STREAM_INTERVAL)
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    return bench_application
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def worker_memory_kb(master_pid: int) -> tuple:
+    """(workers, summed RSS, summed PSS) of the master's children; PSS counts shared pages once"""
+    rss = pss = count = 0
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                if int(f.read().rsplit(')', 1)[1].split()[1]) != master_pid:
+                    continue
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                for line in f:
+                    if line.startswith('Rss:'):
+                        rss += int(line.split()[1])
+                    elif line.startswith('Pss:'):
+                        pss += int(line.split()[1])
+            count += 1
+        except (OSError, IndexError, ValueError):
+            continue
+    return count, rss, pss
+
+
+class Server:
+    """
+    A gunicorn subprocess configured by gunicorn.conf.py
+
+    Args:
+        app: Gunicorn app spec, default this module's factory for the worker class
+        ready_path: Path that answers 200 once the server is up
+        env: Extra environment for the server
+    """
+
+    def __init__(self, worker_class: str, workers: int, preload: bool, app: str = None,
+                 ready_path: str = SHORT_PATH, env: dict = None):
+        self.port = free_port()
+        self.ready_path = ready_path
+        if app is None:
+            factory = 'asgi_application' if worker_class == 'uvicorn' else 'wsgi_application'
+            app = f'chat.management.commands.bench_server:{factory}()'
+        env = dict(
+            os.environ,
+            **(env or {}),
+            GUNICORN_WORKER_CLASS=worker_class,
+            WEB_CONCURRENCY=str(workers),
+            GUNICORN_BIND=f'127.0.0.1:{self.port}',
+            GUNICORN_PRELOAD='1' if preload else '0',
+            GUNICORN_ACCESS_LOG='',
+        )
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', str(settings.BASE_DIR / 'gunicorn.conf.py'),
+             app],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+
+    def wait_ready(self, timeout: float = 60.0) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f'gunicorn exited: {self.process.stderr.read().decode()[-2000:]}')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=2)
+                connection.request('GET', self.ready_path)
+                if connection.getresponse().status == 200:
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError('gunicorn did not become ready')
+
+    def stop(self) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def run_clients(port: int, path: str, clients: int, stop: threading.Event, results: list, stream: bool):
+    """Loop requests on keep-alive connections until stop is set"""
+    def client():
+        connection = None
+        while not stop.is_set():
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                start = time.perf_counter()
+                connection.request('GET', path)
+                response = connection.getresponse()
+                if stream:
+                    response.read(1)
+                    first = time.perf_counter() - start
+                response.read()
+                elapsed = time.perf_counter() - start
+                results.append((response.status, first if stream else elapsed, elapsed))
+            except (OSError, http.client.HTTPException):
+                results.append((0, 0.0, 0.0))
+                connection = None
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Load-benchmark gunicorn.conf.py with concurrent streams and short requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,2,4', help='Comma-separated worker counts')
+        parser.add_argument('--worker-class', default='gthread', choices=('sync', 'gthread', 'uvicorn'))
+        parser.add_argument('--streams', type=int, default=16, help='Concurrent stream clients')
+        parser.add_argument('--clients', type=int, default=8, help='Concurrent short-request clients')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per run')
+        parser.add_argument('--no-preload', action='store_true')
+
+    def handle(self, *args, **options):
+        worker_counts = [int(count) for count in options['workers'].split(',')]
+        worker_class = options['worker_class']
+        stream_seconds = STREAM_CHUNKS * STREAM_INTERVAL
+
+        self.stdout.write(
+            f"{worker_class} workers, {options['streams']} streams of {stream_seconds:.1f}s and "
+            f"{options['clients']} short clients for {options['duration']:.0f}s"
+        )
+        for workers in worker_counts:
+            server = Server(worker_class, workers, preload=not options['no_preload'])
+            try:
+                server.wait_ready()
+                streams, shorts = [], []
+                stop = threading.Event()
+                threads = run_clients(server.port, STREAM_PATH, options['streams'], stop, streams, True)
+                threads += run_clients(server.port, SHORT_PATH, options['clients'], stop, shorts, False)
+                time.sleep(options['duration'])
+                processes, rss, pss = worker_memory_kb(server.process.pid)
+                stop.set()
+                for thread in threads:
+                    thread.join(timeout=stream_seconds + 5)
+            finally:
+                server.stop()
+
+            ok_shorts = [elapsed for code, _, elapsed in shorts if code == 200]
+            ok_streams = [first for code, first, _ in streams if code == 200]
+            errors = sum(1 for code, _, _ in shorts + streams if code != 200)
+            self.stdout.write(
+                f'  workers={workers:<3} short {len(ok_shorts) / options["duration"]:7.1f} req/s  '
+                f'p50 {percentile(ok_shorts, 0.5) * 1000:7.1f}ms  p99 {percentile(ok_shorts, 0.99) * 1000:7.1f}ms  '
+                f'streams {len(ok_streams):4}  first chunk p50 {percentile(ok_streams, 0.5) * 1000:7.1f}ms  '
+                f'errors {errors}  '
+                f'memory {processes} procs rss {rss / 1024:.0f}MB pss {pss / 1024:.0f}MB'
+            )
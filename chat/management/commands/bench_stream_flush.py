@@ -0,0 +1,115 @@
+"""
+Benchmark stream flush policies: write calls and CPU per streamed reply
+
+Replays synthetic Groq delta streams (one or two tokens per delta, paced on
+a virtual clock) through chat.streaming.Coalescer and writes every chunk
+with HTTP/1.1 chunked framing to a socket, as gunicorn does for a streaming
+response, so each chunk costs one send(). CPU is the writing thread's time.
+Token delay is how long a delta sat in the buffer before it was written.
+
+Usage:
+    python manage.py bench_stream_flush --streams 500 --tokens 100
+    python manage.py bench_stream_flush --tokens 1000 --token-ms 2
+"""
+import random
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.streaming import Coalescer
+
+# (bytes, milliseconds); (0, 0) writes every delta as it arrives
+POLICIES = [(0, 0), (64, 20), (256, 50), (1024, 100)]
+
+WORDS = ('the', 'car', 'price', 'is', 'around', 'with', 'low', 'mileage', 'and', 'a', 'clean',
+         'history', 'Toyota', 'Corolla', '2019', 'costs', '$18,500', 'available', 'in', 'blue.')
+
+
+def make_deltas(rng, tokens: int) -> list:
+    """(delta, tokens) pairs of one or two word-piece tokens, with their leading spaces"""
+    pieces = []
+    while len(pieces) < tokens:
+        word = ' ' + rng.choice(WORDS)
+        # Long words arrive split over two tokens
+        if len(word) > 6:
+            pieces += [word[:4], word[4:]]
+        else:
+            pieces.append(word)
+    deltas, i = [], 0
+    while i < tokens:
+        size = 2 if rng.random() < 0.3 else 1
+        deltas.append((''.join(pieces[i:i + size]), len(pieces[i:i + size])))
+        i += size
+    return deltas
+
+
+class Command(BaseCommand):
+    help = 'Compare write calls, CPU and token delay of stream flush policies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--streams', type=int, default=500)
+        parser.add_argument('--tokens', type=int, default=100, help='Tokens per reply')
+        parser.add_argument('--token-ms', type=float, default=4.0, help='Milliseconds between tokens')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        replies = [make_deltas(rng, options['tokens']) for _ in range(options['streams'])]
+        interval = options['token_ms'] / 1000
+
+        writer, reader = socket.socketpair()
+        drain = threading.Thread(target=self.drain, args=(reader,), daemon=True)
+        drain.start()
+
+        self.stdout.write(
+            f"{options['streams']} streams of {options['tokens']} tokens, one token every {options['token_ms']}ms"
+        )
+        try:
+            for max_bytes, max_ms in POLICIES:
+                writes = sent = 0
+                delays = []
+                cpu = time.thread_time()
+                for deltas in replies:
+                    now = [0.0]
+                    coalescer = Coalescer(max_bytes, max_ms / 1000, clock=lambda: now[0])
+                    waiting = []  # arrival times of buffered deltas
+                    for delta, tokens in deltas:
+                        waiting.append(now[0])
+                        text = coalescer.add(delta)
+                        if text:
+                            writer.sendall(b'%x\r\n%s\r\n' % (len(text.encode()), text.encode()))
+                            writes += 1
+                            sent += len(text)
+                            delays += [now[0] - arrived for arrived in waiting]
+                            waiting = []
+                        now[0] += interval * tokens
+                    tail = coalescer.flush()
+                    if tail:
+                        writer.sendall(b'%x\r\n%s\r\n' % (len(tail.encode()), tail.encode()))
+                        writes += 1
+                        sent += len(tail)
+                        delays += [now[0] - arrived for arrived in waiting]
+                    writer.sendall(b'0\r\n\r\n')
+                    writes += 1
+                cpu = time.thread_time() - cpu
+
+                delays.sort()
+                label = 'per delta' if not max_bytes else f'{max_bytes}B/{max_ms}ms'
+                self.stdout.write(
+                    f'  {label:12} {writes / len(replies):6.1f} writes/response  '
+                    f'{sent / max(1, writes - len(replies)):6.1f} bytes/write  '
+                    f'{cpu / len(replies) * 1e6:7.1f}us CPU/stream  '
+                    f'token delay p50 {delays[len(delays) // 2] * 1000:5.1f}ms '
+                    f'p99 {delays[int(len(delays) * 0.99)] * 1000:5.1f}ms'
+                )
+        finally:
+            writer.close()
+            drain.join(timeout=5)
+            reader.close()
+
+    @staticmethod
+    def drain(sock):
+        while sock.recv(65536):
+            pass
@@ -0,0 +1,96 @@
+"""
+Compact old conversation sessions
+
+Usage:
+    python manage.py compact_messages --older-than-days 30 --keep-last 6
+    python manage.py compact_messages --every 3600   # run as a scheduled job
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from safycore_backend.resilience import deadline_scope
+from safycore_backend.supabase_client import get_supabase_admin_client
+from chat.archive import compact_session, time_history_query
+from chat.models import ConversationSession
+
+
+class Command(BaseCommand):
+    help = 'Replace old turns with a summary row and archive the raw rows compressed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=30,
+                            help='Only compact sessions not updated for this many days')
+        parser.add_argument('--keep-last', type=int, default=6,
+                            help='Recent user/assistant messages left untouched per session')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Maximum number of sessions to compact in one run')
+        parser.add_argument('--no-llm', action='store_true',
+                            help='Use an extractive summary instead of calling Groq')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be compacted without changing anything')
+        parser.add_argument('--every', type=int, default=None,
+                            help='Keep running and compact again every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            self.compact(options)
+            if not options['every']:
+                return
+            time.sleep(options['every'])
+
+    def compact(self, options):
+        supabase = get_supabase_admin_client()
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        # Cleared sessions are left to the purge
+        sessions = ConversationSession.objects.filter(
+            updated_at__lt=cutoff, deleted_at__isnull=True
+        ).values_list('session_id', flat=True)
+        if options['limit']:
+            sessions = sessions[:options['limit']]
+
+        totals = {'sessions': 0, 'archived_messages': 0, 'raw_bytes': 0, 'archive_bytes': 0,
+                  'bytes_reclaimed': 0, 'query_before': 0.0, 'query_after': 0.0}
+
+        for session_id in sessions:
+            try:
+                with deadline_scope():
+                    before = time_history_query(supabase, session_id)
+                    report = compact_session(
+                        supabase,
+                        session_id,
+                        keep_last=options['keep_last'],
+                        use_llm=not options['no_llm'],
+                        dry_run=options['dry_run'],
+                    )
+                    if not report['archived_messages']:
+                        continue
+                    after = before if options['dry_run'] else time_history_query(supabase, session_id)
+            except Exception as e:
+                self.stderr.write(f'{session_id}: {e}')
+                continue
+
+            totals['sessions'] += 1
+            totals['query_before'] += before
+            totals['query_after'] += after
+            for key in ('archived_messages', 'raw_bytes', 'archive_bytes', 'bytes_reclaimed'):
+                totals[key] += report[key]
+            self.stdout.write(
+                f"{session_id}: archived {report['archived_messages']} messages, "
+                f"reclaimed {report['bytes_reclaimed']} bytes, "
+                f"history query {before * 1000:.1f}ms -> {after * 1000:.1f}ms"
+            )
+
+        if totals['sessions']:
+            improvement = 1 - totals['query_after'] / totals['query_before'] if totals['query_before'] else 0
+        else:
+            improvement = 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted {totals['sessions']} sessions, {totals['archived_messages']} messages: "
+            f"{totals['bytes_reclaimed']} bytes reclaimed from Supabase, "
+            f"{totals['raw_bytes']} raw bytes archived as {totals['archive_bytes']} compressed bytes, "
+            f"history query time {improvement:.0%} faster"
+            + (' (dry run)' if options['dry_run'] else '')
+        ))
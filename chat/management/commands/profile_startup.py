@@ -0,0 +1,101 @@
+"""
+Profile cold-start import time of both service entry points
+
+Each entry point is imported in a fresh interpreter with `python -X importtime`
+and the per-module timings are aggregated, so the numbers match a cold
+serverless start rather than this already-warm process.
+
+Usage:
+    python manage.py profile_startup
+    python manage.py profile_startup --entry app --top 15
+    python manage.py profile_startup --budget-ms 400   # non-zero exit when over budget
+"""
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Code each entry point runs at import time in production
+ENTRY_POINTS = {
+    # Vercel serverless function (vercel.json)
+    'app': 'import app',
+    # Django under gunicorn/uvicorn: settings, apps, WSGI handler and URLconf
+    'django': (
+        'import os; os.environ.setdefault("DJANGO_SETTINGS_MODULE", "safycore_backend.settings"); '
+        'import safycore_backend.wsgi'
+    ),
+}
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    Parse `-X importtime` output
+
+    Returns:
+        list: (module, self_us, cumulative_us, depth) tuples in import order
+    """
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def profile_entry_point(code: str, warm_up: bool) -> list:
+    env = dict(os.environ, WARMUP='1' if warm_up else '0')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise CommandError(f'Importing entry point failed:\n{result.stderr[-2000:]}')
+    return parse_importtime(result.stderr)
+
+
+class Command(BaseCommand):
+    help = 'Report per-module import time of the app.py and Django entry points'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entry', choices=sorted(ENTRY_POINTS), action='append',
+                            help='Entry point to profile (default: all)')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Number of slowest modules to list')
+        parser.add_argument('--runs', type=int, default=3,
+                            help='Fresh interpreters per entry point, the fastest run is reported')
+        parser.add_argument('--warm-up', action='store_true',
+                            help='Also run the WSGI warm-up hook (off by default, it needs credentials)')
+        parser.add_argument('--budget-ms', type=float, default=None,
+                            help='Fail when an entry point imports slower than this')
+
+    def handle(self, *args, **options):
+        over_budget = []
+        for name in options['entry'] or sorted(ENTRY_POINTS):
+            runs = [profile_entry_point(ENTRY_POINTS[name], options['warm_up'])
+                    for _ in range(max(1, options['runs']))]
+            rows = min(runs, key=lambda rows: sum(row[1] for row in rows))
+            total_ms = sum(row[1] for row in rows) / 1000
+
+            self.stdout.write(f'{name}: {total_ms:.1f}ms across {len(rows)} modules')
+            self.stdout.write(f"  {'self ms':>9} {'cumul ms':>9}  module")
+            for module, self_us, cumulative_us, _ in sorted(rows, key=lambda row: row[1], reverse=True)[:options['top']]:
+                self.stdout.write(f'  {self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {module}')
+
+            top_level = sorted((row for row in rows if row[3] == 0), key=lambda row: row[2], reverse=True)
+            self.stdout.write('  heaviest top-level imports: ' + ', '.join(
+                f'{module} {cumulative_us / 1000:.0f}ms' for module, _, cumulative_us, _ in top_level[:5]
+            ))
+
+            if options['budget_ms'] is not None and total_ms > options['budget_ms']:
+                over_budget.append(f'{name} {total_ms:.1f}ms')
+
+        if over_budget:
+            raise CommandError(
+                f"Cold-start budget of {options['budget_ms']:.0f}ms exceeded: " + ', '.join(over_budget)
+            )
@@ -0,0 +1,59 @@
+"""
+Finish purging cleared sessions
+
+Clearing marks sessions and purges them in the background of the process
+that served the request; a purge cut short by a restart or an upstream
+error is left marked. This command purges every marker older than a grace
+period with the service-role client.
+
+Usage:
+    python manage.py purge_sessions --older-than-minutes 10
+    python manage.py purge_sessions --every 600   # run as a scheduled job
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from safycore_backend.supabase_client import get_supabase_admin_client
+from chat.deletion import purge
+from chat.models import ConversationSession
+from users.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Purge sessions that were cleared but not purged'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-minutes', type=int, default=10,
+                            help='Leave markers this recent to the purge already running for them')
+        parser.add_argument('--every', type=int, default=None,
+                            help='Keep running and purge again every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            self.purge(options)
+            if not options['every']:
+                return
+            time.sleep(options['every'])
+
+    def purge(self, options):
+        supabase = get_supabase_admin_client()
+        cutoff = timezone.now() - timedelta(minutes=options['older_than_minutes'])
+        markers = ConversationSession.objects.filter(
+            deleted_at__lt=cutoff
+        ).values_list('user_id', 'deleted_at').distinct()
+
+        users = {}
+        purged = failed = 0
+        for user_pk, cleared_at in markers:
+            if user_pk not in users:
+                users[user_pk] = UserProfile.objects.get(pk=user_pk)
+            try:
+                purged += purge(supabase, users[user_pk], cleared_at)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'  {users[user_pk].user_id} cleared at {cleared_at}: {e}')
+
+        self.stdout.write(f'Purged {purged} sessions, {failed} markers failed')
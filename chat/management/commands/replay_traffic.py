@@ -0,0 +1,533 @@
+"""
+Replay recorded chat traffic against a local server for capacity planning
+
+Reads the JSONL written by the traffic recorder (safycore_backend/traffic.py),
+or synthesizes sessions when no trace is given. The traffic is replayed
+against gunicorn (gunicorn.conf.py) serving the Django service on a
+throwaway database, or app.py. Groq and Supabase are replaced by in-process
+fakes, so no credentials or upstream quota are used. The fakes answer with
+the recorded reply lengths after a fixed upstream latency. Each worker
+keeps its own fake Supabase store.
+
+Arrivals are open loop: sessions start at their recorded times divided by
+the speed-up, whether or not the server keeps up, and a session sends its
+next turn one recorded think time after its previous reply ended. A trace
+shorter than a run is repeated. Every speed-up runs for --duration seconds.
+The table shows offered and completed turns per second and the latency at
+each; the saturation throughput is the highest completed rate whose errors
+and p99 stay within --max-error-rate and --slo-ms. At high rates the
+client's own CPU can become the limit; watch it with top.
+
+Usage:
+    python manage.py replay_traffic --trace traffic.jsonl --speeds 1,2,4,8,16
+    python manage.py replay_traffic --sessions-per-second 2 --speeds 1,4,16   # synthetic traffic
+    python manage.py replay_traffic --service fastapi --trace traffic.jsonl
+    python manage.py replay_traffic --trace traffic.jsonl --min-throughput 50   # exit non-zero below 50 turns/s
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict, namedtuple
+from importlib import import_module
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from chat.management.commands.bench_server import Server, percentile
+
+# Upstream latency of the fakes, read by the server processes
+GROQ_FIRST_TOKEN_MS = float(os.getenv('REPLAY_GROQ_FIRST_TOKEN_MS', '250'))
+GROQ_TOKEN_MS = float(os.getenv('REPLAY_GROQ_TOKEN_MS', '4'))
+SUPABASE_MS = float(os.getenv('REPLAY_SUPABASE_MS', '20'))
+
+# Replayed messages ask the fake Groq for a reply length with this marker
+REPLY_MARKER = re.compile(r'\[reply:(\d+)\]')
+DEFAULT_REPLY_CHARS = 400
+CHARS_PER_TOKEN = 4
+TOKEN = 'car '
+
+ReplayTurn = namedtuple('ReplayTurn', 'think stream message_chars training_chars reply_chars')
+
+
+# Fakes, installed in the server processes
+
+class FakeStream:
+    """Streamed completion paced like Groq: a first-token delay, then one token per interval"""
+
+    def __init__(self, tokens: int, prompt_tokens: int):
+        self.tokens = tokens
+        self.prompt_tokens = prompt_tokens
+        self.sent = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed or self.sent >= self.tokens:
+            raise StopIteration
+        time.sleep((GROQ_FIRST_TOKEN_MS if self.sent == 0 else GROQ_TOKEN_MS) / 1000)
+        self.sent += 1
+        usage = None
+        if self.sent == self.tokens:
+            usage = SimpleNamespace(usage=_usage(self.prompt_tokens, self.tokens))
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=TOKEN))],
+                               usage=None, x_groq=usage)
+
+    def close(self):
+        self.closed = True
+
+
+def _usage(prompt_tokens: int, completion_tokens: int):
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                           prompt_tokens_details=None)
+
+
+class FakeGroq:
+    """Groq client whose replies are as long as the replayed message asks"""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, stream=False, **kwargs):
+        match = REPLY_MARKER.search(messages[-1]['content'])
+        tokens = max(1, (int(match.group(1)) if match else DEFAULT_REPLY_CHARS) // CHARS_PER_TOKEN)
+        prompt_tokens = sum(len(message['content']) for message in messages) // CHARS_PER_TOKEN
+        if stream:
+            return FakeStream(tokens, prompt_tokens)
+        time.sleep((GROQ_FIRST_TOKEN_MS + tokens * GROQ_TOKEN_MS) / 1000)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=TOKEN * tokens))],
+            usage=_usage(prompt_tokens, tokens),
+        )
+
+
+class FakeQuery:
+    """The PostgREST query builder calls the services make, over in-memory rows"""
+
+    def __init__(self, store, table: str):
+        self.store = store
+        self.table = table
+        self.action = 'select'
+        self.columns = None
+        self.values = None
+        self.filters = []
+        self.orders = []
+        self.max_rows = None
+
+    def select(self, columns='*'):
+        self.columns = None if columns == '*' else [column.strip() for column in columns.split(',')]
+        return self
+
+    def insert(self, rows):
+        self.action, self.values = 'insert', rows
+        return self
+
+    def update(self, values):
+        self.action, self.values = 'update', values
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    def _filter(self, column, test):
+        self.filters.append((column, test))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, lambda cell: cell == value)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda cell: cell is not None and cell > value)
+
+    def lt(self, column, value):
+        return self._filter(column, lambda cell: cell is not None and cell < value)
+
+    def lte(self, column, value):
+        return self._filter(column, lambda cell: cell is not None and cell <= value)
+
+    def in_(self, column, values):
+        values = set(values)
+        return self._filter(column, lambda cell: cell in values)
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.max_rows = count
+        return self
+
+    def execute(self):
+        time.sleep(SUPABASE_MS / 1000)
+        with self.store.lock:
+            if self.action == 'insert':
+                return SimpleNamespace(data=self.store.insert(self.table, self.values))
+            rows = [row for row in self.store.rows(self.table, self.filters)
+                    if all(test(row.get(column)) for column, test in self.filters)]
+            if self.action == 'update':
+                for row in rows:
+                    row.update(self.values)
+            elif self.action == 'delete':
+                self.store.remove(self.table, rows)
+        for column, desc in reversed(self.orders):
+            rows.sort(key=lambda row: row.get(column) or '', reverse=desc)
+        if self.max_rows is not None:
+            rows = rows[:self.max_rows]
+        if self.columns is not None:
+            rows = [{column: row.get(column) for column in self.columns} for row in rows]
+        return SimpleNamespace(data=[dict(row) for row in rows])
+
+
+class FakeSupabase:
+    """In-memory Supabase: tables indexed by session_id, and an auth API that trusts any token"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = defaultdict(lambda: defaultdict(list))  # table -> session_id -> rows
+        self.auth = SimpleNamespace(get_user=self.get_user, set_session=lambda access, refresh: None)
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=[]))
+
+    def get_user(self, token):
+        user_id = str(uuid.uuid5(uuid.NAMESPACE_URL, token))
+        return SimpleNamespace(user=SimpleNamespace(id=user_id, email=f'{user_id}@replay.invalid'))
+
+    def insert(self, table, rows):
+        rows = [rows] if isinstance(rows, dict) else rows
+        stored = []
+        for row in rows:
+            row = {'id': str(uuid.uuid4()), 'created_at': timezone.now().isoformat(), **row}
+            self.tables[table][row.get('session_id')].append(row)
+            stored.append(dict(row))
+        return stored
+
+    def rows(self, table, filters):
+        sessions = self.tables[table]
+        for column, test in filters:
+            if column == 'session_id':
+                # Most queries name their session; only scan its rows
+                return [row for session_id, rows in list(sessions.items()) if test(session_id) for row in rows]
+        return [row for rows in sessions.values() for row in rows]
+
+    def remove(self, table, rows):
+        doomed = {id(row) for row in rows}
+        for session_id, session_rows in self.tables[table].items():
+            session_rows[:] = [row for row in session_rows if id(row) not in doomed]
+
+
+def install_fakes(service=None):
+    """Point the upstream clients of the services (and app.py, if given) at the fakes"""
+    from safycore_backend import groq_client, supabase_client
+
+    groq, supabase = FakeGroq(), FakeSupabase()
+    groq_client.new_groq_client = lambda api_key: groq
+    supabase_client.create_client = lambda url, key: supabase
+    if service is not None:
+        service.new_groq_client = groq_client.new_groq_client
+
+
+def _django_application(module: str):
+    # Before anything connects, so the app database is never touched
+    settings.DATABASES['default']['NAME'] = os.environ['REPLAY_DATABASE']
+    install_fakes()
+    application = import_module(module).application
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+    return application
+
+
+def wsgi_application():
+    """Gunicorn app factory: the Django service on a throwaway database, with upstream fakes"""
+    return _django_application('safycore_backend.wsgi')
+
+
+def asgi_application():
+    """Gunicorn app factory: the Django ASGI application on a throwaway database, with upstream fakes"""
+    return _django_application('safycore_backend.asgi')
+
+
+def fastapi_application():
+    """Gunicorn app factory: app.py with upstream fakes"""
+    service = import_module('app')
+    install_fakes(service)
+    return service.app
+
+
+# Traffic
+
+def load_trace(paths) -> list:
+    """
+    Sessions of recorded traces, as (start seconds from the first session, [ReplayTurn])
+    A turn's think time is the gap between the end of the session's previous reply and its arrival
+    """
+    records = defaultdict(list)
+    for path in paths:
+        with open(path, encoding='utf-8') as trace:
+            for line in trace:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record['session']].append(record)
+    if not records:
+        raise CommandError('The trace has no turns')
+
+    sessions = []
+    for turns in records.values():
+        turns.sort(key=lambda record: record['ts'])
+        replay, previous_end = [], None
+        for record in turns:
+            think = 0.0 if previous_end is None else max(0.0, record['ts'] - previous_end)
+            replay.append(ReplayTurn(think, record['stream'], record['message_chars'],
+                                     record.get('training_chars', 0), record.get('reply_chars', 0)))
+            previous_end = record['ts'] + record.get('latency', 0.0)
+        sessions.append((turns[0]['ts'], replay))
+    sessions.sort(key=lambda session: session[0])
+    first = sessions[0][0]
+    return [(start - first, turns) for start, turns in sessions]
+
+
+def synthetic_trace(rng, sessions_per_second: float, seconds: float, stream_share: float) -> list:
+    """
+    Poisson session arrivals with long-tailed shapes: about four turns per
+    session, think times around 15s, short questions and replies near the
+    completion budget
+    """
+    sessions, start = [], 0.0
+    while start < seconds:
+        turns = []
+        while not turns or rng.random() < 0.75:
+            turns.append(ReplayTurn(
+                think=rng.lognormvariate(math.log(15), 1.0) if turns else 0.0,
+                stream=rng.random() < stream_share,
+                message_chars=int(rng.lognormvariate(math.log(60), 0.8)) + 1,
+                training_chars=int(rng.lognormvariate(math.log(2000), 1.0)) if not turns and rng.random() < 0.2 else 0,
+                reply_chars=min(400, int(rng.lognormvariate(math.log(300), 0.5))),
+            ))
+        sessions.append((start, turns))
+        start += rng.expovariate(sessions_per_second)
+    return sessions
+
+
+def arrivals(sessions: list, window: float):
+    """Sessions starting within window trace seconds, repeating the trace as needed"""
+    span = sessions[-1][0] + (sessions[-1][0] / len(sessions) if len(sessions) > 1 else 1.0)
+    offset = 0.0
+    while True:
+        for start, turns in sessions:
+            if offset + start >= window:
+                return
+            yield offset + start, turns
+        offset += span
+
+
+def filler(chars: int, reply_chars: int = None) -> str:
+    """Text of about chars characters, asking the fake Groq for reply_chars if given"""
+    text = f'[reply:{reply_chars}] ' if reply_chars is not None else ''
+    return text + ('What does a used car cost ' * (chars // 26 + 1))[:max(0, chars - len(text))]
+
+
+class Step:
+    """Results of replaying at one speed-up"""
+
+    def __init__(self, speed: float):
+        self.speed = speed
+        self.issued = 0
+        self.results = []  # (status, first byte seconds, latency seconds, stream)
+        self.started = self.ended = 0.0  # loop times of the start and the last reply
+
+
+async def run_step(client, service: str, sessions: list, speed: float, duration: float, users: int,
+                   step_id: int) -> Step:
+    import httpx
+
+    step = Step(speed)
+    chat_path = settings.API_PATH_PREFIX + 'chat/' if service == 'django' else '/chat'
+    stream_path = settings.API_PATH_PREFIX + 'chat/stream/' if service == 'django' else '/chat/stream'
+    loop = asyncio.get_running_loop()
+    step.started = loop.time()
+
+    async def send(session_id, headers, turn, first):
+        body = {'message': filler(turn.message_chars, turn.reply_chars), 'session_id': session_id}
+        if first and turn.training_chars:
+            body['training_data'] = filler(turn.training_chars)
+        start = loop.time()
+        first_byte = None
+        try:
+            if turn.stream:
+                async with client.stream('POST', stream_path, json=body, headers=headers) as response:
+                    async for _ in response.aiter_raw():
+                        if first_byte is None:
+                            first_byte = loop.time() - start
+            else:
+                response = await client.post(chat_path, json=body, headers=headers)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        step.ended = max(step.ended, loop.time())
+        latency = loop.time() - start
+        step.results.append((status, first_byte if first_byte is not None else latency, latency, turn.stream))
+
+    async def session(index, turns):
+        session_id = f'replay-{step_id}-{index}'
+        headers = {'Authorization': f'Bearer replay-user-{index % users}'}
+        for number, turn in enumerate(turns):
+            if loop.time() + (turn.think / speed if number else 0) - step.started >= duration:
+                return
+            if number:
+                await asyncio.sleep(turn.think / speed)
+            step.issued += 1
+            await send(session_id, headers, turn, number == 0)
+
+    tasks = []
+    for index, (start, turns) in enumerate(arrivals(sessions, duration * speed)):
+        delay = start / speed - (loop.time() - step.started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(session(index, turns)))
+    await asyncio.gather(*tasks)
+    return step
+
+
+async def replay(port: int, options, sessions: list, speeds: list) -> list:
+    import httpx
+
+    steps = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=1000)
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=limits,
+                                 timeout=options['timeout']) as client:
+        for step_id, speed in enumerate(speeds):
+            steps.append(await run_step(client, options['service'], sessions, speed, options['duration'],
+                                        options['users'], step_id))
+    return steps
+
+
+class Command(BaseCommand):
+    help = 'Replay recorded or synthetic chat traffic at several speed-ups and find the saturation throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trace', action='append', default=[], help='Recorded JSONL; repeat for several files')
+        parser.add_argument('--sessions-per-second', type=float, default=1.0,
+                            help='Session arrival rate of synthetic traffic at 1x')
+        parser.add_argument('--stream-share', type=float, default=0.7, help='Streamed share of synthetic turns')
+        parser.add_argument('--speeds', default='1,2,4,8,16', help='Comma-separated speed-ups')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds per speed-up')
+        parser.add_argument('--service', default='django', choices=('django', 'fastapi'))
+        parser.add_argument('--worker-class', default=None, choices=('sync', 'gthread', 'uvicorn'),
+                            help='Default gthread for django, uvicorn for fastapi')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--users', type=int, default=100, help='Users the sessions are spread over')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds before a client gives up')
+        parser.add_argument('--first-token-ms', type=float, default=GROQ_FIRST_TOKEN_MS)
+        parser.add_argument('--token-ms', type=float, default=GROQ_TOKEN_MS)
+        parser.add_argument('--supabase-ms', type=float, default=SUPABASE_MS)
+        parser.add_argument('--max-error-rate', type=float, default=0.01)
+        parser.add_argument('--slo-ms', type=float, default=None, help='p99 latency a saturated step may not exceed')
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--min-throughput', type=float,
+                            help='Fail when the saturation throughput is below this many turns per second')
+
+    def handle(self, *args, **options):
+        speeds = [float(speed) for speed in options['speeds'].split(',')]
+        service = options['service']
+        worker_class = options['worker_class'] or ('uvicorn' if service == 'fastapi' else 'gthread')
+        if service == 'fastapi' and worker_class != 'uvicorn':
+            raise CommandError('app.py is an ASGI application; use --worker-class uvicorn')
+
+        if options['trace']:
+            sessions = load_trace(options['trace'])
+            source = f"{len(sessions)} recorded sessions over {sessions[-1][0]:.0f}s"
+        else:
+            rng = random.Random(options['seed'])
+            sessions = synthetic_trace(rng, options['sessions_per_second'], options['duration'] * max(speeds),
+                                       options['stream_share'])
+            source = f"synthetic traffic, {options['sessions_per_second']:g} sessions/s at 1x"
+        turns = [turn for _, session_turns in sessions for turn in session_turns]
+        self.stdout.write(
+            f'{source}: {len(turns) / len(sessions):.1f} turns per session, '
+            f'{sum(turn.stream for turn in turns) / len(turns):.0%} streamed, '
+            f'median think {percentile([turn.think for turn in turns if turn.think], 0.5):.1f}s'
+        )
+
+        if service == 'django':
+            app = f'chat.management.commands.replay_traffic:{"asgi" if worker_class == "uvicorn" else "wsgi"}_application()'
+            ready_path = settings.API_PATH_PREFIX + 'metrics/'
+        else:
+            app, ready_path = 'chat.management.commands.replay_traffic:fastapi_application()', '/metrics'
+
+        with tempfile.TemporaryDirectory() as directory:
+            server = Server(worker_class, options['workers'], preload=True, app=app, ready_path=ready_path, env={
+                'REPLAY_DATABASE': os.path.join(directory, 'replay.sqlite3'),
+                'REPLAY_GROQ_FIRST_TOKEN_MS': str(options['first_token_ms']),
+                'REPLAY_GROQ_TOKEN_MS': str(options['token_ms']),
+                'REPLAY_SUPABASE_MS': str(options['supabase_ms']),
+                'SUPABASE_URL': 'http://supabase.replay.invalid',
+                'SUPABASE_KEY': 'replay',
+                'SUPABASE_SERVICE_KEY': 'replay',
+                'GROQ_API_KEY': 'replay',
+                'TRAFFIC_RECORD_PATH': '',
+                'DEBUG': 'False',
+            })
+            try:
+                server.wait_ready()
+                steps = asyncio.run(replay(server.port, options, sessions, speeds))
+            finally:
+                server.stop()
+
+        best = self.report(steps, options, worker_class)
+        if options['min_throughput'] is not None and best < options['min_throughput']:
+            raise CommandError(
+                f"Saturation throughput {best:.1f} turns/s is below {options['min_throughput']:g}"
+            )
+
+    def report(self, steps: list, options, worker_class: str) -> float:
+        """Print the latency curve; returns the saturation throughput in turns per second"""
+        self.stdout.write(
+            f"{options['service']} on {options['workers']} {worker_class} workers, "
+            f"{options['duration']:.0f}s per step"
+        )
+        self.stdout.write(
+            f"  {'speed':>6} {'offered/s':>10} {'done/s':>8} {'p50':>8} {'p90':>8} {'p99':>8} "
+            f"{'ttfb p50':>9} {'ttfb p99':>9} {'errors':>7} {'shed':>5}"
+        )
+        best, best_speed = 0.0, None
+        for step in steps:
+            ok = [result for result in step.results if result[0] == 200]
+            latencies = [latency for _, _, latency, _ in ok]
+            first_bytes = [first for _, first, _, stream in ok if stream]
+            errors = len(step.results) - len(ok)
+            error_rate = errors / len(step.results) if step.results else 0.0
+            offered = step.issued / options['duration']
+            done = len(ok) / max(step.ended - step.started, options['duration'])
+            p99 = percentile(latencies, 0.99)
+            self.stdout.write(
+                f'  {step.speed:>5g}x {offered:>10.1f} {done:>8.1f} '
+                f'{percentile(latencies, 0.5) * 1000:>6.0f}ms {percentile(latencies, 0.9) * 1000:>6.0f}ms '
+                f'{p99 * 1000:>6.0f}ms {percentile(first_bytes, 0.5) * 1000:>7.0f}ms '
+                f'{percentile(first_bytes, 0.99) * 1000:>7.0f}ms {error_rate:>7.1%} '
+                f'{sum(1 for result in step.results if result[0] == 503):>5}'
+            )
+            within = error_rate <= options['max_error_rate'] and (
+                options['slo_ms'] is None or p99 * 1000 <= options['slo_ms']
+            )
+            if within and done > best:
+                best, best_speed = done, step.speed
+        if best_speed is None:
+            self.stdout.write('Saturation throughput: no step stayed within the limits')
+        else:
+            self.stdout.write(f'Saturation throughput: {best:.1f} turns/s (at {best_speed:g}x)')
+        return best
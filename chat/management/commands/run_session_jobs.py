@@ -0,0 +1,36 @@
+"""
+Run pending session title and summary jobs
+
+Web processes run the jobs their own turns queue, but jobs left behind by
+a restart, or queued while SESSION_SUMMARY_WORKERS was 0, wait in the
+session_jobs table until something runs them. This command runs every
+due job with the service-role client, under the same rate limit.
+
+Usage:
+    python manage.py run_session_jobs
+    python manage.py run_session_jobs --every 30   # run as a worker process
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.models import SessionJob
+from chat.summaries import SummaryQueue
+
+
+class Command(BaseCommand):
+    help = 'Generate pending session titles and summaries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=int, default=None,
+                            help='Keep running and look for due jobs every N seconds')
+
+    def handle(self, *args, **options):
+        queue = SummaryQueue(1, settings.SESSION_SUMMARY_RATE_PER_MINUTE)
+        while True:
+            ran = queue.run_due()
+            self.stdout.write(f'Ran {ran} session jobs, {SessionJob.objects.count()} pending')
+            if not options['every']:
+                return
+            time.sleep(options['every'])
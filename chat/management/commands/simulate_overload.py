@@ -0,0 +1,130 @@
+"""
+Simulate chat overload with and without the adaptive load shedder
+
+A pool of server threads serves turns that share a bottleneck (the model
+upstream, the CPU) with fixed capacity: when more turns run than it can
+take, every one of them slows down. Turns arrive open-loop faster than the
+bottleneck can serve them, queue for a server thread like requests in the
+proxy and gunicorn backlog, and are given up by their client after a timeout.
+
+Without shedding every queued turn is eventually served, mostly after its
+client left. With chat_limiter's settings the excess is rejected up front,
+so the turns that do run finish in time. Goodput counts turns finished
+within the client timeout.
+
+Usage:
+    python manage.py simulate_overload --rate 80 --capacity 8 --service-ms 200
+    python manage.py simulate_overload --min-goodput 0.8   # exit non-zero if shedding keeps less of capacity
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from safycore_backend.limiter import AdaptiveLimiter, Overloaded, chat_limiter
+
+STEP = 0.01
+
+
+class Bottleneck:
+    """Processor sharing: with n turns running, each progresses at min(1, capacity / n)"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def serve(self, work: float) -> None:
+        with self._lock:
+            self.active += 1
+        try:
+            while work > 0:
+                time.sleep(STEP)
+                work -= STEP * min(1.0, self.capacity / self.active)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class Command(BaseCommand):
+    help = 'Compare goodput under overload with and without adaptive load shedding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=80.0, help='Arriving turns per second')
+        parser.add_argument('--capacity', type=int, default=8, help='Turns the bottleneck serves at full speed')
+        parser.add_argument('--service-ms', type=float, default=200.0, help='Unloaded service time of a turn')
+        parser.add_argument('--threads', type=int, default=64, help='Server threads')
+        parser.add_argument('--timeout', type=float, default=2.0, help='Seconds before a client gives up')
+        parser.add_argument('--continuing', type=float, default=0.6, help='Share of turns from continuing sessions')
+        parser.add_argument('--duration', type=float, default=10.0)
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--min-goodput', type=float,
+                            help='Fail when goodput with shedding is below this share of capacity')
+
+    def handle(self, *args, **options):
+        capacity_rate = options['capacity'] / (options['service_ms'] / 1000)
+        self.stdout.write(
+            f"{options['rate']:.0f} turns/s offered to a bottleneck serving {capacity_rate:.0f} turns/s, "
+            f"client timeout {options['timeout']:.1f}s, {options['duration']:.0f}s per run"
+        )
+        goodput = {}
+        for mode in ('none', 'adaptive'):
+            limiter = AdaptiveLimiter(
+                f'simulated_{mode}', enabled=mode == 'adaptive',
+                initial=int(chat_limiter.limit), min_limit=chat_limiter.min_limit,
+                max_limit=chat_limiter.max_limit, queue_target=chat_limiter.queue_target,
+                reserve=chat_limiter.reserve,
+            )
+            result = self.run(limiter, options)
+            goodput[mode] = result['good'] / options['duration']
+            self.stdout.write(
+                f"  {mode:9} goodput {goodput[mode]:6.1f}/s ({goodput[mode] / capacity_rate:4.0%} of capacity)  "
+                f"shed {result['shed']:5}  late {result['late']:5}  "
+                f"continuing ok {result['ok_continuing']:4.0%}  new ok {result['ok_new']:4.0%}  "
+                f"good p50 {result['p50'] * 1000:6.0f}ms  final limit {limiter.limit:5.1f}"
+            )
+
+        if options['min_goodput'] is not None and goodput['adaptive'] < options['min_goodput'] * capacity_rate:
+            raise CommandError(f"Goodput {goodput['adaptive']:.1f}/s is below {options['min_goodput']:.0%} of capacity")
+
+    def run(self, limiter, options) -> dict:
+        rng = random.Random(options['seed'])
+        bottleneck = Bottleneck(options['capacity'])
+        work = options['service_ms'] / 1000
+        outcomes = []  # (continuing, outcome, latency)
+        lock = threading.Lock()
+
+        def turn(arrived, continuing):
+            try:
+                with limiter.acquire(continuing, queued=time.monotonic() - arrived):
+                    bottleneck.serve(work)
+                latency = time.monotonic() - arrived
+                outcome = 'good' if latency <= options['timeout'] else 'late'
+            except Overloaded:
+                latency, outcome = time.monotonic() - arrived, 'shed'
+            with lock:
+                outcomes.append((continuing, outcome, latency))
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            start = time.monotonic()
+            next_arrival = start
+            while next_arrival - start < options['duration']:
+                time.sleep(max(0.0, next_arrival - time.monotonic()))
+                pool.submit(turn, time.monotonic(), rng.random() < options['continuing'])
+                next_arrival += rng.expovariate(options['rate'])
+
+        def ok_share(continuing):
+            mine = [outcome for kind, outcome, _ in outcomes if kind is continuing]
+            return sum(1 for outcome in mine if outcome == 'good') / len(mine) if mine else 0.0
+
+        good_latencies = sorted(latency for _, outcome, latency in outcomes if outcome == 'good')
+        return {
+            'good': len(good_latencies),
+            'shed': sum(1 for _, outcome, _ in outcomes if outcome == 'shed'),
+            'late': sum(1 for _, outcome, _ in outcomes if outcome == 'late'),
+            'ok_continuing': ok_share(True),
+            'ok_new': ok_share(False),
+            'p50': good_latencies[len(good_latencies) // 2] if good_latencies else 0.0,
+        }
@@ -0,0 +1,138 @@
+"""
+Simulate hot-history hit rates under session routing and membership changes
+
+Replays a synthetic chat workload against node-local HistoryCache instances,
+exactly as prepare_turn() uses them: a turn hits when the node holds the
+session's history at its current version, and every turn bumps the version,
+so a turn served elsewhere invalidates the other nodes' copies.
+
+The workload runs in three phases, steady, one node joining, and one node
+leaving, and compares the consistent-hash ring with round-robin balancing and
+modulo hashing. It reports each phase's hit rate, the hit rate over its
+first tenth (right after the change) and the share of sessions whose node
+changed.
+
+Usage:
+    python manage.py simulate_routing --nodes 4 --sessions 20000 --turns 200000
+    python manage.py simulate_routing --min-hit-rate 0.8   # exit non-zero below this ring hit rate
+"""
+import random
+import zlib
+from itertools import count
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.messages import HistoryCache
+from safycore_backend.routing import HashRing
+
+
+class RingPolicy:
+    name = 'ring'
+    sticky = True
+
+    def __init__(self, nodes):
+        self.ring = HashRing(nodes)
+
+    def node_for(self, session_id):
+        return self.ring.node_for(session_id)
+
+    def add(self, node):
+        self.ring.add(node)
+
+    def remove(self, node):
+        self.ring.remove(node)
+
+
+class ModuloPolicy:
+    name = 'modulo'
+    sticky = True
+
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+
+    def node_for(self, session_id):
+        return self.nodes[zlib.crc32(session_id.encode()) % len(self.nodes)]
+
+    def add(self, node):
+        self.nodes.append(node)
+
+    def remove(self, node):
+        self.nodes.remove(node)
+
+
+class RoundRobinPolicy(ModuloPolicy):
+    name = 'round-robin'
+    sticky = False
+
+    def __init__(self, nodes):
+        super().__init__(nodes)
+        self._next = count()
+
+    def node_for(self, session_id):
+        return self.nodes[next(self._next) % len(self.nodes)]
+
+
+class Command(BaseCommand):
+    help = 'Simulate hot-history hit rates for session routing policies under membership changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=4)
+        parser.add_argument('--sessions', type=int, default=20000)
+        parser.add_argument('--turns', type=int, default=200000, help='Turns per phase')
+        parser.add_argument('--cache-size', type=int, default=4096, help='Hot histories per node')
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--min-hit-rate', type=float, help='Fail when the ring hit rate of any phase is lower')
+
+    def handle(self, *args, **options):
+        nodes = [f'node-{i}' for i in range(options['nodes'])]
+        joining = f"node-{options['nodes']}"
+        sessions = [f'session-{i}' for i in range(options['sessions'])]
+        phases = [
+            ('steady', None),
+            (f'+{joining}', lambda policy: policy.add(joining)),
+            (f'-{nodes[0]}', lambda policy: policy.remove(nodes[0])),
+        ]
+
+        self.stdout.write(
+            f"{options['nodes']} nodes, {options['sessions']} sessions, {options['turns']} turns per phase, "
+            f"{options['cache_size']} hot histories per node"
+        )
+        worst_ring = 1.0
+        for policy_class in (RingPolicy, ModuloPolicy, RoundRobinPolicy):
+            policy = policy_class(nodes)
+            caches = {}
+            versions = dict.fromkeys(sessions, 0)
+            # Same workload for every policy: a few sessions are busy, most are occasional
+            rng = random.Random(options['seed'])
+            weights = [1 / (rank + 1) ** 0.8 for rank in range(len(sessions))]
+
+            results = []
+            for phase, change in phases:
+                before = {session: policy.node_for(session) for session in sessions}
+                if change:
+                    change(policy)
+                moved = sum(1 for session in sessions if policy.node_for(session) != before[session])
+
+                # The first tenth of a phase shows the cost of the change itself
+                hits = early_hits = 0
+                early = options['turns'] // 10
+                for turn, session in enumerate(rng.choices(sessions, weights, k=options['turns'])):
+                    node = policy.node_for(session)
+                    cache = caches.get(node)
+                    if cache is None:
+                        cache = caches[node] = HistoryCache(options['cache_size'])
+                    if cache.get(session, versions[session]) is not None:
+                        hits += 1
+                        early_hits += turn < early
+                    versions[session] += 1
+                    cache.put(session, versions[session], [])
+
+                hit_rate = hits / options['turns']
+                moved = f'{moved / len(sessions):5.1%}' if policy.sticky else '  n/a'
+                results.append(f'{phase} {hit_rate:6.1%} hits ({early_hits / early:6.1%} early), {moved} moved')
+                if policy_class is RingPolicy:
+                    worst_ring = min(worst_ring, hit_rate)
+            self.stdout.write(f'  {policy.name:12} ' + '   '.join(results))
+
+        if options['min_hit_rate'] is not None and worst_ring < options['min_hit_rate']:
+            raise CommandError(f"Ring hit rate {worst_ring:.1%} is below {options['min_hit_rate']:.1%}")
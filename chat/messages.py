@@ -0,0 +1,128 @@
+"""
+Compact in-process message representation
+Histories held in memory keep one small slotted object per message instead
+of a PostgREST row dict: the role is an enum member shared by every message
+and the content string is stored once, so building the provider payload for
+a turn only creates the outer dicts and never copies text
+
+This module has no Django imports so app.py can use it too.
+"""
+import os
+import threading
+from collections import OrderedDict
+from enum import Enum
+
+from safycore_backend import metrics
+
+# Columns read from the messages table when only the conversation is needed
+MESSAGE_COLUMNS = 'role,content'
+
+# Session histories kept hot on this node
+HOT_HISTORY_SIZE = int(os.getenv('HOT_HISTORY_SIZE', '2048'))
+
+
+class Role(Enum):
+    SYSTEM = 'system'
+    USER = 'user'
+    ASSISTANT = 'assistant'
+
+
+_ROLES = {role.value: role for role in Role}
+
+
+class Message:
+    """
+    One conversation message
+
+    Args:
+        role: A Role or its string value
+        content: Message text, stored as given
+        truncated: The reply was cut short by a disconnect
+    """
+    __slots__ = ('role', 'content', 'truncated')
+
+    def __init__(self, role, content: str, truncated: bool = False):
+        self.role = role if isinstance(role, Role) else _ROLES[role]
+        self.content = content
+        self.truncated = truncated
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'Message':
+        """Build a message from a messages-table row or a message dict"""
+        return cls(row['role'], row['content'], bool(row.get('truncated')))
+
+    def payload(self) -> dict:
+        """Provider payload entry; shares the role and content strings"""
+        return {'role': self.role.value, 'content': self.content}
+
+    def as_dict(self) -> dict:
+        """JSON-serializable form; 'truncated' only appears when set"""
+        data = self.payload()
+        if self.truncated:
+            data['truncated'] = True
+        return data
+
+    def __repr__(self):
+        return f'Message({self.role.value!r}, {self.content[:40]!r})'
+
+
+def to_payload(messages) -> list:
+    """Provider payload for a history of Message objects"""
+    return [message.payload() for message in messages]
+
+
+class HistoryCache:
+    """
+    LRU of recent session histories on this node
+
+    Each entry carries a stamp, the session's updated_at when the history
+    was last complete, and is only served for that stamp: a write from
+    another node bumps updated_at and the next turn reads from the store.
+    While a turn is in flight its entry is stamped with the turn's own
+    token, so only that turn can complete it.
+    """
+
+    def __init__(self, size: int = HOT_HISTORY_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stamp, [Message])
+
+    def get(self, key, stamp):
+        """A copy of the history cached for stamp, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stamp:
+                metrics.incr('hot_history.misses')
+                return None
+            self._entries.move_to_end(key)
+        metrics.incr('hot_history.hits')
+        return list(entry[1])
+
+    def put(self, key, stamp, history) -> None:
+        with self._lock:
+            self._entries[key] = (stamp, history)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def complete(self, key, token, stamp, message=None) -> None:
+        """Append the reply of the turn holding token and stamp the history valid"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] is not token:
+                return
+            history = entry[1]
+            if message is not None:
+                history.append(message)
+            self._entries[key] = (stamp, history)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
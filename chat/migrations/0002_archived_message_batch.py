@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessageBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(db_index=True, max_length=255)),
+                ('user_id', models.CharField(db_index=True, max_length=255)),
+                ('first_created_at', models.DateTimeField()),
+                ('last_created_at', models.DateTimeField()),
+                ('message_count', models.PositiveIntegerField()),
+                ('raw_bytes', models.PositiveIntegerField()),
+                ('codec', models.CharField(choices=[('gzip', 'gzip'), ('zstd', 'zstd')], default='gzip', max_length=10)),
+                ('payload', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'archived_message_batches',
+                'ordering': ['session_id', 'first_created_at'],
+                'indexes': [models.Index(fields=['user_id', 'session_id', 'last_created_at'], name='archived_me_user_id_fcd630_idx')],
+            },
+        ),
+    ]
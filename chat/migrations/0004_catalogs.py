@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_usage_daily'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Catalog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('version', models.PositiveIntegerField()),
+                ('content', models.TextField()),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('size_bytes', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalogs', to='users.userprofile')),
+            ],
+            options={
+                'db_table': 'catalogs',
+                'ordering': ['name', '-version'],
+            },
+        ),
+        migrations.AddField(
+            model_name='conversationsession',
+            name='catalog',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sessions', to='chat.catalog'),
+        ),
+        migrations.AddConstraint(
+            model_name='catalog',
+            constraint=models.UniqueConstraint(fields=('user', 'name', 'version'), name='catalog_user_name_version'),
+        ),
+    ]
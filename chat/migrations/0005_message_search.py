@@ -0,0 +1,34 @@
+from django.db import migrations
+
+# The mirror only exists on SQLite; other databases search through Supabase
+CREATE = [
+    'CREATE TABLE IF NOT EXISTS message_search_rows ('
+    'id INTEGER PRIMARY KEY, owner TEXT NOT NULL, session_id TEXT NOT NULL, '
+    'role TEXT NOT NULL, content TEXT NOT NULL, created_at TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS message_search_rows_owner_session ON message_search_rows (owner, session_id)',
+    "CREATE VIRTUAL TABLE IF NOT EXISTS message_search USING fts5("
+    "owner, terms, content = '', tokenize = 'porter unicode61')",
+]
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS message_search')
+        schema_editor.execute('DROP TABLE IF EXISTS message_search_rows')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_catalogs'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
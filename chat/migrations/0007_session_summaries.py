@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_session_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationsession',
+            name='described_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversationsession',
+            name='summarized_through',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversationsession',
+            name='summary',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversationsession',
+            name='title_generated',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='SessionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('requested_at', models.DateTimeField()),
+                ('run_after', models.DateTimeField(db_index=True)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='chat.conversationsession')),
+            ],
+            options={
+                'db_table': 'session_jobs',
+                'ordering': ['run_after'],
+            },
+        ),
+    ]
@@ -6,6 +6,36 @@ from django.db import models
 from users.models import UserProfile
 
 
+class Catalog(models.Model):
+    """
+    One version of a user's training-data catalog
+    Versions are immutable; uploading changed content under the same name adds a version
+    """
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='catalogs')
+    name = models.CharField(max_length=255)
+    version = models.PositiveIntegerField()
+    content = models.TextField()
+    content_hash = models.CharField(max_length=64, db_index=True)  # Hash of the normalized content
+    size_bytes = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'catalogs'
+        ordering = ['name', '-version']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name', 'version'], name='catalog_user_name_version'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} v{self.version} - {self.user.email}"
+
+
+class SessionQuerySet(models.QuerySet):
+    def visible(self):
+        """Sessions not cleared, or written to again since they were"""
+        return self.filter(models.Q(deleted_at__isnull=True) | models.Q(updated_at__gt=models.F('deleted_at')))
+
+
 class ConversationSession(models.Model):
     """
     Represents a conversation session (stored in Django for reference)
@@ -14,8 +44,18 @@ class ConversationSession(models.Model):
     session_id = models.CharField(max_length=255, unique=True, db_index=True)
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='sessions')
     title = models.CharField(max_length=255, blank=True, null=True)
+    catalog = models.ForeignKey(Catalog, on_delete=models.SET_NULL, null=True, blank=True, related_name='sessions')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # When the session was last cleared; messages up to then are hidden until purged
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Written by the background summary jobs (chat/summaries.py), never on the turn path
+    summary = models.TextField(blank=True, null=True)
+    title_generated = models.BooleanField(default=False)
+    summarized_through = models.DateTimeField(null=True, blank=True)  # created_at of the last summarized message
+    described_at = models.DateTimeField(null=True, blank=True)  # When the title or summary last changed
+
+    objects = SessionQuerySet.as_manager()
 
     class Meta:
         db_table = 'conversation_sessions'
@@ -25,6 +65,86 @@ class ConversationSession(models.Model):
         return f"{self.session_id} - {self.user.email}"
 
 
+class SessionJob(models.Model):
+    """
+    Pending title and summary work for a session, at most one row per session
+    Completed turns push run_after out (debounce); workers lease a due row
+    with locked_until and delete it when done, unless another turn bumped
+    version meanwhile
+    """
+    session = models.OneToOneField(ConversationSession, on_delete=models.CASCADE, related_name='job')
+    version = models.PositiveIntegerField(default=1)
+    requested_at = models.DateTimeField()  # Oldest request the row stands for
+    run_after = models.DateTimeField(db_index=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        db_table = 'session_jobs'
+        ordering = ['run_after']
+
+    def __str__(self):
+        return f"{self.session_id} due {self.run_after}"
+
+
+class ArchivedMessageBatch(models.Model):
+    """
+    Raw message rows moved out of Supabase by the compact_messages command
+    Stored compressed as JSONL so history can still page into them
+    """
+    CODEC_GZIP = 'gzip'
+    CODEC_ZSTD = 'zstd'
+    CODEC_CHOICES = [(CODEC_GZIP, 'gzip'), (CODEC_ZSTD, 'zstd')]
+
+    session_id = models.CharField(max_length=255, db_index=True)
+    user_id = models.CharField(max_length=255, db_index=True)  # Supabase user UUID
+    first_created_at = models.DateTimeField()
+    last_created_at = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    raw_bytes = models.PositiveIntegerField()  # Size of the rows before compression
+    codec = models.CharField(max_length=10, choices=CODEC_CHOICES, default=CODEC_GZIP)
+    payload = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'archived_message_batches'
+        ordering = ['session_id', 'first_created_at']
+        indexes = [
+            models.Index(fields=['user_id', 'session_id', 'last_created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.session_id} - {self.message_count} archived messages"
+
+
+class UsageDaily(models.Model):
+    """
+    Token usage per user, day and model, written by the usage ledger
+    Counters are cumulative for the day; averages are derived from the sums
+    """
+    user_id = models.CharField(max_length=255, db_index=True)  # Supabase user UUID
+    day = models.DateField()
+    model = models.CharField(max_length=100)
+    requests = models.PositiveIntegerField(default=0)
+    truncated_requests = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    cached_prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+    latency_ms_total = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'usage_daily'
+        ordering = ['-day', 'model']
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'day', 'model'], name='usage_daily_user_day_model'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day} {self.model}: {self.prompt_tokens + self.completion_tokens} tokens"
+
+
 # Note: Message data is stored in Supabase tables, not Django DB
 # Supabase table structure:
 #
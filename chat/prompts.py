@@ -0,0 +1,115 @@
+"""
+Canonical prompt assembly shared by the Django and FastAPI services
+
+Content is ordered stable-first: the service's persona and rules, then the
+training-data block identified by its content hash, then the conversation
+history. Training data is whitespace-normalized, so sessions that use the
+same catalog send byte-identical prefixes and provider-side prompt caching
+can reuse them. The turns themselves are sent as the user wrote them.
+
+This module has no Django imports so app.py can use it too.
+"""
+import hashlib
+import re
+from functools import lru_cache
+
+# Persona of the Django API without training data
+ASSISTANT_PROMPT = "You are a helpful assistant. Provide concise, plain text responses without markdown formatting."
+
+# Persona of the Django API when answering from training data
+ASSISTANT_RULES = """You are a helpful assistant. Use the information provided below to answer questions.
+
+Rules:
+1. ONLY answer using the provided information
+2. Use plain text, NO markdown formatting
+3. Keep responses to 1-2 sentences maximum
+4. Be conversational and helpful"""
+
+# Persona of the FastAPI car sales service (app.py)
+CAR_SALES_RULES = """You are a car sales assistant. CRITICAL RULES:
+1. ONLY answer questions using the car data provided below
+2. If asked about something NOT in the data, say "I only have information about the cars listed"
+3. Answer in plain text, NO markdown, NO tables, NO bullets, NO formatting (no **, *, _, |)
+4. Keep answers SHORT (1-2 sentences max)
+5. Be conversational and helpful"""
+
+# persona -> (prompt without training data, rules leading the training data)
+PERSONAS = {
+    'assistant': (ASSISTANT_PROMPT, ASSISTANT_RULES),
+    'car_sales': (CAR_SALES_RULES, CAR_SALES_RULES),
+}
+
+_TRAILING_SPACE = re.compile(r'[ \t]+$', re.MULTILINE)
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+
+def normalize_whitespace(text: str) -> str:
+    """Normalize line endings, trailing spaces and runs of blank lines"""
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = _TRAILING_SPACE.sub('', text)
+    text = _BLANK_LINES.sub('\n\n', text)
+    return text.strip()
+
+
+def content_hash(text: str) -> str:
+    """Short stable digest used to identify a training-data block"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+# Catalog sessions store this reference as their system row instead of the
+# catalog text; the prompt is rebuilt from the cached catalog when loaded
+CATALOG_REFERENCE_PREFIX = 'Catalog reference: '
+_CATALOG_REFERENCE = re.compile(re.escape(CATALOG_REFERENCE_PREFIX) + r'(\d+)$')
+
+
+def catalog_reference(catalog_id) -> str:
+    """System row content standing for the prompt of a catalog version"""
+    return f'{CATALOG_REFERENCE_PREFIX}{catalog_id}'
+
+
+def referenced_catalog(content: str):
+    """Catalog id of a system row written by catalog_reference(), or None"""
+    match = _CATALOG_REFERENCE.match(content)
+    return int(match.group(1)) if match else None
+
+
+_DATA_HEADER = re.compile(r'\n\nDATA \[([0-9a-f]{16})\]:\n')
+
+
+@lru_cache(maxsize=256)
+def _data_block(normalized: str) -> str:
+    return f"DATA [{content_hash(normalized)}]:\n{normalized}"
+
+
+def data_blocks(system_prompt: str) -> list:
+    """
+    Training-data blocks of a system prompt built by build_system_prompt()
+
+    Returns:
+        list: (content hash, normalized text) pairs in prompt order
+    """
+    parts = _DATA_HEADER.split(system_prompt)
+    return list(zip(parts[1::2], parts[2::2]))
+
+
+def build_system_prompt(training_data=None, persona: str = 'assistant') -> str:
+    """
+    Build the system prompt: the persona's rules first, then training-data blocks
+
+    Args:
+        training_data: A string, a list of strings, or None. Multiple blocks are
+            ordered by content hash so the same set always yields the same bytes.
+        persona: Key of PERSONAS; 'assistant' for the Django API, 'car_sales' for app.py
+    """
+    base_prompt, rules = PERSONAS[persona]
+    if not training_data:
+        return base_prompt
+    if isinstance(training_data, str):
+        training_data = [training_data]
+
+    blocks = {normalize_whitespace(block) for block in training_data if block and block.strip()}
+    if not blocks:
+        return base_prompt
+    ordered = sorted(blocks, key=content_hash)
+    return rules + '\n\n' + '\n\n'.join(_data_block(block) for block in ordered)
+
@@ -0,0 +1,291 @@
+"""
+Full-text search over a user's conversations
+With SEARCH_BACKEND=local (the default) messages are mirrored into an
+SQLite FTS5 table as they are persisted; with SEARCH_BACKEND=supabase
+queries go to the search_messages() function from supabase_setup.sql,
+which uses a tsvector/GIN index and runs under RLS.
+
+The local mirror indexes every word as a per-user term, <key>x<word>
+with a short key hashed from the user, so a query reads only its user's
+postings: a common word or a short prefix costs about the same with a
+hundred users as with a million messages. The index is contentless;
+messages are kept in a plain table next to it and snippets are
+highlighted here. Every query also requires the row's exact owner token,
+which keeps users apart when two keys collide.
+System messages (prompts and training data) are not indexed.
+"""
+import base64
+import hashlib
+import html
+import logging
+import re
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from safycore_backend import metrics
+from safycore_backend.resilience import execute
+from .models import ConversationSession
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'message_search'
+ROWS_TABLE = 'message_search_rows'
+SNIPPET_TOKENS = 16
+
+# As created by migration chat.0005_message_search
+INDEX_DDL = [
+    f'CREATE TABLE IF NOT EXISTS {ROWS_TABLE} ('
+    'id INTEGER PRIMARY KEY, owner TEXT NOT NULL, session_id TEXT NOT NULL, '
+    'role TEXT NOT NULL, content TEXT NOT NULL, created_at TEXT NOT NULL)',
+    f'CREATE INDEX IF NOT EXISTS {ROWS_TABLE}_owner_session ON {ROWS_TABLE} (owner, session_id)',
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    "owner, terms, content = '', tokenize = 'porter unicode61')",
+]
+INSERT_ROW_SQL = (
+    f'INSERT INTO {ROWS_TABLE} (owner, session_id, role, content, created_at) VALUES (%s, %s, %s, %s, %s)'
+)
+INSERT_TERMS_SQL = f'INSERT INTO {SEARCH_TABLE} (rowid, owner, terms) VALUES (%s, %s, %s)'
+# Contentless rows are removed by passing the values they were indexed with
+DELETE_TERMS_SQL = (
+    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, owner, terms) VALUES ('delete', %s, %s, %s)"
+)
+# Only the most recent matches are ranked, so a word in most of a long
+# history does not score every one of its messages
+RANK_CANDIDATES = 2000
+SEARCH_SQL = (
+    f'SELECT r.content, r.session_id, r.role, r.created_at FROM ('
+    f'SELECT rowid, rank FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+    f'ORDER BY rowid DESC LIMIT {RANK_CANDIDATES}'
+    f') s JOIN {ROWS_TABLE} r ON r.id = s.rowid ORDER BY s.rank LIMIT %s OFFSET %s'
+)
+
+# Words as the unicode61 tokenizer splits them; quoting every term keeps
+# FTS5 operators in user input from being parsed
+_WORDS = re.compile(r'[^\W_]+', re.UNICODE)
+
+
+def search_backend() -> str:
+    """The configured backend; the local mirror needs SQLite"""
+    if settings.SEARCH_BACKEND == 'local' and connection.vendor != 'sqlite':
+        return 'supabase'
+    return settings.SEARCH_BACKEND
+
+
+def owner_token(user_id) -> str:
+    """Single FTS token naming the owner of a row"""
+    return 'u' + re.sub(r'[\W_]', '', str(user_id)).lower()
+
+
+def term_key(owner: str) -> str:
+    """Short per-user prefix of indexed terms; 40 bits, so collisions are rare but possible"""
+    return 'k' + base64.b32encode(hashlib.blake2b(owner.encode(), digest_size=5).digest()).decode().lower()
+
+
+def owner_terms(owner: str, content: str) -> str:
+    """The indexed terms column: every word of content prefixed with its owner's key"""
+    key = term_key(owner)
+    return ' '.join(f'{key}x{word}' for word in _WORDS.findall(content.lower()))
+
+
+def match_expression(user_id, query: str):
+    """
+    FTS5 MATCH expression for a user's query, or None if it has no terms
+    All terms must match; the last one also matches as a prefix
+    """
+    owner = owner_token(user_id)
+    words = _WORDS.findall(query.lower())
+    if not words:
+        return None
+    key = term_key(owner)
+    quoted = [f'"{key}x{word}"' for word in words]
+    quoted[-1] += '*'
+    return f'owner:{owner} AND terms:({" ".join(quoted)})'
+
+
+def _matches(word: str, terms, prefix: str) -> bool:
+    """
+    Whether a content word should be marked for a query
+    Approximates the stemmer: words sharing all but a short suffix with a
+    term (price/prices, run/running) are marked
+    """
+    if prefix and word.startswith(prefix):
+        return True
+    for term in terms:
+        common = len(term) if word.startswith(term) else len(_common_prefix(word, term))
+        if common >= 3 and common >= min(len(word), len(term)) - 2:
+            return True
+    return False
+
+
+def _common_prefix(a: str, b: str) -> str:
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return a[:i]
+    return a[:min(len(a), len(b))]
+
+
+def highlight(content: str, query: str, tokens: int = SNIPPET_TOKENS) -> str:
+    """
+    The window of about `tokens` words of content with the most query
+    matches, with matches wrapped in <mark> and cuts marked by an ellipsis
+
+    Content is HTML-escaped, so the <mark> tags are the only markup
+    """
+    words = list(_WORDS.finditer(content))
+    if not words:
+        return html.escape(content)
+    terms = _WORDS.findall(query.lower())
+    prefix = terms[-1] if terms else ''
+    hits = [i for i, word in enumerate(words) if _matches(word.group().lower(), terms, prefix)]
+
+    # Start a word or two before the hit that puts most hits in the window
+    start = 0
+    if hits:
+        start = max(
+            (max(0, hit - 2) for hit in hits),
+            key=lambda begin: (sum(1 for hit in hits if begin <= hit < begin + tokens), -begin)
+        )
+    end = min(len(words), start + tokens)
+    start = max(0, min(start, end - tokens))
+
+    parts = ['…'] if start else []
+    position = words[start].start() if start else 0
+    for i in hits:
+        if start <= i < end:
+            word = words[i]
+            parts += [html.escape(content[position:word.start()]), '<mark>', html.escape(word.group()), '</mark>']
+            position = word.end()
+    if end < len(words):
+        parts += [html.escape(content[position:words[end - 1].end()]), '…']
+    else:
+        parts.append(html.escape(content[position:]))
+    return ''.join(parts)
+
+
+def index_messages(rows) -> None:
+    """
+    Mirror persisted message rows into the local index
+    Best effort: a failure is logged and counted, never raised, because the
+    messages are already stored in Supabase
+    """
+    if search_backend() != 'local':
+        return
+    now = timezone.now().isoformat()
+    rows = [row for row in rows if row.get('role') != 'system' and row.get('content')]
+    if not rows:
+        return
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            for row in rows:
+                owner = owner_token(row['user_id'])
+                cursor.execute(INSERT_ROW_SQL, [
+                    owner, row['session_id'], row['role'], row['content'], row.get('created_at') or now
+                ])
+                cursor.execute(INSERT_TERMS_SQL, [cursor.lastrowid, owner, owner_terms(owner, row['content'])])
+        metrics.incr('search.indexed', len(rows))
+    except DatabaseError as e:
+        metrics.incr('search.index_failures')
+        logger.warning('Could not index %d messages: %s', len(rows), e)
+
+
+def unindex_session(user_id, session_id) -> None:
+    """
+    Drop a cleared session from the local index
+    Best effort like index_messages(): the session is already marked
+    cleared, and search() hides its messages either way
+    """
+    if search_backend() != 'local':
+        return
+    owner = owner_token(user_id)
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id, content FROM {ROWS_TABLE} WHERE owner = %s AND session_id = %s',
+                [owner, session_id]
+            )
+            indexed = cursor.fetchall()
+            cursor.executemany(DELETE_TERMS_SQL, [
+                (row_id, owner, owner_terms(owner, content)) for row_id, content in indexed
+            ])
+            cursor.execute(f'DELETE FROM {ROWS_TABLE} WHERE owner = %s AND session_id = %s', [owner, session_id])
+    except DatabaseError as e:
+        metrics.incr('search.unindex_failures')
+        logger.warning('Could not unindex session %s: %s', session_id, e)
+
+
+def search_local(user_id, query: str, limit: int, offset: int) -> list:
+    expression = match_expression(user_id, query)
+    if expression is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_SQL, [expression, limit, offset])
+        return [
+            {'session_id': session_id, 'role': role, 'snippet': highlight(content, query), 'created_at': created_at}
+            for content, session_id, role, created_at in cursor.fetchall()
+        ]
+
+
+def search_supabase(supabase, query: str, limit: int, offset: int) -> list:
+    rows = execute(supabase.rpc('search_messages', {
+        'q': query, 'max_results': limit, 'skip': offset
+    }), read=True).data or []
+    return [{
+        'session_id': row['session_id'],
+        'role': row['role'],
+        'snippet': row['snippet'],
+        'created_at': row['created_at'],
+    } for row in rows]
+
+
+def search(supabase, user_id, query: str, limit: int = 20, offset: int = 0) -> dict:
+    """
+    One page of a user's matching messages, best match first
+
+    Returns:
+        dict: results (session_id, role, snippet, created_at) and
+            next_offset, which is None on the last page
+    """
+    start = time.perf_counter()
+    if search_backend() == 'local':
+        results = search_local(user_id, query, limit + 1, offset)
+    else:
+        results = search_supabase(supabase, query, limit + 1, offset)
+    metrics.observe('search.query', time.perf_counter() - start)
+    has_more = len(results) > limit
+    return {
+        'results': hide_cleared(user_id, results[:limit]),
+        'next_offset': offset + limit if has_more else None,
+    }
+
+
+def hide_cleared(user_id, results) -> list:
+    """
+    Drop results from cleared sessions that are not purged yet
+
+    Clearing only marks the session in Django; Supabase keeps the rows
+    until the background purge, and search_messages() cannot see the mark.
+    Messages sent after the clear are kept.
+    """
+    cleared = dict(ConversationSession.objects.filter(
+        user__user_id=str(user_id),
+        session_id__in={result['session_id'] for result in results},
+        deleted_at__isnull=False
+    ).values_list('session_id', 'deleted_at'))
+    if not cleared:
+        return results
+    return [
+        result for result in results
+        if result['session_id'] not in cleared
+        or _sent_after(result['created_at'], cleared[result['session_id']])
+    ]
+
+
+def _sent_after(created_at, cutoff) -> bool:
+    if not isinstance(created_at, datetime):
+        created_at = parse_datetime(created_at or '')
+    return created_at is not None and created_at > cutoff
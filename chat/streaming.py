@@ -0,0 +1,77 @@
+"""
+Coalescing of streamed reply deltas
+Groq sends a delta every token or two; writing each one costs a send() per
+delta and proxies re-buffer the tiny chunks anyway. A Coalescer sends the
+first delta at once, so time to first token is unchanged, then buffers
+until STREAM_FLUSH_BYTES or STREAM_FLUSH_MS is reached and flushes up to
+the last word boundary, keeping the partial word for the next chunk.
+
+The delay is checked as deltas arrive; a pause in generation holds the
+buffer until the next delta or the end of the stream.
+
+This module has no Django imports so app.py can use it too.
+"""
+import os
+import time
+
+# Flush once this many bytes are buffered, or this long after the last flush;
+# STREAM_FLUSH_BYTES=0 writes every delta as it arrives
+STREAM_FLUSH_BYTES = int(os.getenv('STREAM_FLUSH_BYTES', '256'))
+STREAM_FLUSH_MS = float(os.getenv('STREAM_FLUSH_MS', '50'))
+
+
+class Coalescer:
+    """
+    Word-aligned delta buffer for one stream
+
+    Args:
+        max_bytes: Buffered bytes that force a flush; 0 disables coalescing
+        max_delay: Seconds since the last flush that force a flush
+        clock: Monotonic clock, replaceable for benchmarks
+    """
+    __slots__ = ('max_bytes', 'max_delay', 'clock', '_parts', '_size', '_flushed_at')
+
+    def __init__(self, max_bytes: int = STREAM_FLUSH_BYTES, max_delay: float = STREAM_FLUSH_MS / 1000,
+                 clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.clock = clock
+        self._parts = []
+        self._size = 0
+        self._flushed_at = None
+
+    def add(self, delta: str):
+        """Buffer a delta; returns the text to send now, or None"""
+        if not self.max_bytes:
+            return delta
+        if self._flushed_at is None:
+            # First token goes out immediately
+            self._flushed_at = self.clock()
+            return delta
+
+        self._parts.append(delta)
+        self._size += len(delta) if delta.isascii() else len(delta.encode())
+        if self._size < self.max_bytes and self.clock() - self._flushed_at < self.max_delay:
+            return None
+
+        text = ''.join(self._parts)
+        cut = max(text.rfind(' '), text.rfind('\n')) + 1
+        if not cut and self._size < 2 * self.max_bytes:
+            # One unfinished word; wait for its end unless it keeps growing
+            self._parts = [text]
+            return None
+        if not cut or cut == len(text):
+            chunk, rest = text, ''
+        else:
+            chunk, rest = text[:cut], text[cut:]
+        self._parts = [rest] if rest else []
+        self._size = len(rest.encode()) if rest else 0
+        self._flushed_at = self.clock()
+        return chunk
+
+    def flush(self) -> str:
+        """Everything still buffered, at the end of the stream"""
+        text = ''.join(self._parts)
+        self._parts = []
+        self._size = 0
+        return text
@@ -0,0 +1,364 @@
+"""
+Session titles and rolling summaries
+A completed turn only records that its session needs describing: one
+SessionJob row per session, whose run_after every further turn pushes out
+(debounce, capped by SESSION_SUMMARY_MAX_WAIT_SECONDS). Worker threads in
+each process lease due rows, summarize the messages added since the last
+summary into the previous one with a single Groq call, and write the title
+(once) and the summary to the session. The session list then serves them
+as stored, so no turn waits on a second completion.
+
+The table is the queue, so pending jobs survive restarts and no broker is
+needed; run_session_jobs drains it outside the web processes. Calls are
+rate limited per process and per session (SESSION_SUMMARY_MIN_INTERVAL_SECONDS).
+Jobs read messages with the service-role client, scoped by user_id, and
+are skipped when SUPABASE_SERVICE_KEY is not set.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from safycore_backend import diagnostics, metrics
+from safycore_backend.groq_client import create_chat_completion, record_usage
+from safycore_backend.resilience import deadline_scope, execute
+from safycore_backend.supabase_client import get_supabase_admin_client
+from .models import ConversationSession, SessionJob
+from .usage import ledger
+
+logger = logging.getLogger(__name__)
+
+DESCRIBE_PROMPT = (
+    'You name and summarize conversations for a chat history list. '
+    'Reply with exactly two lines: "Title: " followed by a title of at most 6 words, '
+    'then "Summary: " followed by at most 3 plain-text sentences covering the whole conversation, '
+    'including the summary so far. Keep names, numbers and decisions.'
+)
+MAX_TITLE_LENGTH = 80
+# Newest messages read per job, and characters kept of each
+MAX_MESSAGES = 40
+MAX_MESSAGE_CHARS = 1000
+MAX_COMPLETION_TOKENS = 200
+
+# A leased job whose worker died becomes due again after this long
+LEASE_SECONDS = 120
+# Failed jobs are retried with exponential backoff, then dropped
+MAX_ATTEMPTS = 5
+RETRY_SECONDS = 30
+# Idle workers look for jobs of other processes this often
+POLL_SECONDS = 30
+
+
+def _due(now, requested_at, conversation):
+    """When a job requested at requested_at and bumped now may run"""
+    run_after = min(
+        now + timedelta(seconds=settings.SESSION_SUMMARY_DEBOUNCE_SECONDS),
+        requested_at + timedelta(seconds=settings.SESSION_SUMMARY_MAX_WAIT_SECONDS),
+    )
+    if conversation.described_at is not None:
+        run_after = max(
+            run_after, conversation.described_at + timedelta(seconds=settings.SESSION_SUMMARY_MIN_INTERVAL_SECONDS)
+        )
+    return run_after
+
+
+def request_summary(conversation) -> None:
+    """
+    Ask for a session's title and summary to be brought up to date
+    One indexed read and one write on the turn path; never raises
+    """
+    if not settings.SESSION_SUMMARIES or not settings.SUPABASE_SERVICE_KEY:
+        return
+    now = timezone.now()
+    jobs = SessionJob.objects.filter(session=conversation)
+    try:
+        requested_at = jobs.values_list('requested_at', flat=True).first()
+        created = False
+        if requested_at is None:
+            try:
+                with transaction.atomic():
+                    SessionJob.objects.create(session=conversation, requested_at=now,
+                                              run_after=_due(now, now, conversation))
+                created = True
+            except IntegrityError:
+                # Another turn of the session created it first
+                requested_at = now
+        if not created:
+            jobs.update(version=F('version') + 1, run_after=_due(now, requested_at, conversation))
+    except DatabaseError as e:
+        metrics.incr('session_jobs.request_failures')
+        logger.warning('Could not queue summary of %s: %s', conversation.session_id, e)
+        return
+
+    metrics.incr('session_jobs.requested')
+    queue.start()
+    queue.wake()
+
+
+def parse_description(text: str) -> tuple:
+    """
+    (title, summary) from a "Title: ...", "Summary: ..." reply
+    An unlabeled reply is taken as the summary, with no title
+    """
+    title = summary = None
+    for line in text.splitlines():
+        label, _, value = line.partition(':')
+        label = label.strip(' *#').lower()
+        if label == 'title' and title is None:
+            title = value
+        elif label == 'summary' and summary is None:
+            summary = value
+        elif summary is not None and line.strip():
+            summary += ' ' + line
+    if title is None and summary is None:
+        summary = text
+    if title is not None:
+        title = title.strip(' *"\'').rstrip('.')[:MAX_TITLE_LENGTH] or None
+    if summary is not None:
+        summary = ' '.join(summary.replace('*', '').split()) or None
+    return title, summary
+
+
+def describe(user_id, previous_summary, rows) -> tuple:
+    """
+    Title and summary of a conversation from its previous summary and newer messages
+
+    Returns:
+        tuple: (title or None, summary or None)
+    """
+    transcript = '\n'.join(f"{row['role']}: {row['content'][:MAX_MESSAGE_CHARS]}" for row in rows)
+    if previous_summary:
+        transcript = f'Summary so far: {previous_summary}\n\nNewer messages:\n{transcript}'
+
+    start = time.monotonic()
+    completion = create_chat_completion(
+        messages=[
+            {'role': 'system', 'content': DESCRIBE_PROMPT},
+            {'role': 'user', 'content': transcript},
+        ],
+        model=settings.SESSION_SUMMARY_MODEL,
+        temperature=0.2,
+        max_completion_tokens=MAX_COMPLETION_TOKENS,
+        stream=False
+    )
+    usage = getattr(completion, 'usage', None)
+    record_usage(usage)
+    ledger.record(user_id, settings.SESSION_SUMMARY_MODEL, usage, time.monotonic() - start)
+    return parse_description(completion.choices[0].message.content or '')
+
+
+def describe_session(supabase, session) -> bool:
+    """
+    Fold the messages added since the last summary into the session's summary,
+    and give the session a title if it has none yet
+
+    Returns:
+        bool: Whether anything was written
+    """
+    since = max((moment for moment in (session.summarized_through, session.deleted_at) if moment), default=None)
+    # user_id scopes the service-role client as RLS would
+    query = supabase.table('messages').select('role,content,created_at').eq(
+        'user_id', session.user.user_id
+    ).eq('session_id', session.session_id).in_('role', ['user', 'assistant'])
+    if since is not None:
+        query = query.gt('created_at', since.isoformat())
+    rows = execute(query.order('created_at', desc=True).limit(MAX_MESSAGES), read=True).data or []
+    if not rows:
+        return False
+    rows.reverse()
+
+    title, summary = describe(session.user.user_id, session.summary, rows)
+    fields = {
+        'summarized_through': parse_datetime(rows[-1]['created_at']),
+        'described_at': timezone.now(),
+    }
+    if summary:
+        fields['summary'] = summary
+    if title and not session.title_generated:
+        fields.update(title=title, title_generated=True)
+    # update() leaves updated_at alone, so the session keeps its place in the
+    # list; a clear since the read changed deleted_at and discards the result
+    return ConversationSession.objects.filter(pk=session.pk, deleted_at=session.deleted_at).update(**fields) > 0
+
+
+class SummaryQueue:
+    """
+    Runs due SessionJob rows on a small thread pool
+
+    A dispatcher thread starts with the first request in the process. It
+    leases one due row at a time while a worker and a rate token are free,
+    then sleeps until the next row is due, a worker finishes or a request
+    arrives, and at most POLL_SECONDS.
+    """
+
+    def __init__(self, workers: int, rate_per_minute: float):
+        self.workers = workers
+        self._rate = rate_per_minute / 60
+        self._capacity = max(1, workers)
+        self._tokens = float(self._capacity)
+        self._refilled = time.monotonic()
+        self._slots = threading.BoundedSemaphore(max(1, workers))
+        self._running = 0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._executor = None
+        self._client = None
+
+    def start(self) -> None:
+        """Start the dispatcher; with no workers jobs wait for run_session_jobs"""
+        if self._thread is not None or self.workers <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='session-summary')
+            self._thread = threading.Thread(target=self._run, name='session-summary-dispatcher', daemon=True)
+            self._thread.start()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def running(self) -> int:
+        return self._running
+
+    def supabase(self):
+        if self._client is None:
+            self._client = get_supabase_admin_client()
+        return self._client
+
+    def run_due(self) -> int:
+        """
+        Run every due job in the calling thread, honouring the rate limit
+
+        Returns:
+            int: Number of jobs run
+        """
+        ran = 0
+        while True:
+            delay = self._token_delay()
+            if delay:
+                time.sleep(delay)
+                continue
+            job = self._claim()
+            if job is None:
+                return ran
+            self._tokens -= 1
+            self._process(*job)
+            ran += 1
+
+    def _token_delay(self) -> float:
+        """Seconds until the rate limit allows another call"""
+        if self._rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._refilled) * self._rate)
+        self._refilled = now
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self._rate
+
+    def _claim(self):
+        """Lease the next due job; returns (pk, version) or None"""
+        now = timezone.now()
+        free = Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+        for pk, version in SessionJob.objects.filter(free, run_after__lte=now).values_list('pk', 'version')[:5]:
+            # The conditional update is the lease; another process may win it
+            if SessionJob.objects.filter(free, pk=pk).update(locked_until=now + timedelta(seconds=LEASE_SECONDS)):
+                return pk, version
+        return None
+
+    def _next_due(self) -> float:
+        """Seconds until the next unleased job is due, at most POLL_SECONDS"""
+        now = timezone.now()
+        due = SessionJob.objects.filter(
+            Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+        ).aggregate(due=Min('run_after'))['due']
+        if due is None:
+            return POLL_SECONDS
+        return min(POLL_SECONDS, max(0.05, (due - now).total_seconds()))
+
+    def _dispatch(self) -> float:
+        """Start as many due jobs as workers and the rate allow; returns seconds to sleep"""
+        while self._slots.acquire(blocking=False):
+            delay = self._token_delay()
+            job = None if delay else self._claim()
+            if job is None:
+                self._slots.release()
+                return delay or self._next_due()
+            self._tokens -= 1
+            with self._lock:
+                self._running += 1
+            self._executor.submit(self._work, *job)
+        # Every worker is busy; the next one to finish wakes the dispatcher
+        return POLL_SECONDS
+
+    def _run(self):
+        while True:
+            wait = POLL_SECONDS
+            try:
+                wait = self._dispatch()
+            except Exception as e:
+                logger.warning('Could not dispatch session jobs: %s', e)
+            finally:
+                close_old_connections()
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def _work(self, pk, version):
+        try:
+            self._process(pk, version)
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._slots.release()
+            self._wake.set()
+            close_old_connections()
+
+    def _process(self, pk, version):
+        try:
+            job = SessionJob.objects.select_related('session__user').get(pk=pk)
+        except SessionJob.DoesNotExist:
+            # Its session was deleted
+            return
+
+        start = time.perf_counter()
+        try:
+            with deadline_scope():
+                describe_session(self.supabase(), job.session)
+        except Exception as e:
+            self._failed(job, e)
+            return
+        metrics.observe('session_jobs.run', time.perf_counter() - start)
+        metrics.incr('session_jobs.completed')
+
+        if not SessionJob.objects.filter(pk=pk, version=version).delete()[0]:
+            # Turns completed while it ran; describe them once the session's interval is up
+            now = timezone.now()
+            SessionJob.objects.filter(pk=pk).update(
+                locked_until=None, attempts=0, last_error='', requested_at=now,
+                run_after=now + timedelta(seconds=settings.SESSION_SUMMARY_MIN_INTERVAL_SECONDS)
+            )
+
+    def _failed(self, job, error):
+        metrics.incr('session_jobs.failures')
+        attempts = job.attempts + 1
+        if attempts >= MAX_ATTEMPTS:
+            metrics.incr('session_jobs.dropped')
+            logger.warning('Dropping summary of %s after %d attempts: %s', job.session.session_id, attempts, error)
+            SessionJob.objects.filter(pk=job.pk).delete()
+            return
+        logger.info('Summary of %s failed, retrying: %s', job.session.session_id, error)
+        SessionJob.objects.filter(pk=job.pk).update(
+            locked_until=None, attempts=attempts, last_error=str(error)[:1000],
+            run_after=timezone.now() + timedelta(seconds=RETRY_SECONDS * 2 ** (attempts - 1))
+        )
+
+
+queue = SummaryQueue(settings.SESSION_SUMMARY_WORKERS, settings.SESSION_SUMMARY_RATE_PER_MINUTE)
+diagnostics.register('session_jobs.running', queue.running)
@@ -1,3 +1,113 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from safycore_backend.limiter import AdaptiveLimiter, Overloaded
+from safycore_backend.routing import HashRing
+
+
+class FakeClock:
+    """Stands in for the time module so service times are exact"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+class AdaptiveLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('safycore_backend.limiter.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Four slots, one of them reserved for continuing sessions
+        self.limiter = AdaptiveLimiter('test', initial=4, min_limit=2, max_limit=16,
+                                       queue_target=0.5, reserve=0.25, enabled=True)
+
+    def turn(self, seconds, continuing=True):
+        ticket = self.limiter.acquire(continuing, wait=False)
+        self.clock.now += seconds
+        ticket.release()
+
+    def test_sheds_new_sessions_before_continuing_ones(self):
+        tickets = [self.limiter.acquire(False, wait=False) for _ in range(3)]
+
+        with self.assertRaises(Overloaded):
+            self.limiter.acquire(False, wait=False)
+        tickets.append(self.limiter.acquire(True, wait=False))
+        with self.assertRaises(Overloaded) as shed:
+            self.limiter.acquire(True, wait=False)
+        self.assertGreaterEqual(shed.exception.retry_after, 1)
+
+        for ticket in tickets:
+            ticket.release()
+        self.assertEqual(self.limiter.inflight, 0)
+        self.limiter.acquire(False, wait=False).release()
+
+    def test_sheds_turns_queued_past_the_target(self):
+        with self.assertRaises(Overloaded):
+            self.limiter.acquire(True, queued=1.0)
+        self.assertEqual(self.limiter.inflight, 0)
+
+    def test_limit_shrinks_under_slow_turns_and_recovers(self):
+        self.turn(1.0)
+        unloaded = self.limiter.limit
+
+        for _ in range(10):
+            self.turn(4.0)
+        slowed = self.limiter.limit
+        self.assertLess(slowed, unloaded)
+
+        for _ in range(30):
+            self.turn(1.0)
+        self.assertGreater(self.limiter.limit, unloaded)
+        self.assertLessEqual(self.limiter.limit, self.limiter.max_limit)
+
+    def test_release_is_idempotent(self):
+        ticket = self.limiter.acquire(True, wait=False)
+        ticket.release()
+        ticket.release()
+        self.assertEqual(self.limiter.inflight, 0)
+
+
+class HashRingTests(SimpleTestCase):
+    NODES = ['api-0', 'api-1', 'api-2', 'api-3']
+    SESSIONS = [f'session-{i}' for i in range(4000)]
+
+    def owners(self, ring):
+        return {session: ring.node_for(session) for session in self.SESSIONS}
+
+    def test_routing_is_stable_for_a_session(self):
+        ring = HashRing(self.NODES)
+        rebuilt = HashRing(reversed(self.NODES))
+        for session in self.SESSIONS[:100]:
+            self.assertEqual(ring.node_for(session), ring.node_for(session))
+            self.assertEqual(ring.node_for(session), rebuilt.node_for(session))
+        self.assertIsNone(HashRing().node_for('session-0'))
+
+    def test_adding_a_node_moves_about_one_nth_of_sessions(self):
+        ring = HashRing(self.NODES)
+        before = self.owners(ring)
+        ring.add('api-4')
+        after = self.owners(ring)
+
+        moved = [session for session in self.SESSIONS if before[session] != after[session]]
+        # Only sessions the new node takes over move, about 1/5 of them
+        self.assertTrue(all(after[session] == 'api-4' for session in moved))
+        self.assertAlmostEqual(len(moved) / len(self.SESSIONS), 1 / 5, delta=0.05)
+
+    def test_removing_a_node_moves_only_its_sessions(self):
+        ring = HashRing(self.NODES)
+        before = self.owners(ring)
+        ring.remove('api-1')
+        after = self.owners(ring)
+
+        moved = [session for session in self.SESSIONS if before[session] != after[session]]
+        self.assertTrue(all(before[session] == 'api-1' for session in moved))
+        self.assertNotIn('api-1', after.values())
+        self.assertAlmostEqual(len(moved) / len(self.SESSIONS), 1 / 4, delta=0.05)
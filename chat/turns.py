@@ -0,0 +1,345 @@
+"""
+Chat turn steps shared by the HTTP views and the WebSocket channel
+"""
+import logging
+import re
+import time
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from safycore_backend import diagnostics
+from safycore_backend.groq_client import cancel_stream, create_chat_completion, record_usage, usage_from_chunk
+from safycore_backend.limiter import chat_limiter
+from safycore_backend.resilience import deadline_scope, execute
+from .catalog import catalog_cache, direct_answer
+from .models import Catalog, ConversationSession
+from .messages import MESSAGE_COLUMNS, HistoryCache, Message, Role, to_payload
+from .prompts import build_system_prompt, catalog_reference, referenced_catalog
+from .search import index_messages
+from .streaming import Coalescer
+from .summaries import request_summary
+from .usage import estimate_prompt_tokens, ledger
+
+logger = logging.getLogger(__name__)
+
+# Model and completion budget of a chat reply
+CHAT_MODEL = "openai/gpt-oss-120b"
+MAX_COMPLETION_TOKENS = 100
+
+# Histories of sessions this node served recently, keyed by (user pk, session_id)
+hot_history = HistoryCache()
+diagnostics.register('hot_history.sessions', hot_history.__len__)
+
+MARKDOWN_PATTERNS = [
+    (re.compile(r'\*\*(.+?)\*\*'), r'\1'),
+    (re.compile(r'\*(.+?)\*'), r'\1'),
+    (re.compile(r'__(.+?)__'), r'\1'),
+    (re.compile(r'_(.+?)_'), r'\1'),
+    (re.compile(r'^\s*[-*+]\s+', re.MULTILINE), ''),
+    (re.compile(r'^\s*\d+\.\s+', re.MULTILINE), ''),
+    (re.compile(r'\|(.+?)\|'), r'\1'),
+]
+
+
+def strip_markdown(text: str) -> str:
+    """Remove markdown formatting from text"""
+    for pattern, replacement in MARKDOWN_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+
+def get_catalog(user_profile, catalog_id):
+    """
+    One of the user's catalog versions, without its content
+
+    Raises:
+        Catalog.DoesNotExist: No such catalog for this user
+    """
+    if not str(catalog_id).isdigit():
+        raise Catalog.DoesNotExist(f'Catalog {catalog_id} not found')
+    return Catalog.objects.defer('content').get(pk=catalog_id, user=user_profile)
+
+
+def parse_catalog(catalog):
+    """Parsed content of a catalog version; the content is only read on a cache miss"""
+    return catalog_cache.get(
+        catalog.content_hash,
+        lambda: Catalog.objects.values_list('content', flat=True).get(pk=catalog.pk)
+    )
+
+
+def catalog_prompt(user_profile, catalog_id) -> str:
+    """System prompt of one of the user's catalog versions; the default prompt once it is deleted"""
+    try:
+        training_data = parse_catalog(get_catalog(user_profile, catalog_id)).text
+    except Catalog.DoesNotExist:
+        training_data = None
+    return build_system_prompt(training_data)
+
+
+def expand_catalog_reference(user_profile, history) -> None:
+    """Replace a leading catalog reference row with the prompt built from that version"""
+    if not history or history[0].role is not Role.SYSTEM:
+        return
+    catalog_id = referenced_catalog(history[0].content)
+    if catalog_id is not None:
+        history[0] = Message(Role.SYSTEM, catalog_prompt(user_profile, catalog_id))
+
+
+def expand_catalog_row(user_profile, row: dict) -> dict:
+    """A messages row as clients see it: a catalog reference becomes the prompt it stands for"""
+    if row.get('role') != 'system':
+        return row
+    catalog_id = referenced_catalog(row['content'])
+    if catalog_id is None:
+        return row
+    return {**row, 'content': catalog_prompt(user_profile, catalog_id)}
+
+
+def admit_turn(user_profile, session_id, queued: float = 0.0, wait: bool = True):
+    """
+    Admission ticket for a chat turn; continuing sessions are admitted first
+
+    Args:
+        wait: Wait for a slot; under ASGI sync views share one thread with
+            the streams that hold the slots, so they must not wait
+
+    Raises:
+        Overloaded: The turn was shed
+    """
+    continuing = (user_profile.pk, session_id) in hot_history or ConversationSession.objects.filter(
+        session_id=session_id, user=user_profile
+    ).exists()
+    return chat_limiter.acquire(continuing, queued, wait)
+
+
+def prepare_turn(supabase, user_profile, supabase_user, session_id, message, training_data=None, catalog=None):
+    """
+    Record the user's message and build the Groq payload for the next reply
+
+    Creates the session on first use and stores the system prompt (with the
+    training data) before the first user message.
+
+    Args:
+        catalog: Catalog version to use instead of inline training_data;
+            it is linked to the session and its system row only stores
+            a reference (see expand_catalog_reference())
+
+    Returns:
+        tuple: (ConversationSession, messages for Groq)
+    """
+    if catalog is not None:
+        training_data = parse_catalog(catalog).text
+
+    # Get or create conversation session in Django
+    conversation, created = ConversationSession.objects.get_or_create(
+        session_id=session_id,
+        user=user_profile,
+        defaults={'title': message[:50], 'catalog': catalog}
+    )
+
+    if conversation.deleted_at is not None and conversation.updated_at <= conversation.deleted_at:
+        # First turn since the session was cleared; saving makes it visible again
+        conversation.title = message[:50]
+        conversation.catalog = catalog
+        # Only the turn's own fields; the summary jobs write the others
+        conversation.save(update_fields=['title', 'catalog', 'updated_at'])
+
+    # Sessions routed to this node are usually still hot; anything else, or a
+    # session written elsewhere since, is read from Supabase (RLS filters by user)
+    key = (user_profile.pk, session_id)
+    conversation_history = None if created else hot_history.get(key, conversation.updated_at)
+    if conversation_history is None:
+        query = supabase.table('messages').select(MESSAGE_COLUMNS).eq('session_id', session_id)
+        if conversation.deleted_at is not None:
+            # Cleared messages may not be purged yet
+            query = query.gt('created_at', conversation.deleted_at.isoformat())
+        messages_response = execute(query.order('created_at'), read=True)
+        conversation_history = [Message.from_row(row) for row in messages_response.data or []]
+        expand_catalog_reference(user_profile, conversation_history)
+
+    # Check if this is first message - add training data
+    if not conversation_history and training_data:
+        system_prompt = build_system_prompt(training_data)
+        system_message = {
+            'user_id': supabase_user.id,
+            'session_id': session_id,
+            'role': 'system',
+            # Catalogs are already stored in Django; the row only references the version
+            'content': system_prompt if catalog is None else catalog_reference(catalog.pk)
+        }
+        execute(supabase.table('messages').insert(system_message))
+
+        # Store inline training data in Supabase
+        if catalog is None:
+            training_record = {
+                'user_id': supabase_user.id,
+                'session_id': session_id,
+                'content': training_data
+            }
+            execute(supabase.table('training_data').insert(training_record))
+
+        conversation_history.append(Message(Role.SYSTEM, system_prompt))
+    elif not conversation_history:
+        # Default system message
+        system_message = {
+            'user_id': supabase_user.id,
+            'session_id': session_id,
+            'role': 'system',
+            'content': build_system_prompt()
+        }
+        execute(supabase.table('messages').insert(system_message))
+        conversation_history.append(Message.from_row(system_message))
+
+    # Add user message
+    user_message = {
+        'user_id': supabase_user.id,
+        'session_id': session_id,
+        'role': 'user',
+        'content': message
+    }
+    execute(supabase.table('messages').insert(user_message))
+    index_messages([user_message])
+    conversation_history.append(Message.from_row(user_message))
+    # The message is stored even if no reply follows, so history ETags and
+    # cached bodies must not outlive it
+    conversation.updated_at = timezone.now()
+    ConversationSession.objects.filter(pk=conversation.pk).update(updated_at=conversation.updated_at)
+    # Held for this turn until store_reply() adds the reply
+    hot_history.put(key, conversation, conversation_history)
+
+    # Prepare messages for Groq (stable prefix first for prompt caching)
+    return conversation, to_payload(conversation_history)
+
+
+def stream_reply(supabase, supabase_user, conversation, groq_messages, deadline=None):
+    """
+    Generator yielding the assistant's reply token by token
+    The cleaned reply is stored once the stream completes and is the
+    generator's return value
+
+    If the generator is closed early (the client disconnected or cancelled),
+    the Groq stream is closed at once and the partial reply is stored with
+    truncated=True. Token usage goes to the usage ledger either way.
+    Deltas are coalesced into word-aligned chunks (chat/streaming.py).
+
+    Args:
+        deadline: Deadline captured by the caller; generators run after the
+            request scope that created them has exited
+    """
+    # Scopes never stay open across a yield: under ASGI each chunk is pulled
+    # in a fresh copy of the context, where resetting the scope would fail
+    with deadline_scope(deadline) as deadline:
+        # Simple lookups on a tabular catalog are answered from its index
+        reply = direct_answer(groq_messages)
+    if reply is not None:
+        yield reply
+        with deadline_scope(deadline):
+            return store_reply(supabase, supabase_user, conversation, reply)
+
+    full_response = ""
+    chunks = 0
+    usage = None
+    # Fewer, word-aligned writes; the first token still goes out at once
+    coalescer = Coalescer()
+
+    start = time.monotonic()
+    with deadline_scope(deadline):
+        stream = create_chat_completion(
+            messages=groq_messages,
+            model=CHAT_MODEL,
+            temperature=0.3,
+            max_completion_tokens=MAX_COMPLETION_TOKENS,
+            top_p=0.9,
+            stream=True
+        )
+
+    try:
+        for chunk in stream:
+            chunk_usage = usage_from_chunk(chunk)
+            if chunk_usage is not None:
+                usage = chunk_usage
+                record_usage(usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                content = chunk.choices[0].delta.content
+                full_response += content
+                chunks += 1
+                text = coalescer.add(content)
+                if text:
+                    yield text
+        tail = coalescer.flush()
+        if tail:
+            yield tail
+    except GeneratorExit:
+        cancel_stream(stream, chunks, MAX_COMPLETION_TOKENS)
+        # No usage arrives on a cut stream; the prompt is estimated from its
+        # size and each chunk is about one token
+        ledger.record(supabase_user.id, CHAT_MODEL, usage, time.monotonic() - start, truncated=True,
+                      prompt_estimate=estimate_prompt_tokens(groq_messages), completion_estimate=chunks)
+        try:
+            # The request's budget may be spent already; storing one row gets its own
+            with deadline_scope():
+                store_reply(supabase, supabase_user, conversation, full_response, truncated=True)
+        except Exception as e:
+            logger.warning('Could not store truncated reply for %s: %s', conversation.session_id, e)
+        raise
+
+    ledger.record(supabase_user.id, CHAT_MODEL, usage, time.monotonic() - start)
+    with deadline_scope(deadline):
+        return store_reply(supabase, supabase_user, conversation, full_response)
+
+
+def store_reply(supabase, supabase_user, conversation, full_response, truncated=False):
+    """Clean and store the assistant's reply, then bump the session"""
+    clean_response = strip_markdown(full_response)
+    reply = None
+    if clean_response or not truncated:
+        assistant_message = {
+            'user_id': supabase_user.id,
+            'session_id': conversation.session_id,
+            'role': 'assistant',
+            'content': clean_response
+        }
+        if truncated:
+            # Only sent when set, so inserts work before the column is migrated
+            assistant_message['truncated'] = True
+        execute(supabase.table('messages').insert(assistant_message))
+        index_messages([assistant_message])
+        reply = Message(Role.ASSISTANT, clean_response, truncated)
+
+    # Bump the session; a full save would undo a title or summary written
+    # by a background job since the turn loaded the row
+    conversation.save(update_fields=['updated_at'])
+    hot_history.complete((conversation.user_id, conversation.session_id), conversation,
+                         conversation.updated_at, reply)
+    # Title and summary are generated in the background (chat/summaries.py)
+    request_summary(conversation)
+    return clean_response
+
+
+class AsyncReply:
+    """
+    Serve a reply generator from ASGI one chunk at a time
+
+    Django consumes synchronous iterators in full before sending under
+    ASGI, which delays every token and ignores disconnects. Pulling chunk
+    by chunk streams them, and Django calls close() when the client
+    disconnects, which closes the generator and with it the Groq stream.
+    """
+    _end = object()
+
+    def __init__(self, generator):
+        self.generator = generator
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await sync_to_async(next)(self.generator, self._end)
+        if chunk is self._end:
+            raise StopAsyncIteration
+        return chunk
+
+    def close(self):
+        self.generator.close()
@@ -5,9 +5,17 @@ from django.urls import path
 from .views import (
     ChatView,
     ChatStreamView,
+    BatchChatView,
     ConversationHistoryView,
     ClearConversationView,
-    UserSessionsView
+    DeleteSessionsView,
+    UserSessionsView,
+    SearchView,
+    UsageView,
+    CatalogListView,
+    CatalogDetailView,
+    ExportConversationsView,
+    ImportConversationsView
 )
 
 app_name = 'chat'
@@ -15,7 +23,15 @@ app_name = 'chat'
 urlpatterns = [
     path('', ChatView.as_view(), name='chat'),
     path('stream/', ChatStreamView.as_view(), name='chat_stream'),
+    path('batch/', BatchChatView.as_view(), name='chat_batch'),
     path('sessions/', UserSessionsView.as_view(), name='user_sessions'),
+    path('sessions/delete/', DeleteSessionsView.as_view(), name='delete_sessions'),
     path('conversation/<str:session_id>/', ConversationHistoryView.as_view(), name='conversation_history'),
     path('conversation/<str:session_id>/clear/', ClearConversationView.as_view(), name='clear_conversation'),
+    path('catalogs/', CatalogListView.as_view(), name='catalogs'),
+    path('catalogs/<str:catalog_id>/', CatalogDetailView.as_view(), name='catalog_detail'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('usage/', UsageView.as_view(), name='usage'),
+    path('export/', ExportConversationsView.as_view(), name='export_conversations'),
+    path('import/', ImportConversationsView.as_view(), name='import_conversations'),
 ]
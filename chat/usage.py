@@ -0,0 +1,228 @@
+"""
+Per-user token usage ledger
+Chat turns record token counts and latency in memory; a background thread
+folds them into UsageDaily rows in batches, so accounting adds no database
+write to the request path
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from safycore_backend import diagnostics, metrics
+from safycore_backend.groq_client import usage_counts
+from .models import UsageDaily
+
+logger = logging.getLogger(__name__)
+
+# UsageDaily counters, in the order they are buffered
+COUNTERS = (
+    'requests',
+    'truncated_requests',
+    'prompt_tokens',
+    'cached_prompt_tokens',
+    'completion_tokens',
+    'latency_ms_total',
+)
+
+# Rough characters per token, for prompts whose usage never arrived
+CHARS_PER_TOKEN = 4
+
+
+class UsageLedger:
+    """
+    Aggregates usage per (user_id, day, model) and flushes it periodically
+
+    The flusher thread starts on the first record and wakes every
+    flush_seconds, or early once max_pending rows are buffered. A failed
+    flush merges its batch back so the counts go out with the next one.
+    """
+
+    def __init__(self, flush_seconds: float, max_pending: int):
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # (user_id, day, model) -> counters in COUNTERS order
+        self._wake = threading.Event()
+        self._thread = None
+
+    def record(self, user_id, model: str, usage=None, latency: float = 0.0,
+               truncated: bool = False, prompt_estimate: int = 0, completion_estimate: int = 0) -> None:
+        """
+        Add one completion to the ledger
+
+        Args:
+            user_id: Supabase user id
+            model: Model that served the completion
+            usage: Usage object from Groq, or None when the stream was cut short
+            latency: Seconds from sending the request to the last token
+            truncated: The client went away before the reply finished
+            prompt_estimate: Prompt tokens to count when usage is None; the
+                prompt was processed and billed even if the stream was cut
+            completion_estimate: Completion tokens to count when usage is None
+        """
+        prompt_tokens, cached_tokens, completion_tokens = usage_counts(usage)
+        if usage is None:
+            prompt_tokens = prompt_estimate
+            completion_tokens = completion_estimate
+        key = (str(user_id), timezone.now().date(), model)
+        values = (1, int(truncated), prompt_tokens, cached_tokens, completion_tokens, int(latency * 1000))
+
+        with self._lock:
+            self._add(key, values)
+            backlog = len(self._pending)
+
+        self._ensure_flusher()
+        if backlog >= self.max_pending:
+            self._wake.set()
+
+    def _add(self, key, values):
+        row = self._pending.get(key)
+        if row is None:
+            self._pending[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                row[i] += value
+
+    def pending(self, user_id) -> dict:
+        """Unflushed counters of one user, keyed by (day, model)"""
+        user_id = str(user_id)
+        with self._lock:
+            return {
+                (day, model): dict(zip(COUNTERS, row))
+                for (owner, day, model), row in self._pending.items()
+                if owner == user_id
+            }
+
+    def flush(self) -> int:
+        """
+        Write the buffered counters to UsageDaily
+
+        Returns:
+            int: Number of rows written
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            try:
+                try:
+                    self._write(batch)
+                except IntegrityError:
+                    # Another process created one of the rows first; they exist now
+                    self._write(batch)
+            except Exception:
+                with self._lock:
+                    for key, values in batch.items():
+                        self._add(key, values)
+                metrics.incr('usage.flush_failures')
+                raise
+
+            metrics.incr('usage.flushes')
+            metrics.incr('usage.rows_flushed', len(batch))
+            return len(batch)
+
+    def _write(self, batch):
+        user_ids = {user_id for user_id, _, _ in batch}
+        days = {day for _, day, _ in batch}
+        now = timezone.now()
+
+        with transaction.atomic():
+            existing = {
+                (row.user_id, row.day, row.model): row
+                for row in UsageDaily.objects.select_for_update().filter(user_id__in=user_ids, day__in=days)
+            }
+            updated, created = [], []
+            for key, values in batch.items():
+                row = existing.get(key)
+                if row is None:
+                    user_id, day, model = key
+                    created.append(UsageDaily(user_id=user_id, day=day, model=model,
+                                              **dict(zip(COUNTERS, values))))
+                    continue
+                for field, value in zip(COUNTERS, values):
+                    setattr(row, field, getattr(row, field) + value)
+                # bulk_update() skips auto_now
+                row.updated_at = now
+                updated.append(row)
+
+            if updated:
+                UsageDaily.objects.bulk_update(updated, COUNTERS + ('updated_at',))
+            if created:
+                UsageDaily.objects.bulk_create(created)
+
+    def _ensure_flusher(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='usage-flusher', daemon=True)
+            self._thread.start()
+        atexit.register(self._flush_quietly)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self._flush_quietly()
+            # The flusher owns its connection; drop it if it went stale
+            close_old_connections()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning('Could not flush usage ledger: %s', e)
+
+
+def estimate_prompt_tokens(messages) -> int:
+    """Prompt tokens of a Groq payload, estimated from its size"""
+    return sum(len(message['content']) for message in messages) // CHARS_PER_TOKEN
+
+
+ledger = UsageLedger(settings.USAGE_FLUSH_SECONDS, settings.USAGE_FLUSH_MAX_PENDING)
+diagnostics.register('usage.pending_rows', lambda: len(ledger._pending))
+
+
+def rollups(user_id, start=None, end=None) -> list:
+    """
+    Daily usage of one user, newest first, including counts not yet flushed
+
+    Args:
+        start, end: Inclusive date bounds, either may be None
+    """
+    totals = {}
+    rows = UsageDaily.objects.filter(user_id=str(user_id))
+    if start:
+        rows = rows.filter(day__gte=start)
+    if end:
+        rows = rows.filter(day__lte=end)
+    for row in rows.values('day', 'model', *COUNTERS):
+        totals[(row.pop('day'), row.pop('model'))] = row
+
+    for (day, model), counters in ledger.pending(user_id).items():
+        if (start and day < start) or (end and day > end):
+            continue
+        row = totals.setdefault((day, model), dict.fromkeys(COUNTERS, 0))
+        for field, value in counters.items():
+            row[field] += value
+
+    result = []
+    ordered = sorted(totals.items(), key=lambda item: item[0][1])
+    for (day, model), row in sorted(ordered, key=lambda item: item[0][0], reverse=True):
+        requests = row['requests']
+        result.append({
+            'day': day.isoformat(),
+            'model': model,
+            **row,
+            'total_tokens': row['prompt_tokens'] + row['completion_tokens'],
+            'avg_latency_ms': round(row['latency_ms_total'] / requests) if requests else 0,
+        })
+    return result
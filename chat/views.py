@@ -2,43 +2,86 @@
 Chat views with Groq AI integration and Supabase storage
 Each user's conversations are isolated using RLS in Supabase
 """
-import re
+import contextvars
+import gzip
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from django.http import StreamingHttpResponse
 from django.conf import settings
-from groq import Groq
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from safycore_backend import fastjson, traffic
+from safycore_backend.conditional import finalize, make_etag, not_modified
+from safycore_backend.limiter import Overloaded, upstream_queue_seconds
+from safycore_backend.routing import set_route
 from safycore_backend.supabase_client import get_user_supabase_client
-from .models import ConversationSession
-
-
-def strip_markdown(text: str) -> str:
-    """Remove markdown formatting from text"""
-    text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)
-    text = re.sub(r'\*(.+?)\*', r'\1', text)
-    text = re.sub(r'__(.+?)__', r'\1', text)
-    text = re.sub(r'_(.+?)_', r'\1', text)
-    text = re.sub(r'^\s*[-*+]\s+', '', text, flags=re.MULTILINE)
-    text = re.sub(r'^\s*\d+\.\s+', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\|(.+?)\|', r'\1', text)
-    return text.strip()
-
-
-def get_system_prompt(training_data: str = None) -> str:
-    """Generate system prompt with optional training data"""
-    if training_data:
-        return f"""You are a helpful assistant. Use the following information to answer questions:
-
-{training_data}
-
-Rules:
-1. ONLY answer using the provided information
-2. Use plain text, NO markdown formatting
-3. Keep responses to 1-2 sentences maximum
-4. Be conversational and helpful"""
-    return "You are a helpful assistant. Provide concise, plain text responses without markdown formatting."
+from safycore_backend.groq_client import create_chat_completion, record_usage
+from safycore_backend.resilience import (
+    Deadline,
+    current_deadline,
+    deadline_scope,
+    execute,
+    upstream_error_status,
+)
+from .models import Catalog, ConversationSession
+from .cache import (
+    cached_body,
+    history_body,
+    history_etag,
+    history_key,
+    session_cleared_at,
+    sessions_body,
+    sessions_etag,
+    sessions_key,
+    store_body,
+)
+from .history import iter_session_messages
+from .prompts import build_system_prompt
+from .deletion import clear_sessions
+from .search import index_messages, search, unindex_session
+from .catalog import catalog_hash, direct_answer
+from .turns import (
+    CHAT_MODEL,
+    AsyncReply,
+    admit_turn,
+    expand_catalog_row,
+    get_catalog,
+    prepare_turn,
+    store_reply,
+    stream_reply,
+    strip_markdown,
+)
+from .usage import ledger, rollups
+
+
+def queued_seconds(request) -> float:
+    """Time the request spent queued in front of the app, if the proxy reports it"""
+    return upstream_queue_seconds(request.META.get('HTTP_X_REQUEST_START'))
+
+
+def record_turn(request, stream: bool):
+    """Start recording the shape of a chat turn when TRAFFIC_RECORD_PATH is set (safycore_backend/traffic.py)"""
+    return traffic.start_turn(
+        'django', request.user.user_id, request.data.get('session_id', 'default'), request.data.get('message'),
+        stream, request.data.get('training_data'), bool(request.data.get('catalog_id'))
+    )
+
+
+def overloaded_response(error) -> Response:
+    return Response(
+        {'error': str(error)},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(error.retry_after)}
+    )
 
 
 class ChatView(APIView):
@@ -49,9 +92,17 @@ class ChatView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        turn = record_turn(request, stream=False)
+        response = self.reply(request)
+        if turn is not None:
+            turn.finish(response.status_code, response.data.get('response'))
+        return response
+
+    def reply(self, request):
         message = request.data.get('message')
         session_id = request.data.get('session_id', 'default')
         training_data = request.data.get('training_data')
+        catalog_id = request.data.get('catalog_id')
 
         if not message:
             return Response(
@@ -59,110 +110,61 @@ class ChatView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        ticket = None
         try:
             user_profile = request.user
             supabase_user = request.supabase_user
             token = request.supabase_token
 
+            # Shed the turn now rather than after its client has given up
+            ticket = admit_turn(user_profile, session_id, queued_seconds(request),
+                                wait=not isinstance(request._request, ASGIRequest))
+
             # Get user-specific Supabase client with RLS
             supabase = get_user_supabase_client(token)
 
-            # Get or create conversation session in Django
-            conversation, created = ConversationSession.objects.get_or_create(
-                session_id=session_id,
-                user=user_profile,
-                defaults={'title': message[:50]}
-            )
-
-            # Get conversation history from Supabase (RLS automatically filters by user)
-            messages_response = supabase.table('messages').select('*').eq(
-                'session_id', session_id
-            ).order('created_at').execute()
-
-            conversation_history = messages_response.data if messages_response.data else []
-
-            # Check if this is first message - add training data
-            if not conversation_history and training_data:
-                system_message = {
-                    'user_id': supabase_user.id,
-                    'session_id': session_id,
-                    'role': 'system',
-                    'content': get_system_prompt(training_data)
-                }
-                supabase.table('messages').insert(system_message).execute()
-
-                # Store training data in Supabase
-                training_record = {
-                    'user_id': supabase_user.id,
-                    'session_id': session_id,
-                    'content': training_data
-                }
-                supabase.table('training_data').insert(training_record).execute()
-
-                conversation_history.append(system_message)
-            elif not conversation_history:
-                # Default system message
-                system_message = {
-                    'user_id': supabase_user.id,
-                    'session_id': session_id,
-                    'role': 'system',
-                    'content': get_system_prompt()
-                }
-                supabase.table('messages').insert(system_message).execute()
-                conversation_history.append(system_message)
-
-            # Add user message
-            user_message = {
-                'user_id': supabase_user.id,
-                'session_id': session_id,
-                'role': 'user',
-                'content': message
-            }
-            supabase.table('messages').insert(user_message).execute()
-            conversation_history.append(user_message)
-
-            # Prepare messages for Groq
-            groq_messages = [
-                {'role': msg['role'], 'content': msg['content']}
-                for msg in conversation_history
-            ]
-
-            # Call Groq API
-            groq_client = Groq(api_key=settings.GROQ_API_KEY)
-            chat_completion = groq_client.chat.completions.create(
-                messages=groq_messages,
-                model="openai/gpt-oss-120b",
-                temperature=0.3,
-                max_completion_tokens=100,
-                top_p=0.9,
-                stream=False
+            catalog = get_catalog(user_profile, catalog_id) if catalog_id else None
+            conversation, groq_messages = prepare_turn(
+                supabase, user_profile, supabase_user, session_id, message, training_data, catalog
             )
 
-            assistant_response = chat_completion.choices[0].message.content
-            clean_response = strip_markdown(assistant_response)
-
-            # Store assistant message in Supabase
-            assistant_message = {
-                'user_id': supabase_user.id,
-                'session_id': session_id,
-                'role': 'assistant',
-                'content': clean_response
-            }
-            supabase.table('messages').insert(assistant_message).execute()
+            # Simple lookups on a tabular catalog are answered from its index
+            assistant_response = direct_answer(groq_messages)
+            if assistant_response is None:
+                # Call Groq API
+                start = time.monotonic()
+                chat_completion = create_chat_completion(
+                    messages=groq_messages,
+                    model=CHAT_MODEL,
+                    temperature=0.3,
+                    max_completion_tokens=100,
+                    top_p=0.9,
+                    stream=False
+                )
 
-            # Update conversation timestamp
-            conversation.save()
+                record_usage(chat_completion.usage)
+                ledger.record(supabase_user.id, CHAT_MODEL, chat_completion.usage, time.monotonic() - start)
+                assistant_response = chat_completion.choices[0].message.content
+            # Store the reply and bump the session
+            clean_response = store_reply(supabase, supabase_user, conversation, assistant_response)
 
-            return Response({
+            return set_route(Response({
                 'response': clean_response,
                 'session_id': session_id
-            }, status=status.HTTP_200_OK)
+            }, status=status.HTTP_200_OK), session_id)
 
+        except Overloaded as e:
+            return overloaded_response(e)
+        except Catalog.DoesNotExist:
+            return Response({'error': 'Catalog not found'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response(
                 {'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
             )
+        finally:
+            if ticket is not None:
+                ticket.release()
 
 
 class ChatStreamView(APIView):
@@ -172,9 +174,17 @@ class ChatStreamView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        turn = record_turn(request, stream=True)
+        response = self.stream(request, turn)
+        if turn is not None and not response.streaming:
+            turn.finish(response.status_code)
+        return response
+
+    def stream(self, request, turn=None):
         message = request.data.get('message')
         session_id = request.data.get('session_id', 'default')
         training_data = request.data.get('training_data')
+        catalog_id = request.data.get('catalog_id')
 
         if not message:
             return Response(
@@ -182,174 +192,335 @@ class ChatStreamView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        ticket = None
         try:
             user_profile = request.user
             supabase_user = request.supabase_user
             token = request.supabase_token
 
+            # Shed the turn now rather than after its client has given up
+            ticket = admit_turn(user_profile, session_id, queued_seconds(request),
+                                wait=not isinstance(request._request, ASGIRequest))
+
             # Get user-specific Supabase client
             supabase = get_user_supabase_client(token)
 
-            # Get or create conversation session
-            conversation, created = ConversationSession.objects.get_or_create(
-                session_id=session_id,
-                user=user_profile,
-                defaults={'title': message[:50]}
+            catalog = get_catalog(user_profile, catalog_id) if catalog_id else None
+            conversation, groq_messages = prepare_turn(
+                supabase, user_profile, supabase_user, session_id, message, training_data, catalog
             )
 
-            # Get conversation history
-            messages_response = supabase.table('messages').select('*').eq(
-                'session_id', session_id
-            ).order('created_at').execute()
+            # The generator runs after the view returns, so carry the deadline along
+            generate = stream_reply(supabase, supabase_user, conversation, groq_messages, current_deadline())
+            # The turn keeps its slot until the stream ends or is closed
+            generate, ticket = ticket.hold(generate), None
+            if turn is not None:
+                generate = turn.watch(generate)
+
+            # Closing the response on disconnect closes the generator, which stops Groq
+            if isinstance(request._request, ASGIRequest):
+                generate = AsyncReply(generate)
+            return set_route(StreamingHttpResponse(generate, content_type='text/plain'), session_id)
+
+        except Overloaded as e:
+            return overloaded_response(e)
+        except Catalog.DoesNotExist:
+            return Response({'error': 'Catalog not found'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            )
+        finally:
+            if ticket is not None:
+                ticket.release()
 
-            conversation_history = messages_response.data if messages_response.data else []
 
-            # Handle training data for first message
-            if not conversation_history and training_data:
-                system_message = {
-                    'user_id': supabase_user.id,
-                    'session_id': session_id,
-                    'role': 'system',
-                    'content': get_system_prompt(training_data)
-                }
-                supabase.table('messages').insert(system_message).execute()
-                training_record = {
-                    'user_id': supabase_user.id,
-                    'session_id': session_id,
-                    'content': training_data
-                }
-                supabase.table('training_data').insert(training_record).execute()
-                conversation_history.append(system_message)
-            elif not conversation_history:
-                system_message = {
-                    'user_id': supabase_user.id,
-                    'session_id': session_id,
-                    'role': 'system',
-                    'content': get_system_prompt()
-                }
-                supabase.table('messages').insert(system_message).execute()
-                conversation_history.append(system_message)
-
-            # Add user message
-            user_message = {
-                'user_id': supabase_user.id,
-                'session_id': session_id,
-                'role': 'user',
-                'content': message
-            }
-            supabase.table('messages').insert(user_message).execute()
-            conversation_history.append(user_message)
-
-            # Prepare messages for Groq
-            groq_messages = [
-                {'role': msg['role'], 'content': msg['content']}
-                for msg in conversation_history
-            ]
+class BatchChatView(APIView):
+    """
+    Answer many independent one-shot prompts in one request
+    Completions run concurrently on a bounded pool and results stream back
+    as NDJSON in completion order; all messages are persisted with one insert
+    """
+    permission_classes = [IsAuthenticated]
 
-            # Streaming generator
-            def generate():
-                full_response = ""
-                groq_client = Groq(api_key=settings.GROQ_API_KEY)
+    def post(self, request):
+        items = request.data.get('items')
 
-                stream = groq_client.chat.completions.create(
-                    messages=groq_messages,
-                    model="openai/gpt-oss-120b",
-                    temperature=0.3,
-                    max_completion_tokens=100,
-                    top_p=0.9,
-                    stream=True
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'items must be a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > settings.CHAT_BATCH_MAX_ITEMS:
+            return Response(
+                {'error': f'At most {settings.CHAT_BATCH_MAX_ITEMS} items per batch'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get('message'), str) or not item['message']:
+                return Response(
+                    {'error': 'Every item requires a message'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if item.get('session_id') is not None and not isinstance(item['session_id'], str):
+                return Response(
+                    {'error': 'session_id must be a string'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
 
-                for chunk in stream:
-                    if chunk.choices[0].delta.content:
-                        content = chunk.choices[0].delta.content
-                        full_response += content
-                        yield content
-
-                # Clean and store full response
-                clean_response = strip_markdown(full_response)
-                assistant_message = {
-                    'user_id': supabase_user.id,
-                    'session_id': session_id,
-                    'role': 'assistant',
-                    'content': clean_response
-                }
-                supabase.table('messages').insert(assistant_message).execute()
-
-                # Update conversation
-                conversation.save()
-
-            return StreamingHttpResponse(generate(), content_type='text/plain')
+        try:
+            user_profile = request.user
+            supabase_user = request.supabase_user
+            supabase = get_user_supabase_client(request.supabase_token)
 
+            # Messages must never be written under another user's session
+            requested = {item['session_id'] for item in items if item.get('session_id')}
+            if ConversationSession.objects.filter(session_id__in=requested).exclude(user=user_profile).exists():
+                return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response(
                 {'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
             )
 
+        items = [{
+            'index': index,
+            'session_id': item.get('session_id') or f'batch-{uuid.uuid4()}',
+            'message': item['message'],
+            'training_data': item.get('training_data')
+        } for index, item in enumerate(items)]
+
+        def answer(item):
+            groq_messages = [
+                {'role': 'system', 'content': build_system_prompt(item['training_data'])},
+                {'role': 'user', 'content': item['message']}
+            ]
+            response = direct_answer(groq_messages)
+            if response is not None:
+                return groq_messages, strip_markdown(response)
+
+            start = time.monotonic()
+            chat_completion = create_chat_completion(
+                messages=groq_messages,
+                model=CHAT_MODEL,
+                temperature=0.3,
+                max_completion_tokens=100,
+                top_p=0.9,
+                stream=False
+            )
+            record_usage(chat_completion.usage)
+            ledger.record(supabase_user.id, CHAT_MODEL, chat_completion.usage, time.monotonic() - start)
+            return groq_messages, strip_markdown(chat_completion.choices[0].message.content)
+
+        def persist(answered):
+            session_ids = {item['session_id'] for item, _, _ in answered}
+            existing = set(ConversationSession.objects.filter(
+                session_id__in=session_ids, user=user_profile
+            ).values_list('session_id', flat=True))
+
+            rows = []
+            new_sessions = {}
+            for item, groq_messages, response in answered:
+                # Only a session's first turn carries the system prompt
+                started = item['session_id'] in existing or item['session_id'] in new_sessions
+                turn = groq_messages[1:] if started else groq_messages
+                turn = turn + [{'role': 'assistant', 'content': response}]
+                rows.extend({
+                    'user_id': supabase_user.id,
+                    'session_id': item['session_id'],
+                    'role': message['role'],
+                    'content': message['content']
+                } for message in turn)
+                if not started:
+                    new_sessions[item['session_id']] = ConversationSession(
+                        session_id=item['session_id'],
+                        user=user_profile,
+                        title=item['message'][:50]
+                    )
+            execute(supabase.table('messages').insert(rows))
+            index_messages(rows)
+
+            ConversationSession.objects.bulk_create(new_sessions.values(), ignore_conflicts=True)
+            ConversationSession.objects.filter(
+                session_id__in=existing, user=user_profile
+            ).update(updated_at=timezone.now())
+            return len(rows)
+
+        def answer_within(deadline, item):
+            with deadline_scope(deadline):
+                return answer(item)
+
+        def generate():
+            answered = []
+            workers = min(settings.CHAT_BATCH_MAX_WORKERS, len(items))
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chat-batch')
+            # Scopes are only entered around upstream work, never across a yield:
+            # under ASGI each line is pulled in a fresh copy of the context
+            deadline = Deadline(settings.CHAT_BATCH_DEADLINE_SECONDS)
+            try:
+                futures = {
+                    executor.submit(contextvars.copy_context().run, answer_within, deadline, item): item
+                    for item in items
+                }
+                for future in as_completed(futures):
+                    item = futures[future]
+                    result = {'index': item['index'], 'session_id': item['session_id']}
+                    try:
+                        groq_messages, response = future.result()
+                        answered.append((item, groq_messages, response))
+                        result['response'] = response
+                    except Exception as e:
+                        result['error'] = str(e)
+                    yield fastjson.dumps(result) + b'\n'
+
+                summary = {'done': True, 'answered': len(answered), 'failed': len(items) - len(answered)}
+                if answered:
+                    try:
+                        with deadline_scope(deadline):
+                            summary['persisted_messages'] = persist(answered)
+                    except Exception as e:
+                        summary['persist_error'] = str(e)
+                yield fastjson.dumps(summary) + b'\n'
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        body = generate()
+        # Each result goes out as it completes instead of after the whole batch
+        if isinstance(request._request, ASGIRequest):
+            body = AsyncReply(body)
+        return StreamingHttpResponse(body, content_type='application/x-ndjson')
+
 
 class ConversationHistoryView(APIView):
     """
     Get conversation history for a session
+    Optional ?limit=N&before=<created_at> pages backwards through the history
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, session_id):
+        limit = request.query_params.get('limit')
+        before = request.query_params.get('before')
+
+        if limit is not None:
+            if not limit.isdigit() or int(limit) < 1:
+                return Response(
+                    {'error': 'limit must be a positive integer'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            limit = int(limit)
+
         try:
+            etag = history_etag(request.user, session_id, limit, before)
+            key = history_key(request.user, session_id, limit, before)
+            if etag is not None:
+                response = not_modified(request, etag, 'chat.history')
+                if response is not None:
+                    return response
+                data = cached_body(key, etag, 'chat.history')
+                if data is not None:
+                    return finalize(Response(data, status=status.HTTP_200_OK), etag)
+
             token = request.supabase_token
             supabase = get_user_supabase_client(token)
 
-            # Get messages (RLS automatically filters by user)
-            messages_response = supabase.table('messages').select('*').eq(
-                'session_id', session_id
-            ).order('created_at').execute()
-
-            messages = messages_response.data if messages_response.data else []
+            data = history_body(
+                supabase, request.user, request.supabase_user.id, session_id, limit, before,
+                cleared_at=session_cleared_at(request.user, session_id)
+            )
 
-            return Response({
-                'session_id': session_id,
-                'messages': messages
-            }, status=status.HTTP_200_OK)
+            response = Response(data, status=status.HTTP_200_OK)
+            if etag is None:
+                return response
+            store_body(key, etag, data)
+            return finalize(response, etag)
 
         except Exception as e:
             return Response(
                 {'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
             )
 
 
 class ClearConversationView(APIView):
     """
     Clear conversation history for a session
+    The history reads as empty at once; stored rows are purged in the background
     """
     permission_classes = [IsAuthenticated]
 
     def delete(self, request, session_id):
         try:
-            user_profile = request.user
-            token = request.supabase_token
-            supabase = get_user_supabase_client(token)
+            supabase = get_user_supabase_client(request.supabase_token)
+            clear_sessions(supabase, request.user, session_ids=[session_id])
 
-            # Delete messages from Supabase (RLS ensures only user's messages are deleted)
-            supabase.table('messages').delete().eq('session_id', session_id).execute()
+            return Response({
+                'message': 'Conversation cleared successfully'
+            }, status=status.HTTP_200_OK)
 
-            # Delete training data
-            supabase.table('training_data').delete().eq('session_id', session_id).execute()
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            )
 
-            # Delete Django session record
-            ConversationSession.objects.filter(
-                session_id=session_id,
-                user=user_profile
-            ).delete()
 
+class DeleteSessionsView(APIView):
+    """
+    Delete many sessions in one request
+
+    Body:
+        session_ids: Sessions to delete (at most SESSION_DELETE_MAX_IDS)
+        before: ISO datetime, delete sessions last updated before it
+    Either or both may be given; with both, only listed sessions updated
+    before the date are deleted. Responds 202 once the sessions are marked;
+    their rows are purged in the background.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        session_ids = request.data.get('session_ids')
+        before = request.data.get('before')
+
+        if session_ids is None and before is None:
+            return Response(
+                {'error': 'session_ids or before is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if session_ids is not None:
+            if not isinstance(session_ids, list) or not all(isinstance(item, str) and item for item in session_ids):
+                return Response(
+                    {'error': 'session_ids must be a list of session ids'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if len(session_ids) > settings.SESSION_DELETE_MAX_IDS:
+                return Response(
+                    {'error': f'At most {settings.SESSION_DELETE_MAX_IDS} session ids per request'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        if before is not None:
+            before = parse_datetime(before) if isinstance(before, str) else None
+            if before is None:
+                return Response(
+                    {'error': 'before must be an ISO 8601 datetime'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(before):
+                before = timezone.make_aware(before)
+
+        try:
+            supabase = get_user_supabase_client(request.supabase_token)
+            cleared = clear_sessions(supabase, request.user, session_ids=session_ids, before=before)
             return Response({
-                'message': 'Conversation cleared successfully'
-            }, status=status.HTTP_200_OK)
+                'deleted': len(cleared),
+                'session_ids': cleared
+            }, status=status.HTTP_202_ACCEPTED)
 
         except Exception as e:
             return Response(
                 {'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
             )
 
 
@@ -362,21 +533,505 @@ class UserSessionsView(APIView):
     def get(self, request):
         try:
             user_profile = request.user
-            sessions = ConversationSession.objects.filter(user=user_profile)
+            etag = sessions_etag(user_profile)
+            response = not_modified(request, etag, 'chat.sessions')
+            if response is not None:
+                return response
+
+            key = sessions_key(user_profile)
+            data = cached_body(key, etag, 'chat.sessions')
+            if data is None:
+                data = sessions_body(user_profile)
+                store_body(key, etag, data)
+
+            return finalize(Response(data, status=status.HTTP_200_OK), etag)
+
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            )
+
+
+class SearchView(APIView):
+    """
+    Full-text search across the user's conversations
+
+    Query params:
+        q: Search terms; every term must match, the last one as a prefix
+        limit: Page size (default 20, at most SEARCH_MAX_RESULTS)
+        offset: Results to skip; pass the previous page's next_offset
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'error': 'q is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), settings.SEARCH_MAX_RESULTS)
+            offset = int(request.query_params.get('offset', 0))
+        except ValueError:
+            return Response(
+                {'error': 'limit and offset must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if limit < 1 or offset < 0:
+            return Response(
+                {'error': 'limit must be positive and offset not negative'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            supabase = get_user_supabase_client(request.supabase_token)
+            page = search(supabase, request.supabase_user.id, query, limit, offset)
+            return Response({'query': query, **page}, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            )
+
+
+class UsageView(APIView):
+    """
+    Daily token usage of the authenticated user
+    Optional ?from=YYYY-MM-DD&to=YYYY-MM-DD bounds the days (inclusive)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        bounds = {}
+        for name in ('from', 'to'):
+            value = request.query_params.get(name)
+            if value:
+                try:
+                    bounds[name] = parse_date(value)
+                except ValueError:
+                    bounds[name] = None
+                if bounds[name] is None:
+                    return Response(
+                        {'error': f'{name} must be a date (YYYY-MM-DD)'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+        try:
+            days = rollups(request.supabase_user.id, bounds.get('from'), bounds.get('to'))
+            return Response({
+                'usage': days,
+                'totals': {
+                    field: sum(day[field] for day in days)
+                    for field in ('requests', 'prompt_tokens', 'cached_prompt_tokens',
+                                  'completion_tokens', 'total_tokens')
+                }
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            )
+
+
+def catalog_data(catalog) -> dict:
+    """Metadata of a catalog version"""
+    return {
+        'id': catalog.pk,
+        'name': catalog.name,
+        'version': catalog.version,
+        'content_hash': catalog.content_hash,
+        'size_bytes': catalog.size_bytes,
+        'created_at': catalog.created_at
+    }
+
+
+class CatalogListView(APIView):
+    """
+    List and upload training-data catalogs
+    GET lists the latest version of each catalog (?name=<name> lists all of its versions)
+    POST uploads content under a name; unchanged content returns the existing version
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            user_profile = request.user
+            catalogs = Catalog.objects.filter(user=user_profile).defer('content')
+            name = request.query_params.get('name')
+
+            # Uploads and deletes change the count or the latest created_at
+            summary = catalogs.aggregate(latest=Max('created_at'), count=Count('id'))
+            latest = summary['latest'].isoformat() if summary['latest'] else ''
+            etag = make_etag('catalogs', user_profile.pk, name or '', latest, summary['count'])
+            response = not_modified(request, etag, 'chat.catalogs')
+            if response is not None:
+                return response
+
+            if name:
+                versions = catalogs.filter(name=name)
+            else:
+                latest_versions = {}
+                for catalog in catalogs:  # ordered by name, newest version first
+                    latest_versions.setdefault(catalog.name, catalog)
+                versions = latest_versions.values()
+
+            return finalize(Response({
+                'catalogs': [catalog_data(catalog) for catalog in versions]
+            }, status=status.HTTP_200_OK), etag)
+
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            )
+
+    def post(self, request):
+        name = request.data.get('name')
+        content = request.data.get('content')
 
-            sessions_data = [{
-                'session_id': session.session_id,
-                'title': session.title,
-                'created_at': session.created_at,
-                'updated_at': session.updated_at
-            } for session in sessions]
+        if not name or not isinstance(content, str) or not content.strip():
+            return Response(
+                {'error': 'name and content are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        size_bytes = len(content.encode('utf-8'))
+        if size_bytes > settings.CATALOG_MAX_BYTES:
+            return Response(
+                {'error': f'Catalogs are limited to {settings.CATALOG_MAX_BYTES} bytes'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            user_profile = request.user
+            digest = catalog_hash(content)
+            latest = Catalog.objects.filter(user=user_profile, name=name).defer('content').first()
+            if latest is not None and latest.content_hash == digest:
+                return Response(catalog_data(latest), status=status.HTTP_200_OK)
+
+            catalog = Catalog.objects.create(
+                user=user_profile,
+                name=name,
+                version=latest.version + 1 if latest else 1,
+                content=content,
+                content_hash=digest,
+                size_bytes=size_bytes
+            )
+            return Response(catalog_data(catalog), status=status.HTTP_201_CREATED)
+
+        except IntegrityError:
+            return Response(
+                {'error': f'Catalog {name} was updated concurrently, retry the upload'},
+                status=status.HTTP_409_CONFLICT
+            )
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            )
+
+
+class CatalogDetailView(APIView):
+    """
+    Get or delete one catalog version
+    Versions are immutable, so the ETag only depends on the content hash
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, catalog_id):
+        try:
+            catalog = get_catalog(request.user, catalog_id)
+            etag = make_etag('catalog', catalog.pk, catalog.content_hash)
+            response = not_modified(request, etag, 'chat.catalog')
+            if response is not None:
+                return response
+
+            data = catalog_data(catalog)
+            data['content'] = Catalog.objects.values_list('content', flat=True).get(pk=catalog.pk)
+            return finalize(Response(data, status=status.HTTP_200_OK), etag)
+
+        except Catalog.DoesNotExist:
+            return Response({'error': 'Catalog not found'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            )
+
+    def delete(self, request, catalog_id):
+        try:
+            catalog = get_catalog(request.user, catalog_id)
+            # Sessions build their prompt from the version they reference
+            if catalog.sessions.exists():
+                return Response(
+                    {'error': 'Catalog is used by existing sessions'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            catalog.delete()
+            return Response({
+                'message': 'Catalog deleted successfully'
+            }, status=status.HTTP_200_OK)
+
+        except Catalog.DoesNotExist:
+            return Response({'error': 'Catalog not found'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            )
+
+
+class ExportConversationsView(APIView):
+    """
+    Stream all of the user's conversations as NDJSON
+    ?compress=gzip returns a gzip archive; memory use stays bounded by the page sizes
+    Under ASGI the archive is served through AsyncReply, which sends each
+    chunk as it is produced instead of building the whole body first
+    """
+    permission_classes = [IsAuthenticated]
+    session_page_size = 100
+
+    def get(self, request):
+        compress = request.query_params.get('compress') == 'gzip'
+
+        try:
+            user_profile = request.user
+            supabase_user = request.supabase_user
+            supabase = get_user_supabase_client(request.supabase_token)
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            )
+
+        def records():
+            last_id = 0
+            while True:
+                sessions = list(ConversationSession.objects.filter(
+                    user=user_profile, id__gt=last_id
+                ).visible().order_by('id')[:self.session_page_size])
+                if not sessions:
+                    return
+                for session in sessions:
+                    yield {
+                        'type': 'session',
+                        'session_id': session.session_id,
+                        'title': session.title,
+                        'created_at': session.created_at.isoformat(),
+                        'updated_at': session.updated_at.isoformat()
+                    }
+                    for message in iter_session_messages(
+                        supabase, supabase_user.id, session.session_id,
+                        cleared_at=session.deleted_at, deadline=deadline
+                    ):
+                        # Exports stand alone, so catalog references carry their prompt
+                        message = expand_catalog_row(user_profile, message)
+                        yield {
+                            'type': 'message',
+                            'session_id': session.session_id,
+                            'role': message['role'],
+                            'content': message['content'],
+                            'created_at': message['created_at']
+                        }
+                last_id = sessions[-1].id
+
+        def generate():
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+            for record in records():
+                line = fastjson.dumps(record) + b'\n'
+                if compressor is None:
+                    yield line
+                else:
+                    chunk = compressor.compress(line)
+                    if chunk:
+                        yield chunk
+            if compressor is not None:
+                yield compressor.flush()
+
+        # One budget for the whole export, entered around each page read
+        deadline = Deadline(settings.CHAT_EXPORT_DEADLINE_SECONDS)
+        body = generate()
+        if isinstance(request._request, ASGIRequest):
+            body = AsyncReply(body)
+        if compress:
+            response = StreamingHttpResponse(body, content_type='application/gzip')
+            filename = 'conversations.ndjson.gz'
+        else:
+            response = StreamingHttpResponse(body, content_type='application/x-ndjson')
+            filename = 'conversations.ndjson'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class ImportConversationsView(APIView):
+    """
+    Import conversations from an NDJSON export (plain or gzip)
+    Messages are written to Supabase in batched inserts and a session's row
+    is only created once all of its messages are stored. Sessions that
+    already have a row are skipped, and messages left behind by an
+    interrupted import are replaced, so re-running an import is safe
+    """
+    permission_classes = [IsAuthenticated]
+    invalid_lines_limit = 100
+
+    def post(self, request):
+        stream = request.stream
+        if stream is None:
+            return Response(
+                {'error': 'Request body is empty'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Detect gzip by magic bytes so the header is optional
+        stream = _PeekableStream(stream)
+        if stream.peek(2) == b'\x1f\x8b':
+            stream = gzip.GzipFile(fileobj=stream)
+
+        try:
+            user_profile = request.user
+            supabase_user = request.supabase_user
+            supabase = get_user_supabase_client(request.supabase_token)
+            batch_size = settings.CHAT_IMPORT_BATCH_SIZE
+
+            imported_session_ids = []
+            skipped_sessions = []
+            imported_messages = 0
+            invalid_lines = []
+            invalid_count = 0
+            current_session = None
+            batch = []
+            # Sessions fully read whose rows wait for their last batch to be stored
+            ready_sessions = []
+            # Sessions whose leftovers from an earlier, interrupted import are gone
+            cleaned_sessions = set()
+
+            def invalid(line_number):
+                nonlocal invalid_count
+                invalid_count += 1
+                if len(invalid_lines) < self.invalid_lines_limit:
+                    invalid_lines.append(line_number)
+
+            def flush():
+                if batch:
+                    stale = list({message['session_id'] for message in batch} - cleaned_sessions)
+                    if stale:
+                        execute(supabase.table('messages').delete().eq('user_id', supabase_user.id).in_(
+                            'session_id', stale
+                        ))
+                        for session_id in stale:
+                            unindex_session(supabase_user.id, session_id)
+                        cleaned_sessions.update(stale)
+                    execute(supabase.table('messages').insert(batch))
+                    index_messages(batch)
+                    batch.clear()
+                for session_id, title in ready_sessions:
+                    ConversationSession.objects.create(
+                        session_id=session_id,
+                        user=user_profile,
+                        title=title
+                    )
+                ready_sessions.clear()
+
+            def finish_session():
+                if current_session is not None:
+                    ready_sessions.append(current_session)
+
+            for line_number, line in enumerate(stream, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = fastjson.loads(line)
+                except ValueError:
+                    invalid(line_number)
+                    continue
+                if not isinstance(record, dict):
+                    invalid(line_number)
+                    continue
+
+                if record.get('type') == 'session':
+                    finish_session()
+                    current_session = None
+                    session_id = record.get('session_id')
+                    if (not isinstance(session_id, str) or not session_id
+                            or session_id in imported_session_ids
+                            or ConversationSession.objects.filter(session_id=session_id).exists()):
+                        skipped_sessions.append(session_id)
+                        continue
+                    current_session = (session_id, record.get('title'))
+                    imported_session_ids.append(session_id)
+
+                elif record.get('type') == 'message':
+                    if current_session is None or record.get('session_id') != current_session[0]:
+                        continue
+                    content = record.get('content')
+                    if record.get('role') not in ('system', 'user', 'assistant') \
+                            or not isinstance(content, str) or not content:
+                        invalid(line_number)
+                        continue
+                    message = {
+                        'user_id': supabase_user.id,
+                        'session_id': current_session[0],
+                        'role': record['role'],
+                        'content': content
+                    }
+                    if record.get('created_at'):
+                        message['created_at'] = record['created_at']
+                    batch.append(message)
+                    imported_messages += 1
+                    if len(batch) >= batch_size:
+                        flush()
+            finish_session()
+            flush()
 
             return Response({
-                'sessions': sessions_data
+                'sessions_imported': len(imported_session_ids),
+                'messages_imported': imported_messages,
+                'sessions_skipped': skipped_sessions,
+                'invalid_lines': invalid_lines,
+                'invalid_line_count': invalid_count
             }, status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response(
                 {'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
             )
+
+
+class _PeekableStream:
+    """
+    File-like wrapper that allows looking at the first bytes of a request body
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffer = b''
+
+    def peek(self, size: int) -> bytes:
+        if len(self._buffer) < size:
+            self._buffer += self._stream.read(size - len(self._buffer))
+        return self._buffer[:size]
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            data, self._buffer = self._buffer + self._stream.read(), b''
+            return data
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        if len(data) < size:
+            data += self._stream.read(size - len(data))
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        newline = self._buffer.find(b'\n')
+        if newline >= 0:
+            data, self._buffer = self._buffer[:newline + 1], self._buffer[newline + 1:]
+            return data
+        data, self._buffer = self._buffer, b''
+        return data + self._stream.readline()
+
+    def __iter__(self):
+        return iter(self.readline, b'')
@@ -0,0 +1,90 @@
+"""
+WebSocket chat channel for the Django service
+Served at <API_PATH_PREFIX>chat/ws/ by the ASGI application; see
+safycore_backend.websocket for the frame protocol
+"""
+import base64
+import json
+
+from django.db import close_old_connections
+from rest_framework import exceptions
+
+from safycore_backend.resilience import current_deadline, deadline_scope
+from safycore_backend.supabase_client import get_user_supabase_client
+from safycore_backend.websocket import TurnError, serve_asgi
+from users.authentication import SupabaseAuthentication
+from .models import Catalog
+from .turns import get_catalog, prepare_turn, stream_reply
+
+
+class SocketUser:
+    """The authenticated principal of one connection"""
+
+    def __init__(self, user_profile, supabase_user, token):
+        self.user_profile = user_profile
+        self.supabase_user = supabase_user
+        self.token = token
+        self.expires_at = token_expiry(token)
+
+    @property
+    def identity(self):
+        return self.supabase_user.id
+
+
+def token_expiry(token: str):
+    """
+    The exp claim of a JWT, or None if it has none
+    Only called on tokens Supabase has already verified
+    """
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def authenticate(frame) -> SocketUser:
+    """Validate a Supabase access token sent in an auth frame"""
+    token = frame.get('token')
+    if not token:
+        raise exceptions.AuthenticationFailed('token is required')
+    try:
+        user_profile, supabase_user = SupabaseAuthentication().authenticate_token(token)
+    finally:
+        close_old_connections()
+    return SocketUser(user_profile, supabase_user, token)
+
+
+def start_turn(user: SocketUser, frame):
+    """
+    Record the user's message and return the reply generator
+    Same steps as ChatStreamView, with one deadline budget per turn
+    """
+    close_old_connections()
+    with deadline_scope():
+        supabase = get_user_supabase_client(user.token)
+        try:
+            catalog = get_catalog(user.user_profile, frame['catalog_id']) if frame.get('catalog_id') else None
+        except Catalog.DoesNotExist:
+            raise TurnError('Catalog not found', 404)
+        conversation, groq_messages = prepare_turn(
+            supabase, user.user_profile, user.supabase_user,
+            frame['session_id'], frame['message'], frame.get('training_data'), catalog
+        )
+        deadline = current_deadline()
+    return _closing_connections(stream_reply(supabase, user.supabase_user, conversation, groq_messages, deadline))
+
+
+def _closing_connections(generator):
+    """Release the worker thread's database connection when the turn ends"""
+    try:
+        return (yield from generator)
+    finally:
+        generator.close()
+        close_old_connections()
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI entry point for websocket connections"""
+    await serve_asgi(scope, receive, send, authenticate, start_turn, name='chat.ws')
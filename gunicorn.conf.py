@@ -0,0 +1,76 @@
+"""
+Gunicorn server profile, read automatically from the working directory
+Every setting comes from the environment so one file serves all deployments:
+
+    gunicorn                                     # gthread workers, WSGI
+    GUNICORN_WORKER_CLASS=uvicorn gunicorn       # ASGI, adds the WebSocket channel
+    GUNICORN_WORKER_CLASS=sync WEB_CONCURRENCY=9 gunicorn
+
+A streaming chat holds its worker (sync) or thread (gthread) for the whole
+generation, so the default is gthread: many cheap threads per process, and
+the worker keeps heartbeating while its threads stream.
+"""
+import multiprocessing
+import os
+
+CORES = multiprocessing.cpu_count()
+
+# sync: one request per process; gthread: a thread pool per process;
+# uvicorn: an event loop per process running the ASGI application
+WORKER_CLASS = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'uvicorn': 'uvicorn.workers.UvicornWorker',
+}
+if WORKER_CLASS not in WORKER_CLASSES:
+    raise ValueError(f"GUNICORN_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}")
+
+worker_class = WORKER_CLASSES[WORKER_CLASS]
+wsgi_app = 'safycore_backend.asgi:application' if WORKER_CLASS == 'uvicorn' \
+    else 'safycore_backend.wsgi:application'
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+
+# Sync workers spend most of their time blocked on Groq and Supabase, so they
+# need the classic 2n+1; threaded and async workers only need one per core
+# plus one to cover a worker that is restarting
+DEFAULT_WORKERS = 2 * CORES + 1 if WORKER_CLASS == 'sync' else CORES + 1
+workers = int(os.getenv('WEB_CONCURRENCY', str(DEFAULT_WORKERS)))
+# Concurrent requests per gthread worker, i.e. concurrent streams per process
+threads = int(os.getenv('GUNICORN_THREADS', '32')) if WORKER_CLASS == 'gthread' else 1
+# Connections a gthread worker accepts, busy or kept alive. A worker accepts
+# even when all its threads are streaming, and those requests then wait for
+# a stream to end; a limit near `threads` hands them to another worker but
+# leaves few keep-alive slots
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# Seconds a silent worker lives before it is killed. Sync workers cannot
+# heartbeat while streaming, so this must cover the longest generation
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+# Seconds in-flight streams get to finish on reload or shutdown
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '60'))
+# Longer than the proxy's idle timeout so the proxy, not us, closes idle connections
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '75'))
+
+# Recycle workers after this many requests to contain slow leaks; the jitter
+# spreads the restarts so workers do not all recycle at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+
+# Import Django, the views and the SDKs once in the master; workers share
+# those pages copy-on-write and boot without re-importing
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+# Workers heartbeat by touching a file; keep it in memory so a slow disk
+# cannot get a healthy worker killed
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from safycore_backend.warmup import after_fork
+
+        after_fork()
@@ -13,4 +13,24 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'safycore_backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+from chat.websocket import websocket_application  # noqa: E402
+from safycore_backend.warmup import warm_up, warm_up_enabled  # noqa: E402
+
+WEBSOCKET_PATH = settings.API_PATH_PREFIX + 'chat/ws/'
+
+
+async def application(scope, receive, send):
+    """Route the chat WebSocket to its handler and everything else to Django"""
+    if scope['type'] == 'websocket':
+        if scope['path'] == WEBSOCKET_PATH:
+            return await websocket_application(scope, receive, send)
+        await receive()
+        return await send({'type': 'websocket.close', 'code': 4404})
+    return await django_application(scope, receive, send)
+
+
+if warm_up_enabled():
+    warm_up()
@@ -0,0 +1,46 @@
+"""
+ETag helpers for conditional GETs on DRF views
+DRF authenticates inside the view, so validators are computed there rather
+than with django.views.decorators.http.condition
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from safycore_backend import metrics
+
+# Bump when the response shape changes so clients drop cached bodies
+REPRESENTATION_VERSION = '1'
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag from the values that determine a response body"""
+    key = '\x1f'.join(str(part) for part in (REPRESENTATION_VERSION,) + parts)
+    return '"' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def not_modified(request, etag: str, name: str):
+    """
+    Return a 304 response if the client's If-None-Match matches, else None
+
+    Args:
+        request: DRF or Django request
+        etag: Validator of the current representation
+        name: Metrics name of the endpoint
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        metrics.incr(f'{name}.not_modified')
+        finalize(response, etag)
+    return response
+
+
+def finalize(response, etag: str):
+    """
+    Attach the ETag and make clients revalidate on every poll
+    The response depends on the bearer token, so shared caches must not store it
+    """
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
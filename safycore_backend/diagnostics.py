@@ -0,0 +1,309 @@
+"""
+On-demand diagnostics of a live worker
+Nothing here runs until an operator asks: a CPU profile samples every
+other thread's stack from the requesting thread for a bounded time,
+tracemalloc traces allocations only between start and stop (and stops by
+itself after TRACEMALLOC_MAX_SECONDS), and live counts are computed when
+read. An idle process pays nothing.
+
+Profiles come out as collapsed stacks, one "frame;frame;frame count" line
+per distinct stack, which flamegraph.pl, speedscope and inferno read as is.
+
+Access needs DIAGNOSTICS_TOKEN; without it both services hide the
+endpoints. Shared by the Django and FastAPI services; no Django imports.
+"""
+import gc
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Shared secret for the diagnostics endpoints; empty disables them
+DIAGNOSTICS_TOKEN = os.getenv('DIAGNOSTICS_TOKEN', '')
+DIAGNOSTICS_HEADER = 'X-Diagnostics-Token'
+# Longest CPU profile, and milliseconds between stack samples
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '30'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '10'))
+# Tracing stops by itself after this long, in case nobody stops it
+TRACEMALLOC_MAX_SECONDS = float(os.getenv('TRACEMALLOC_MAX_SECONDS', '600'))
+# Snapshots kept for diffs
+MAX_SNAPSHOTS = 4
+
+TCP_STATES = {
+    '01': 'ESTABLISHED', '02': 'SYN_SENT', '03': 'SYN_RECV', '04': 'FIN_WAIT1',
+    '05': 'FIN_WAIT2', '06': 'TIME_WAIT', '07': 'CLOSE', '08': 'CLOSE_WAIT',
+    '09': 'LAST_ACK', '0A': 'LISTEN', '0B': 'CLOSING',
+}
+
+
+class Busy(Exception):
+    """Another profile is already running in this process"""
+
+
+def authorized(token) -> bool:
+    """Whether a request's token opens the diagnostics endpoints"""
+    return bool(DIAGNOSTICS_TOKEN) and bool(token) and hmac.compare_digest(str(token), DIAGNOSTICS_TOKEN)
+
+
+# Live counts
+
+_counts = {}
+
+
+def register(name: str, count) -> None:
+    """Add a live count; count() is called only when counts are read"""
+    _counts[name] = count
+
+
+def counts(types=()) -> dict:
+    """
+    Registered counts, process figures and open connections
+
+    Args:
+        types: Class names whose live instances are counted, e.g. Groq or
+            SyncClient; walks the heap, so only on request
+    """
+    data = {}
+    for name, count in list(_counts.items()):
+        try:
+            data[name] = count()
+        except Exception as e:
+            data[name] = f'error: {e}'
+
+    data['process'] = {
+        'pid': os.getpid(),
+        'threads': threading.active_count(),
+        'rss_bytes': _rss_bytes(),
+        'gc_objects': len(gc.get_objects()),
+        'gc_generations': gc.get_count(),
+        'tracemalloc': tracemalloc.is_tracing(),
+    }
+    data['connections'] = connections()
+    if types:
+        wanted = set(types)
+        found = Counter(type(obj).__name__ for obj in gc.get_objects() if type(obj).__name__ in wanted)
+        data['instances'] = {name: found.get(name, 0) for name in types}
+    return data
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def connections():
+    """Open file descriptors, sockets and this process's TCP connections by state (Linux only)"""
+    try:
+        descriptors = os.listdir('/proc/self/fd')
+    except OSError:
+        return None
+    sockets = set()
+    for fd in descriptors:
+        try:
+            target = os.readlink(f'/proc/self/fd/{fd}')
+        except OSError:
+            continue
+        if target.startswith('socket:['):
+            sockets.add(target[8:-1])
+
+    tcp = Counter()
+    for table in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            with open(table) as rows:
+                next(rows)
+                for row in rows:
+                    fields = row.split()
+                    if fields[9] in sockets:
+                        tcp[TCP_STATES.get(fields[3], fields[3])] += 1
+        except (OSError, StopIteration, IndexError):
+            continue
+    return {'fds': len(descriptors), 'sockets': len(sockets), 'tcp': dict(tcp)}
+
+
+# CPU profile
+
+_profiling = threading.Lock()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get('__name__') or os.path.basename(code.co_filename)
+    return f'{module}:{getattr(code, "co_qualname", code.co_name)}'.replace(';', ':').replace(' ', '_')
+
+
+def _cpu_clock(ident):
+    try:
+        return time.pthread_getcpuclockid(ident)
+    except (AttributeError, OSError):
+        return None
+
+
+def profile(seconds: float, mode: str = 'cpu', interval: float = None) -> dict:
+    """
+    Sample every thread's stack for a while
+
+    Args:
+        seconds: Duration, capped at PROFILE_MAX_SECONDS
+        mode: 'cpu' counts a thread's stack only when the thread used CPU
+            since the previous sample, so idle pools and waits drop out;
+            'wall' counts every thread every time
+        interval: Seconds between samples, default PROFILE_INTERVAL_MS
+
+    Returns:
+        dict: stacks (Counter of collapsed stacks, rooted at the thread
+            name), samples taken, seconds and mode
+
+    Raises:
+        Busy: A profile is already running
+    """
+    seconds = max(0.0, min(seconds, PROFILE_MAX_SECONDS))
+    interval = interval or PROFILE_INTERVAL_MS / 1000
+    if not _profiling.acquire(blocking=False):
+        raise Busy('A profile is already running')
+    try:
+        stacks = Counter()
+        cpu_seen = {}  # thread ident -> CPU seconds at the previous sample
+        me = threading.get_ident()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if mode == 'cpu':
+                    clock = _cpu_clock(ident)
+                    if clock is not None:
+                        try:
+                            used = time.clock_gettime(clock)
+                        except OSError:
+                            continue
+                        previous = cpu_seen.get(ident)
+                        cpu_seen[ident] = used
+                        if previous is None or used - previous <= 0:
+                            continue
+                frames = []
+                while frame is not None:
+                    frames.append(_frame_name(frame))
+                    frame = frame.f_back
+                frames.append(names.get(ident, f'thread-{ident}').replace(';', ':').replace(' ', '_'))
+                stacks[';'.join(reversed(frames))] += 1
+            samples += 1
+            time.sleep(interval)
+        return {'stacks': stacks, 'samples': samples, 'seconds': seconds, 'mode': mode}
+    finally:
+        _profiling.release()
+
+
+def collapsed(stacks: Counter) -> str:
+    """Collapsed-stack text, heaviest stacks first"""
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+# Memory
+
+_memory_lock = threading.Lock()
+_snapshots = {}  # id -> tracemalloc.Snapshot
+_snapshot_ids = iter(range(1, sys.maxsize))
+_stop_timer = None
+
+# Allocations made by tracemalloc and the import system are noise here
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+)
+
+
+def start_tracing(frames: int = 1) -> dict:
+    """Start tracemalloc, keeping `frames` frames per allocation"""
+    global _stop_timer
+    with _memory_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, min(frames, 25)))
+            _stop_timer = threading.Timer(TRACEMALLOC_MAX_SECONDS, stop_tracing)
+            _stop_timer.daemon = True
+            _stop_timer.start()
+        return memory_status()
+
+
+def stop_tracing() -> dict:
+    """Stop tracemalloc and drop its snapshots, releasing the tracing memory"""
+    global _stop_timer
+    with _memory_lock:
+        if _stop_timer is not None:
+            _stop_timer.cancel()
+            _stop_timer = None
+        _snapshots.clear()
+        tracemalloc.stop()
+        return memory_status()
+
+
+def memory_status() -> dict:
+    traced, peak = tracemalloc.get_traced_memory()
+    return {
+        'tracing': tracemalloc.is_tracing(),
+        'traced_bytes': traced,
+        'peak_bytes': peak,
+        'tracemalloc_overhead_bytes': tracemalloc.get_tracemalloc_memory(),
+        'snapshots': sorted(_snapshots),
+    }
+
+
+def _stat(stat, diff: bool = False) -> dict:
+    entry = {
+        'where': [f'{frame.filename}:{frame.lineno}' for frame in stat.traceback],
+        'size_bytes': stat.size,
+        'count': stat.count,
+    }
+    if diff:
+        entry['size_diff_bytes'] = stat.size_diff
+        entry['count_diff'] = stat.count_diff
+    return entry
+
+
+def take_snapshot(top: int = 20, group_by: str = 'lineno') -> dict:
+    """
+    Snapshot the traced allocations and list the largest sites
+
+    Raises:
+        RuntimeError: Tracing is off; call start_tracing() first
+    """
+    with _memory_lock:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError('tracemalloc is not tracing; start it first')
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        snapshot_id = next(_snapshot_ids)
+        _snapshots[snapshot_id] = snapshot
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            del _snapshots[min(_snapshots)]
+    stats = snapshot.statistics(group_by)
+    return {
+        'id': snapshot_id,
+        'total_bytes': sum(stat.size for stat in stats),
+        'top': [_stat(stat) for stat in stats[:top]],
+    }
+
+
+def diff_snapshots(old: int, new: int, top: int = 20, group_by: str = 'lineno') -> dict:
+    """
+    Largest allocation changes between two snapshots
+
+    Raises:
+        KeyError: A snapshot id is unknown or was dropped
+    """
+    with _memory_lock:
+        before, after = _snapshots[old], _snapshots[new]
+    stats = after.compare_to(before, group_by)
+    return {
+        'from': old,
+        'to': new,
+        'size_diff_bytes': sum(stat.size_diff for stat in stats),
+        'top': [_stat(stat, diff=True) for stat in stats[:top]],
+    }
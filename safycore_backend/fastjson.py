@@ -0,0 +1,74 @@
+"""
+JSON encoding shared by the Django and FastAPI services
+Uses orjson when it is installed and the standard library otherwise; both
+paths serialize datetime, date, time and UUID values the same way
+
+This module has no Django imports so app.py can use it too.
+"""
+import datetime
+import json
+import uuid
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib encoder is always available
+    orjson = None
+
+HAS_ORJSON = orjson is not None
+
+if HAS_ORJSON:
+    # Naive datetimes stay naive, UTC is written as "Z", non-str keys are
+    # coerced to strings like json.dumps does
+    ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+    JSONDecodeError = orjson.JSONDecodeError
+else:
+    JSONDecodeError = json.JSONDecodeError
+
+
+def _isoformat(value):
+    text = value.isoformat()
+    return text[:-6] + 'Z' if text.endswith('+00:00') else text
+
+
+def stdlib_default(value):
+    """json.dumps default= hook matching orjson's native types"""
+    if isinstance(value, (datetime.datetime, datetime.time)):
+        return _isoformat(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(value, default=None) -> bytes:
+    """
+    Serialize to compact UTF-8 JSON bytes
+
+    Args:
+        value: Object to encode
+        default: Hook for types neither encoder handles natively (e.g. Decimal)
+    """
+    if HAS_ORJSON:
+        try:
+            return orjson.dumps(value, default=default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Integers wider than 64 bits and other edge cases orjson rejects
+            pass
+
+    def fallback(obj):
+        try:
+            return stdlib_default(obj)
+        except TypeError:
+            if default is None:
+                raise
+            return default(obj)
+
+    return json.dumps(value, default=fallback, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    """Parse JSON from bytes or str"""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
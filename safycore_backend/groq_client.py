@@ -0,0 +1,109 @@
+"""
+Groq client configuration and utilities
+The groq SDK is imported on first use to keep cold starts short
+"""
+from safycore_backend import metrics
+from safycore_backend.resilience import guarded_call, remaining
+
+_client = None
+
+
+def new_groq_client(api_key: str):
+    """Build a Groq client, importing the SDK on first use"""
+    from groq import Groq
+
+    return Groq(api_key=api_key)
+
+
+def get_groq_client():
+    """
+    Get the process-wide Groq client
+    Reusing one client keeps its HTTP connection pool warm across requests
+    """
+    global _client
+    if _client is None:
+        from django.conf import settings
+
+        if not settings.GROQ_API_KEY:
+            raise ValueError("GROQ_API_KEY must be set in environment variables")
+        _client = new_groq_client(settings.GROQ_API_KEY)
+    return _client
+
+
+def create_chat_completion(client=None, **kwargs):
+    """
+    Create a chat completion under the current request deadline
+
+    Args:
+        client: Groq client to use, defaults to get_groq_client()
+        **kwargs: Passed through to client.chat.completions.create
+    """
+    client = client or get_groq_client()
+    timeout = remaining()
+    if timeout is not None:
+        kwargs.setdefault('timeout', timeout)
+    return guarded_call('groq', client.chat.completions.create, **kwargs)
+
+
+def usage_from_chunk(chunk):
+    """
+    Return the usage attached to a streamed chunk, if any
+    Groq reports it on the final chunk under x_groq.usage
+    """
+    usage = getattr(chunk, 'usage', None)
+    if usage is None and getattr(chunk, 'x_groq', None) is not None:
+        usage = getattr(chunk.x_groq, 'usage', None)
+    return usage
+
+
+def usage_counts(usage) -> tuple:
+    """
+    Token counts of a usage object
+
+    Returns:
+        tuple: (prompt_tokens, cached_prompt_tokens, completion_tokens), zeros when usage is None
+    """
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = (getattr(details, 'cached_tokens', 0) or 0) if details is not None else 0
+    return (
+        getattr(usage, 'prompt_tokens', 0) or 0,
+        cached_tokens,
+        getattr(usage, 'completion_tokens', 0) or 0,
+    )
+
+
+def record_usage(usage) -> None:
+    """
+    Record prompt, cached and completion token counts from a usage object
+    The cached share shows how often the provider reused a prompt prefix
+    """
+    if usage is None:
+        return
+    prompt_tokens, cached_tokens, completion_tokens = usage_counts(usage)
+
+    metrics.incr('groq.prompt_tokens', prompt_tokens)
+    metrics.incr('groq.cached_prompt_tokens', cached_tokens)
+    metrics.incr('groq.completion_tokens', completion_tokens)
+    total = metrics.counter('groq.prompt_tokens')
+    if total:
+        metrics.set_gauge('groq.prompt_cache_hit_ratio', metrics.counter('groq.cached_prompt_tokens') / total)
+
+
+def cancel_stream(stream, chunks_received: int, max_completion_tokens: int) -> None:
+    """
+    Stop a streaming completion whose reader went away
+
+    Closing the stream drops the HTTP connection, so Groq stops generating.
+    Each streamed chunk carries about one token, so the tokens saved are
+    estimated as the unused part of the completion budget (an upper bound).
+    """
+    close = getattr(stream, 'close', None)
+    if close is not None:
+        try:
+            close()
+        except Exception:
+            pass
+    metrics.incr('groq.streams_cancelled')
+    metrics.incr('groq.completion_tokens_saved', max(0, max_completion_tokens - chunks_received))
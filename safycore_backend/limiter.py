@@ -0,0 +1,254 @@
+"""
+Adaptive concurrency limit for chat turns
+Turns beyond the limit wait briefly for a slot; once a turn has been queued
+longer than the queueing-delay target (counting time spent in the proxy's
+queue) it is rejected at once with 503 and Retry-After instead of holding a
+worker for an answer its client will have given up on.
+
+The limit follows the service time of completed turns: it grows while
+turns finish as fast as they do unloaded and shrinks in proportion when
+they slow down. Continuing sessions keep a reserved share of the limit and
+are admitted before waiting new sessions.
+
+Shared by the Django and FastAPI services; no Django imports.
+"""
+import math
+import os
+import threading
+import time
+
+from safycore_backend import metrics
+
+# Set to 0 to admit every turn
+LOAD_SHEDDING = os.getenv('CHAT_LOAD_SHEDDING', '1') != '0'
+# Concurrent turns per process: starting point and bounds of the adaptive limit
+CHAT_LIMIT_INITIAL = int(os.getenv('CHAT_LIMIT_INITIAL', '16'))
+CHAT_LIMIT_MIN = int(os.getenv('CHAT_LIMIT_MIN', '2'))
+CHAT_LIMIT_MAX = int(os.getenv('CHAT_LIMIT_MAX', '64'))
+# Longest a turn may wait for a slot, including time queued before the app
+CHAT_QUEUE_TARGET_MS = float(os.getenv('CHAT_QUEUE_TARGET_MS', '500'))
+# Share of the limit only continuing sessions may use
+CHAT_LIMIT_RESERVE = float(os.getenv('CHAT_LIMIT_RESERVE', '0.25'))
+
+
+class Overloaded(Exception):
+    """The turn was shed; retry_after is the suggested wait in seconds"""
+
+    def __init__(self, retry_after: int):
+        super().__init__('Server is busy, retry later')
+        self.retry_after = retry_after
+
+
+def upstream_queue_seconds(request_start) -> float:
+    """
+    Seconds a request spent queued before the app, from an X-Request-Start
+    header ("t=<epoch>" in seconds, milliseconds or microseconds)
+    """
+    if not request_start:
+        return 0.0
+    try:
+        started = float(str(request_start).strip().removeprefix('t='))
+    except ValueError:
+        return 0.0
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, time.time() - started)
+
+
+class Ticket:
+    """An admitted turn; release() it once, when the reply has been sent"""
+
+    def __init__(self, limiter, started: float):
+        self._limiter = limiter
+        self._started = started
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            if self._limiter is not None:
+                self._limiter._release(time.monotonic() - self._started)
+
+    def hold(self, body):
+        """Wrap a sync or async streaming body so the ticket is released when it ends or is closed"""
+        return _HeldAsyncBody(body, self) if hasattr(body, '__anext__') else _HeldBody(body, self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _HeldBody:
+    """Streaming body that releases its ticket on exhaustion or close"""
+
+    def __init__(self, body, ticket: Ticket):
+        self.body = body
+        self.ticket = ticket
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.body)
+        except BaseException:
+            self.ticket.release()
+            raise
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.ticket.release()
+
+
+class _HeldAsyncBody:
+    """Async streaming body that releases its ticket on exhaustion or close"""
+
+    def __init__(self, body, ticket: Ticket):
+        self.body = body
+        self.ticket = ticket
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.body.__anext__()
+        except BaseException:
+            self.ticket.release()
+            raise
+
+    async def aclose(self):
+        try:
+            await self.body.aclose()
+        finally:
+            self.ticket.release()
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit adjusted from the service time of completed turns
+
+    After each turn the limit moves towards limit * (baseline / recent) plus
+    a queue allowance of sqrt(limit), where recent is a moving average of
+    the service time and baseline the fastest turn of the last one or two
+    windows, i.e. the unloaded service time.
+
+    Args:
+        name: Metrics prefix (limiter.<name>.*)
+        queue_target: Seconds a turn may wait for a slot before it is shed
+        reserve: Share of the limit kept for continuing sessions
+    """
+    # Weight of a new sample in the recent service time
+    RECENT_WEIGHT = 0.2
+    # Seconds per baseline window
+    BASELINE_WINDOW = 60.0
+    # How far one adjustment moves the limit towards its target
+    SMOOTHING = 0.2
+
+    def __init__(self, name: str, initial: int = CHAT_LIMIT_INITIAL, min_limit: int = CHAT_LIMIT_MIN,
+                 max_limit: int = CHAT_LIMIT_MAX, queue_target: float = CHAT_QUEUE_TARGET_MS / 1000,
+                 reserve: float = CHAT_LIMIT_RESERVE, enabled: bool = LOAD_SHEDDING):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.queue_target = queue_target
+        self.reserve = reserve
+        self.enabled = enabled
+        self.limit = float(initial)
+        self.inflight = 0
+        self._waiting = {True: 0, False: 0}  # continuing -> turns waiting for a slot
+        self._recent = None
+        self._window_min = self._previous_min = math.inf
+        self._window_started = time.monotonic()
+        self._cond = threading.Condition()
+        self._publish()
+
+    def acquire(self, continuing: bool, queued: float = 0.0, wait: bool = True) -> Ticket:
+        """
+        Admit a turn or shed it
+
+        Args:
+            continuing: The session already has history
+            queued: Seconds the request already waited before the app
+            wait: Wait for a slot up to the queueing target; async callers
+                pass False and are shed at once when the limit is reached
+
+        Raises:
+            Overloaded: The turn could not start within the queueing target
+        """
+        if not self.enabled:
+            return Ticket(None, time.monotonic())
+
+        arrived = time.monotonic()
+        budget = self.queue_target - queued if wait else 0.0
+        with self._cond:
+            if queued > self.queue_target:
+                self._shed(continuing)
+            if not self._has_room(continuing):
+                self._waiting[continuing] += 1
+                try:
+                    while not self._has_room(continuing):
+                        left = budget - (time.monotonic() - arrived)
+                        if left <= 0:
+                            self._shed(continuing)
+                        self._cond.wait(left)
+                finally:
+                    self._waiting[continuing] -= 1
+            self.inflight += 1
+            metrics.set_gauge(f'limiter.{self.name}.inflight', self.inflight)
+
+        started = time.monotonic()
+        metrics.observe(f'limiter.{self.name}.queue_delay', queued + started - arrived)
+        metrics.incr(f'limiter.{self.name}.admitted')
+        return Ticket(self, started)
+
+    def _has_room(self, continuing: bool) -> bool:
+        limit = int(self.limit)
+        if continuing:
+            return self.inflight < limit
+        # New sessions leave the reserve to continuing ones and let their waiters go first
+        return not self._waiting[True] and self.inflight < max(1, limit - math.ceil(limit * self.reserve))
+
+    def _shed(self, continuing: bool):
+        kind = 'continuing' if continuing else 'new'
+        metrics.incr(f'limiter.{self.name}.shed.{kind}')
+        raise Overloaded(self.retry_after())
+
+    def retry_after(self) -> int:
+        """Whole seconds until a slot is likely free: about one service time"""
+        return min(30, max(1, math.ceil(self._recent or 1)))
+
+    def _release(self, service: float) -> None:
+        with self._cond:
+            self.inflight -= 1
+            self._recent = service if self._recent is None else \
+                self._recent + self.RECENT_WEIGHT * (service - self._recent)
+
+            now = time.monotonic()
+            if now - self._window_started > self.BASELINE_WINDOW:
+                self._previous_min, self._window_min = self._window_min, service
+                self._window_started = now
+            else:
+                self._window_min = min(self._window_min, service)
+            baseline = min(self._window_min, self._previous_min)
+
+            gradient = max(0.5, min(1.0, baseline / self._recent)) if self._recent > 0 else 1.0
+            target = self.limit * gradient + math.sqrt(self.limit)
+            limit = self.limit + self.SMOOTHING * (target - self.limit)
+            self.limit = max(self.min_limit, min(self.max_limit, limit))
+            self._publish()
+            self._cond.notify_all()
+
+    def _publish(self):
+        metrics.set_gauge(f'limiter.{self.name}.limit', round(self.limit, 2))
+        metrics.set_gauge(f'limiter.{self.name}.inflight', self.inflight)
+
+
+chat_limiter = AdaptiveLimiter('chat')
@@ -0,0 +1,87 @@
+"""
+Lightweight in-process metrics registry
+Counters, gauges and latency samples shared by the Django and FastAPI services
+"""
+import threading
+from collections import defaultdict, deque
+
+# Number of latency samples kept per series for percentile estimates
+SAMPLE_WINDOW = 512
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+_samples = defaultdict(lambda: deque(maxlen=SAMPLE_WINDOW))
+
+
+def incr(name: str, value: float = 1) -> None:
+    """Increment a counter"""
+    with _lock:
+        _counters[name] += value
+
+
+def counter(name: str) -> float:
+    """Current value of a counter"""
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def set_gauge(name: str, value) -> None:
+    """Set a gauge to its current value"""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float) -> None:
+    """Record a latency sample (seconds)"""
+    with _lock:
+        _samples[name].append(value)
+
+
+def sample_count(name: str) -> int:
+    """Number of retained samples for a series"""
+    with _lock:
+        return len(_samples[name]) if name in _samples else 0
+
+
+def percentile(name: str, q: float, default: float = None):
+    """
+    Return the q-th percentile of a latency series
+
+    Args:
+        name: Series name passed to observe()
+        q: Percentile between 0 and 100
+        default: Returned when the series has no samples
+    """
+    with _lock:
+        values = sorted(_samples[name]) if name in _samples else []
+    if not values:
+        return default
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def snapshot() -> dict:
+    """Return a JSON-serializable view of every metric"""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        series = {name: sorted(values) for name, values in _samples.items()}
+
+    latencies = {}
+    for name, values in series.items():
+        if not values:
+            continue
+        last = len(values) - 1
+        latencies[name] = {
+            'count': len(values),
+            'p50': values[int(round(0.50 * last))],
+            'p95': values[int(round(0.95 * last))],
+            'p99': values[int(round(0.99 * last))],
+        }
+
+    return {
+        'counters': counters,
+        'gauges': gauges,
+        'latency': latencies,
+    }
@@ -0,0 +1,153 @@
+"""
+Project-level middleware
+"""
+import gzip
+import re
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.middleware.clickjacking import XFrameOptionsMiddleware
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from safycore_backend import metrics
+from safycore_backend.resilience import deadline_scope
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+class DeadlineMiddleware:
+    """
+    Give every request a deadline budget that upstream calls inherit
+    Streaming views capture current_deadline() for their generators
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with deadline_scope() as deadline:
+            request.deadline = deadline
+            return self.get_response(request)
+
+
+def is_api_request(request) -> bool:
+    """True for requests served by the bearer-token API rather than the admin"""
+    return request.path_info.startswith(settings.API_PATH_PREFIX)
+
+
+class SkipForAPIMixin:
+    """
+    Bypass a browser-only middleware for API requests
+
+    API clients authenticate with Supabase bearer tokens, so sessions, CSRF
+    cookies, Django auth, messages and frame options do nothing for them.
+    The admin still gets the full behaviour, and the subclasses keep Django's
+    admin system checks satisfied.
+    """
+
+    def __call__(self, request):
+        if is_api_request(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class BrowserSessionMiddleware(SkipForAPIMixin, SessionMiddleware):
+    pass
+
+
+class BrowserCsrfViewMiddleware(SkipForAPIMixin, CsrfViewMiddleware):
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        # Django calls process_view separately from __call__
+        if is_api_request(request):
+            return None
+        return super().process_view(request, callback, callback_args, callback_kwargs)
+
+
+class BrowserAuthenticationMiddleware(SkipForAPIMixin, AuthenticationMiddleware):
+    pass
+
+
+class BrowserMessageMiddleware(SkipForAPIMixin, MessageMiddleware):
+    pass
+
+
+class BrowserXFrameOptionsMiddleware(SkipForAPIMixin, XFrameOptionsMiddleware):
+    pass
+
+
+_ACCEPT_ENCODING = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*')
+
+
+def negotiate_encoding(accept_encoding: str):
+    """
+    Pick the best supported content coding from an Accept-Encoding header
+
+    Returns:
+        str: 'br', 'gzip' or None for identity
+    """
+    weights = {}
+    for item in accept_encoding.split(','):
+        match = _ACCEPT_ENCODING.fullmatch(item)
+        if not match:
+            continue
+        coding, q = match.groups()
+        try:
+            weights[coding.lower()] = float(q) if q is not None else 1.0
+        except ValueError:
+            continue
+
+    wildcard = weights.get('*', 0.0)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = weights.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress large responses with brotli (when installed) or gzip
+
+    Streaming responses are left alone: chat streams must reach the client
+    token by token, and the export endpoint compresses its own stream.
+    Strong ETags are weakened, as Django's GZipMiddleware does, because the
+    bytes on the wire no longer match the uncompressed representation.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if encoding == 'br':
+            compressed = brotli.compress(response.content, quality=5)
+        else:
+            compressed = gzip.compress(response.content, compresslevel=6, mtime=0)
+        if len(compressed) >= len(response.content):
+            return response
+
+        metrics.incr('http.compressed_bytes_saved', len(response.content) - len(compressed))
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
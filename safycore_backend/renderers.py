@@ -0,0 +1,55 @@
+"""
+orjson-backed renderer and parser for Django REST Framework
+Both fall back to the stock DRF classes when orjson is not installed
+"""
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from safycore_backend import fastjson
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson
+
+    Pretty-printed output (the browsable API or `; indent=` in Accept) and
+    installs without orjson are handled by the stock renderer.
+    """
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not fastjson.HAS_ORJSON:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # DRF's encoder covers the remaining types (Decimal, lazy strings, querysets)
+        ret = fastjson.dumps(data, default=self._encoder.default)
+
+        # Keep the output a strict javascript subset, as JSONRenderer does
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ORJSONParser(JSONParser):
+    """
+    JSONParser that decodes with orjson
+
+    orjson only reads UTF-8; other request charsets use the stock parser.
+    """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if not fastjson.HAS_ORJSON or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return fastjson.loads(stream.read())
+        except fastjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,302 @@
+"""
+Deadline budgets, circuit breakers and hedged reads for upstream calls
+Every Supabase and Groq call goes through guarded_call() so a stalled
+connection cannot hold a worker past the request's deadline
+"""
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from safycore_backend import metrics
+
+# Total time budget for one API request, shared by all of its upstream calls
+REQUEST_DEADLINE_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', '30'))
+
+# Hedged reads fire a second attempt once the first exceeds the observed p95
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv('HEDGE_MIN_DELAY_SECONDS', '0.05'))
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv('HEDGE_DEFAULT_DELAY_SECONDS', '1.0'))
+HEDGE_MIN_SAMPLES = 20
+
+# Consecutive failures before a breaker opens, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', '30'))
+
+# Threads used to bound blocking upstream calls by the deadline
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', '32'))
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before the upstream call finished"""
+
+
+class CircuitOpenError(Exception):
+    """The upstream's breaker is open, the call was not attempted"""
+
+
+class Deadline:
+    """
+    Absolute point in time by which a request must finish
+    """
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+_current_deadline = ContextVar('request_deadline', default=None)
+
+
+@contextmanager
+def deadline_scope(deadline=None):
+    """
+    Make a deadline current for the enclosed upstream calls
+
+    Args:
+        deadline: A Deadline, a budget in seconds, or None for the default budget
+    """
+    if deadline is None:
+        deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+    elif not isinstance(deadline, Deadline):
+        deadline = Deadline(deadline)
+
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline():
+    """Return the active Deadline, or None outside a request"""
+    return _current_deadline.get()
+
+
+def remaining(default: float = None):
+    """Seconds left in the active deadline, or default when there is none"""
+    deadline = current_deadline()
+    return deadline.remaining() if deadline else default
+
+
+class CircuitBreaker:
+    """
+    Per-upstream breaker that fast-fails while the upstream is down
+
+    closed: calls flow normally
+    open: calls fail immediately until the reset timeout passes
+    half_open: one trial call decides whether to close or re-open
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._set_state(self.CLOSED)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        metrics.set_gauge(f'breaker.{self.name}.state', self._STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        """Return True if a call may be attempted now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    metrics.incr(f'breaker.{self.name}.opened')
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(upstream: str) -> CircuitBreaker:
+    """Return the process-wide breaker for an upstream"""
+    with _breakers_lock:
+        if upstream not in _breakers:
+            _breakers[upstream] = CircuitBreaker(upstream)
+        return _breakers[upstream]
+
+
+_executor = ThreadPoolExecutor(max_workers=UPSTREAM_POOL_SIZE, thread_name_prefix='upstream')
+
+
+def _is_upstream_failure(exc: BaseException) -> bool:
+    """
+    Only outages count against the breaker; an upstream that answers with
+    a client error (bad credentials, constraint violation) is healthy
+    """
+    # httpx is only checked once an SDK has imported it; no import cost otherwise
+    httpx = sys.modules.get('httpx')
+    while exc is not None:
+        if isinstance(exc, (DeadlineExceeded, TimeoutError)):
+            return True
+        if httpx is not None and isinstance(exc, httpx.TransportError):
+            return True
+        status_code = getattr(exc, 'status_code', None) or getattr(exc, 'status', None)
+        if isinstance(status_code, int) and status_code >= 500:
+            return True
+        exc = exc.__cause__
+    return False
+
+
+def _hedge_delay(upstream: str) -> float:
+    series = f'{upstream}.latency'
+    if metrics.sample_count(series) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY_SECONDS
+    return max(HEDGE_MIN_DELAY_SECONDS, metrics.percentile(series, 95))
+
+
+def _wait_first(futures, timeout):
+    """Return the result of the first future to succeed within timeout"""
+    pending = set(futures)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    error = None
+    while pending:
+        left = None if deadline is None else max(0.0, deadline - time.monotonic())
+        done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded('Upstream call exceeded the request deadline')
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def _hedged(upstream: str, call, timeout):
+    delay = _hedge_delay(upstream)
+    primary = _executor.submit(call)
+    done, _ = wait([primary], timeout=delay if timeout is None else min(delay, timeout))
+    if done:
+        return primary.result()
+
+    left = None if timeout is None else timeout - delay
+    if left is not None and left <= 0:
+        raise DeadlineExceeded('Upstream call exceeded the request deadline')
+
+    metrics.incr(f'{upstream}.hedged')
+    backup = _executor.submit(call)
+    return _wait_first([primary, backup], left)
+
+
+def guarded_call(upstream: str, fn, *args, hedge: bool = False, **kwargs):
+    """
+    Call an upstream under the current deadline and the upstream's breaker
+
+    Args:
+        upstream: Breaker and metrics name, e.g. 'supabase' or 'groq'
+        fn: Blocking callable performing the upstream request
+        hedge: Send a second attempt after the p95 latency (idempotent reads only)
+
+    Raises:
+        CircuitOpenError: The upstream is currently marked as down
+        DeadlineExceeded: The request budget ran out
+    """
+    # Checked before allow(): a half-open breaker hands out its single trial
+    # slot there, and a call that never runs would never give it back
+    timeout = remaining()
+    if timeout is not None and timeout <= 0:
+        metrics.incr(f'{upstream}.deadline_exceeded')
+        raise DeadlineExceeded('Request deadline exceeded before calling ' + upstream)
+
+    breaker = get_breaker(upstream)
+    if not breaker.allow():
+        metrics.incr(f'{upstream}.fast_fail')
+        raise CircuitOpenError(f'{upstream} is unavailable, try again shortly')
+
+    def call():
+        return fn(*args, **kwargs)
+
+    start = time.monotonic()
+    try:
+        if hedge:
+            result = _hedged(upstream, call, timeout)
+        elif timeout is None:
+            result = call()
+        else:
+            result = _wait_first([_executor.submit(call)], timeout)
+    except Exception as e:
+        if isinstance(e, DeadlineExceeded):
+            metrics.incr(f'{upstream}.deadline_exceeded')
+        if _is_upstream_failure(e):
+            metrics.incr(f'{upstream}.failures')
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise
+
+    breaker.record_success()
+    metrics.observe(f'{upstream}.latency', time.monotonic() - start)
+    return result
+
+
+def execute(query, read: bool = False):
+    """
+    Execute a PostgREST query builder through guarded_call
+
+    Args:
+        query: Supabase query builder, e.g. supabase.table('messages').select('*')
+        read: True for idempotent selects, which are hedged
+    """
+    return guarded_call('supabase', query.execute, hedge=read)
+
+
+def breaker_states() -> dict:
+    """Current state of every breaker, for the metrics endpoint"""
+    with _breakers_lock:
+        return {name: breaker.state for name, breaker in _breakers.items()}
+
+
+def upstream_error_status(exc: BaseException, default: int = 500) -> int:
+    """
+    HTTP status for an error raised while calling an upstream
+    503 while a breaker is open, 504 when the deadline ran out
+    """
+    if isinstance(exc, CircuitOpenError):
+        return 503
+    if isinstance(exc, DeadlineExceeded):
+        return 504
+    return default
@@ -0,0 +1,105 @@
+"""
+Session-affinity routing across service nodes
+A consistent-hash ring maps each session id to one node, so every turn of a
+session reaches the node whose local history is warm. Responses name the
+owning node in a header and a cookie for the load balancer to route on.
+Adding or removing a node only moves the sessions on its arcs of the ring.
+
+Shared by the Django and FastAPI services; no Django imports.
+"""
+import hashlib
+import os
+from bisect import bisect
+
+from safycore_backend import metrics
+
+# Comma-separated node names, e.g. "api-0,api-1,api-2"; empty disables routing
+ROUTING_NODES = [node.strip() for node in os.getenv('ROUTING_NODES', '').split(',') if node.strip()]
+# Name of this node in ROUTING_NODES
+ROUTING_NODE_ID = os.getenv('ROUTING_NODE_ID', '')
+# Points per node on the ring; more points spread sessions more evenly
+ROUTING_VNODES = int(os.getenv('ROUTING_VNODES', '160'))
+
+ROUTING_HEADER = 'X-Session-Node'
+ROUTING_COOKIE = 'session_node'
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent-hash ring of node names
+
+    Args:
+        nodes: Initial node names
+        vnodes: Points placed on the ring per node
+    """
+
+    def __init__(self, nodes=(), vnodes: int = ROUTING_VNODES):
+        self.vnodes = vnodes
+        self._points = []  # sorted hashes
+        self._owners = []  # node owning the point at the same index
+        self._nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> set:
+        return set(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def add(self, node: str) -> None:
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for i in range(self.vnodes):
+            point = _hash(f'{node}#{i}')
+            index = bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node: str) -> None:
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def node_for(self, key: str):
+        """Node owning key: the first point clockwise from its hash, or None on an empty ring"""
+        if not self._points:
+            return None
+        index = bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[index]
+
+
+ring = HashRing(ROUTING_NODES)
+
+
+def route(session_id: str):
+    """
+    Owning node of a session, or None when routing is not configured
+    Counts turns this node serves for sessions it does not own
+    """
+    if not ring:
+        return None
+    owner = ring.node_for(session_id)
+    metrics.incr('routing.local' if owner == ROUTING_NODE_ID else 'routing.misrouted')
+    return owner
+
+
+def set_route(response, session_id: str):
+    """
+    Name the session's node on a Django or Starlette response
+    The cookie lets cookie-affinity load balancers pin the client to it
+    """
+    owner = route(session_id)
+    if owner is not None:
+        response.headers[ROUTING_HEADER] = owner
+        response.set_cookie(ROUTING_COOKIE, owner, httponly=True, samesite='Lax')
+    return response
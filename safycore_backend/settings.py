@@ -12,14 +12,15 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Load environment variables (serverless platforms inject them directly)
+if (BASE_DIR / '.env').exists():
+    from dotenv import load_dotenv
+    load_dotenv(BASE_DIR / '.env')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -36,10 +37,45 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '*').split(',')
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 SUPABASE_SERVICE_KEY = os.getenv('SUPABASE_SERVICE_KEY')  # For admin operations
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv('SUPABASE_TIMEOUT_SECONDS', '10'))  # Hard cap per PostgREST call
 
 # Groq Configuration
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
 
+# Chat export/import
+CHAT_EXPORT_DEADLINE_SECONDS = float(os.getenv('CHAT_EXPORT_DEADLINE_SECONDS', '600'))
+CHAT_IMPORT_BATCH_SIZE = int(os.getenv('CHAT_IMPORT_BATCH_SIZE', '500'))
+
+# Batch chat endpoint
+CHAT_BATCH_MAX_ITEMS = int(os.getenv('CHAT_BATCH_MAX_ITEMS', '100'))
+CHAT_BATCH_MAX_WORKERS = int(os.getenv('CHAT_BATCH_MAX_WORKERS', '8'))
+CHAT_BATCH_DEADLINE_SECONDS = float(os.getenv('CHAT_BATCH_DEADLINE_SECONDS', '120'))
+
+# Session deletion: ids accepted per bulk request, sessions per purge round-trip
+SESSION_DELETE_MAX_IDS = int(os.getenv('SESSION_DELETE_MAX_IDS', '1000'))
+SESSION_PURGE_BATCH_SIZE = int(os.getenv('SESSION_PURGE_BATCH_SIZE', '50'))
+
+# Session titles and rolling summaries, generated by background jobs after turns
+SESSION_SUMMARIES = os.getenv('SESSION_SUMMARIES', 'True') == 'True'
+SESSION_SUMMARY_MODEL = os.getenv('SESSION_SUMMARY_MODEL', 'openai/gpt-oss-120b')
+SESSION_SUMMARY_DEBOUNCE_SECONDS = float(os.getenv('SESSION_SUMMARY_DEBOUNCE_SECONDS', '15'))  # Quiet time after a turn
+SESSION_SUMMARY_MAX_WAIT_SECONDS = float(os.getenv('SESSION_SUMMARY_MAX_WAIT_SECONDS', '120'))  # Cap on debouncing
+SESSION_SUMMARY_MIN_INTERVAL_SECONDS = float(os.getenv('SESSION_SUMMARY_MIN_INTERVAL_SECONDS', '120'))  # Per session
+SESSION_SUMMARY_RATE_PER_MINUTE = float(os.getenv('SESSION_SUMMARY_RATE_PER_MINUTE', '60'))  # Per process, 0 for no limit
+SESSION_SUMMARY_WORKERS = int(os.getenv('SESSION_SUMMARY_WORKERS', '2'))  # 0 leaves jobs to run_session_jobs
+
+# Training-data catalogs
+CATALOG_MAX_BYTES = int(os.getenv('CATALOG_MAX_BYTES', '2097152'))
+
+# Conversation search: 'local' mirrors messages into an SQLite FTS5 index,
+# 'supabase' queries the search_messages() function from supabase_setup.sql
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'local')
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', '50'))
+
+# Usage ledger: token counts are buffered in memory and written in batches
+USAGE_FLUSH_SECONDS = float(os.getenv('USAGE_FLUSH_SECONDS', '10'))
+USAGE_FLUSH_MAX_PENDING = int(os.getenv('USAGE_FLUSH_MAX_PENDING', '1000'))  # Buffered rows that trigger an early flush
+
 
 # Application definition
 
@@ -56,16 +92,45 @@ INSTALLED_APPS = [
     'chat',
 ]
 
-MIDDLEWARE = [
-    'django.middleware.security.SecurityMiddleware',
-    'corsheaders.middleware.CorsMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
-]
+# Smallest response body worth compressing (gzip, or brotli when installed)
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+
+# Requests under this prefix are bearer-token API calls
+API_PATH_PREFIX = '/api/'
+
+# 'lean' skips browser-only middleware (sessions, CSRF, Django auth, messages,
+# frame options) for API_PATH_PREFIX and drops SessionAuthentication;
+# the admin keeps the full stack. 'full' restores the stock behaviour.
+API_MIDDLEWARE_PROFILE = os.getenv('API_MIDDLEWARE_PROFILE', 'lean')
+
+MIDDLEWARE_PROFILES = {
+    'full': [
+        'django.middleware.security.SecurityMiddleware',
+        'safycore_backend.middleware.CompressionMiddleware',
+        'safycore_backend.middleware.DeadlineMiddleware',
+        'corsheaders.middleware.CorsMiddleware',
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.common.CommonMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    ],
+    'lean': [
+        'django.middleware.security.SecurityMiddleware',
+        'safycore_backend.middleware.CompressionMiddleware',
+        'safycore_backend.middleware.DeadlineMiddleware',
+        'corsheaders.middleware.CorsMiddleware',
+        'safycore_backend.middleware.BrowserSessionMiddleware',
+        'django.middleware.common.CommonMiddleware',
+        'safycore_backend.middleware.BrowserCsrfViewMiddleware',
+        'safycore_backend.middleware.BrowserAuthenticationMiddleware',
+        'safycore_backend.middleware.BrowserMessageMiddleware',
+        'safycore_backend.middleware.BrowserXFrameOptionsMiddleware',
+    ],
+}
+
+MIDDLEWARE = MIDDLEWARE_PROFILES[API_MIDDLEWARE_PROFILE]
 
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = True  # For development - restrict in production
@@ -138,6 +203,20 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Per-process cache for user profiles and rendered history/session lists
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'safycore',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('LOCAL_CACHE_MAX_ENTRIES', '10000'))},
+    }
+}
+
+# Seconds a profile or rendered body may be served from the local cache;
+# bounds staleness for writes made by other worker processes
+PROFILE_CACHE_SECONDS = int(os.getenv('PROFILE_CACHE_SECONDS', '300'))
+RESPONSE_CACHE_SECONDS = int(os.getenv('RESPONSE_CACHE_SECONDS', '300'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -147,13 +226,18 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'users.authentication.SupabaseAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
-    ],
+    ] + (['rest_framework.authentication.SessionAuthentication'] if API_MIDDLEWARE_PROFILE == 'full' else []),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson-backed when installed, the stock JSON classes otherwise
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'safycore_backend.renderers.ORJSONRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'safycore_backend.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'EXCEPTION_HANDLER': 'rest_framework.views.exception_handler',
 }
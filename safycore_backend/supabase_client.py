@@ -1,11 +1,42 @@
 """
 Supabase client configuration and utilities
+The supabase SDK is imported on first use to keep cold starts short
 """
-from supabase import create_client, Client
+from typing import TYPE_CHECKING
 from django.conf import settings
+from safycore_backend.resilience import guarded_call
 
+if TYPE_CHECKING:
+    from supabase import Client
 
-def get_supabase_client() -> Client:
+_shared_client = None
+
+
+def create_client(url: str, key: str) -> "Client":
+    """
+    Build a Supabase client with PostgREST calls capped at the configured
+    timeout, so a stalled connection cannot outlive the request deadline
+    by the library's 120s default
+    """
+    from supabase import ClientOptions, create_client as supabase_create_client
+
+    options = ClientOptions(postgrest_client_timeout=settings.SUPABASE_TIMEOUT_SECONDS)
+    return supabase_create_client(url, key, options=options)
+
+
+def get_shared_supabase_client() -> "Client":
+    """
+    Get the process-wide anon-key client
+    Only for stateless calls such as auth.get_user(token); calls that
+    store a session on the client must use get_supabase_client()
+    """
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = get_supabase_client()
+    return _shared_client
+
+
+def get_supabase_client() -> "Client":
     """
     Get Supabase client instance with anon key (user-level access)
     """
@@ -15,7 +46,7 @@ def get_supabase_client() -> Client:
     return create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
 
 
-def get_supabase_admin_client() -> Client:
+def get_supabase_admin_client() -> "Client":
     """
     Get Supabase client with service role key (admin-level access)
     Use this for server-side operations that bypass RLS
@@ -26,7 +57,7 @@ def get_supabase_admin_client() -> Client:
     return create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
 
 
-def get_user_supabase_client(access_token: str) -> Client:
+def get_user_supabase_client(access_token: str) -> "Client":
     """
     Get Supabase client authenticated with user's JWT token
     This ensures Row Level Security (RLS) is enforced
@@ -43,6 +74,6 @@ def get_user_supabase_client(access_token: str) -> Client:
     client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
 
     # Set the user's access token for all requests
-    client.auth.set_session(access_token, access_token)
+    guarded_call('supabase_auth', client.auth.set_session, access_token, access_token)
 
     return client
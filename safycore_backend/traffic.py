@@ -0,0 +1,196 @@
+"""
+Opt-in recorder of chat traffic shapes
+With TRAFFIC_RECORD_PATH set, every chat turn served over HTTP appends one
+JSON line describing its shape: when it arrived, a keyed hash of its
+session, whether it streamed, how long the message, training data and
+reply were, the status, and the time to first and last byte. No text, user
+id, session id or address is written. Think time and turns per session
+follow from the lines of a session; replay_traffic replays them.
+
+Workers append to the same file with one write per line. Set
+TRAFFIC_RECORD_SALT to the same secret in every worker so the turns of a
+session hash alike wherever they land; without it each process draws its
+own. Shared by the Django and FastAPI services; no Django imports.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+from safycore_backend import metrics
+
+logger = logging.getLogger(__name__)
+
+# JSONL file to append to; empty disables recording
+TRAFFIC_RECORD_PATH = os.getenv('TRAFFIC_RECORD_PATH', '')
+# Share of sessions recorded, chosen by session hash so sessions stay whole
+TRAFFIC_RECORD_SAMPLE = float(os.getenv('TRAFFIC_RECORD_SAMPLE', '1'))
+# Key of the session hash
+TRAFFIC_RECORD_SALT = (os.getenv('TRAFFIC_RECORD_SALT') or secrets.token_hex(16)).encode()
+
+_lock = threading.Lock()
+_file = None
+
+
+def session_hash(user_id, session_id) -> str:
+    """Keyed hash of a session; the same for every turn while the salt is"""
+    key = f'{user_id or ""}:{session_id}'.encode()
+    return hmac.new(TRAFFIC_RECORD_SALT, key, hashlib.sha256).hexdigest()[:16]
+
+
+def start_turn(service: str, user_id, session_id, message, stream: bool, training_data=None,
+               catalog: bool = False):
+    """
+    Begin recording a turn, or None when recording is off or the session is not sampled
+
+    Args:
+        service: 'django' or 'fastapi'
+        user_id: Owner of the session, if the service knows users
+    """
+    if not TRAFFIC_RECORD_PATH:
+        return None
+    session = session_hash(user_id, session_id)
+    if TRAFFIC_RECORD_SAMPLE < 1 and int(session[:8], 16) / 0x100000000 >= TRAFFIC_RECORD_SAMPLE:
+        return None
+    return Turn(service, session, _length(message), stream, _length(training_data), catalog)
+
+
+def _length(text) -> int:
+    return len(text) if isinstance(text, str) else 0
+
+
+class Turn:
+    """The shape of one chat turn, written when finish() is called"""
+
+    def __init__(self, service: str, session: str, message_chars: int, stream: bool,
+                 training_chars: int, catalog: bool):
+        self.record = {
+            'ts': round(time.time(), 3),
+            'service': service,
+            'session': session,
+            'stream': stream,
+            'message_chars': message_chars,
+            'training_chars': training_chars,
+            'catalog': catalog,
+        }
+        self.start = time.perf_counter()
+        self.first_byte = None
+        self.reply_chars = 0
+        self.finished = False
+
+    def chunk(self, text) -> None:
+        """Count a streamed chunk"""
+        if self.first_byte is None:
+            self.first_byte = time.perf_counter() - self.start
+        self.reply_chars += len(text)
+
+    def finish(self, status: int, reply=None, completed: bool = True) -> None:
+        """
+        Write the turn; later calls do nothing
+
+        Args:
+            reply: Reply text of a non-streamed turn; streamed chunks are counted already
+            completed: False when the client went away before the reply ended
+        """
+        if self.finished:
+            return
+        self.finished = True
+        if reply is not None:
+            self.reply_chars = len(reply)
+        latency = time.perf_counter() - self.start
+        self.record.update(
+            status=status,
+            latency=round(latency, 4),
+            first_byte=round(self.first_byte if self.first_byte is not None else latency, 4),
+            reply_chars=self.reply_chars,
+            completed=completed,
+        )
+        write(self.record)
+
+    def watch(self, body):
+        """Wrap a sync or async streaming body so the turn is written when it ends or is closed"""
+        return _WatchedAsyncBody(body, self) if hasattr(body, '__anext__') else _WatchedBody(body, self)
+
+
+def write(record: dict) -> None:
+    """Append one record; failures are counted and logged, never raised"""
+    global _file
+    line = json.dumps(record, separators=(',', ':')) + '\n'
+    try:
+        with _lock:
+            if _file is None:
+                # Unbuffered append: each line goes out in a single write()
+                _file = open(TRAFFIC_RECORD_PATH, 'ab', buffering=0)
+            _file.write(line.encode())
+        metrics.incr('traffic.recorded')
+    except OSError as e:
+        metrics.incr('traffic.record_failures')
+        logger.warning('Could not record traffic to %s: %s', TRAFFIC_RECORD_PATH, e)
+
+
+class _WatchedBody:
+    """Streaming body that counts its chunks and finishes its turn on exhaustion or close"""
+
+    def __init__(self, body, turn: Turn):
+        self.body = body
+        self.turn = turn
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self.body)
+        except StopIteration:
+            self.turn.finish(200)
+            raise
+        except BaseException:
+            self.turn.finish(500, completed=False)
+            raise
+        self.turn.chunk(chunk)
+        return chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            # A body closed before its end was cut short by the client
+            self.turn.finish(200, completed=False)
+
+
+class _WatchedAsyncBody:
+    """Async streaming body that counts its chunks and finishes its turn on exhaustion or close"""
+
+    def __init__(self, body, turn: Turn):
+        self.body = body
+        self.turn = turn
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = await self.body.__anext__()
+        except StopAsyncIteration:
+            self.turn.finish(200)
+            raise
+        except asyncio.CancelledError:
+            self.turn.finish(200, completed=False)
+            raise
+        except BaseException:
+            self.turn.finish(500, completed=False)
+            raise
+        self.turn.chunk(chunk)
+        return chunk
+
+    async def aclose(self):
+        try:
+            await self.body.aclose()
+        finally:
+            self.turn.finish(200, completed=False)
@@ -17,6 +17,9 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.http import JsonResponse
+from safycore_backend import metrics
+from safycore_backend.resilience import breaker_states
+from safycore_backend import views as diagnostics_views
 
 
 def api_root(request):
@@ -37,17 +40,46 @@ def api_root(request):
             'chat': {
                 'chat': '/api/chat/',
                 'stream': '/api/chat/stream/',
+                'websocket': '/api/chat/ws/',
+                'batch': '/api/chat/batch/',
                 'sessions': '/api/chat/sessions/',
                 'history': '/api/chat/conversation/<session_id>/',
                 'clear': '/api/chat/conversation/<session_id>/clear/',
-            }
+                'delete_sessions': '/api/chat/sessions/delete/',
+                'export': '/api/chat/export/',
+                'import': '/api/chat/import/',
+                'search': '/api/chat/search/?q=',
+                'usage': '/api/chat/usage/',
+                'catalogs': '/api/chat/catalogs/',
+                'catalog': '/api/chat/catalogs/<catalog_id>/',
+            },
+            'metrics': '/api/metrics/',
         }
     })
 
 
+def metrics_view(request):
+    """Process-local counters, latencies and circuit breaker states"""
+    data = metrics.snapshot()
+    data['breakers'] = breaker_states()
+    return JsonResponse(data)
+
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', api_root, name='api_root'),
+    path('api/metrics/', metrics_view, name='metrics'),
+    path('api/diagnostics/', diagnostics_views.diagnostics_counts, name='diagnostics'),
+    path('api/diagnostics/profile/', diagnostics_views.diagnostics_profile, name='diagnostics_profile'),
+    path('api/diagnostics/memory/', diagnostics_views.diagnostics_memory, name='diagnostics_memory'),
+    path('api/diagnostics/memory/start/', diagnostics_views.diagnostics_memory_start,
+         name='diagnostics_memory_start'),
+    path('api/diagnostics/memory/snapshot/', diagnostics_views.diagnostics_memory_snapshot,
+         name='diagnostics_memory_snapshot'),
+    path('api/diagnostics/memory/diff/', diagnostics_views.diagnostics_memory_diff,
+         name='diagnostics_memory_diff'),
+    path('api/diagnostics/memory/stop/', diagnostics_views.diagnostics_memory_stop,
+         name='diagnostics_memory_stop'),
     path('api/auth/', include('users.urls')),
     path('api/chat/', include('chat.urls')),
 ]
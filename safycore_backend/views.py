@@ -0,0 +1,125 @@
+"""
+Diagnostics endpoints of the Django service (see safycore_backend/diagnostics.py)
+They take the DIAGNOSTICS_TOKEN in the X-Diagnostics-Token header instead of
+a user's token, and answer 404 while no token is configured.
+"""
+import functools
+
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from safycore_backend import diagnostics
+
+diagnostics.register('local_cache.entries', lambda: len(getattr(cache, '_cache', ())))
+
+
+def diagnostics_required(view):
+    """Check the diagnostics token; invalid arguments (ValueError) answer 400"""
+    @csrf_exempt
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not diagnostics.DIAGNOSTICS_TOKEN:
+            return JsonResponse({'error': 'Not found'}, status=404)
+        if not diagnostics.authorized(request.headers.get(diagnostics.DIAGNOSTICS_HEADER)):
+            return JsonResponse({'error': 'Invalid diagnostics token'}, status=403)
+        try:
+            return view(request, *args, **kwargs)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+    return wrapper
+
+
+def _number(request, name, default, cast=int):
+    value = request.GET.get(name, default)
+    try:
+        value = cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number')
+    if value <= 0:
+        raise ValueError(f'{name} must be positive')
+    return value
+
+
+@diagnostics_required
+@require_GET
+def diagnostics_counts(request):
+    """Live counts; ?types=Groq,SyncClient also counts instances of those classes"""
+    types = [name for name in request.GET.get('types', '').split(',') if name]
+    return JsonResponse(diagnostics.counts(types))
+
+
+@diagnostics_required
+@require_GET
+def diagnostics_profile(request):
+    """
+    Sample all threads for ?seconds= (default 10) and return collapsed stacks
+    ?mode=wall includes waiting threads; ?format=json returns the stacks as JSON
+    """
+    seconds = _number(request, 'seconds', 10, float)
+    mode = request.GET.get('mode', 'cpu')
+    if mode not in ('cpu', 'wall'):
+        raise ValueError('mode must be cpu or wall')
+    try:
+        result = diagnostics.profile(seconds, mode)
+    except diagnostics.Busy as e:
+        return JsonResponse({'error': str(e)}, status=409)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'samples': result['samples'],
+            'seconds': result['seconds'],
+            'mode': mode,
+            'stacks': [{'stack': stack, 'count': count} for stack, count in result['stacks'].most_common()],
+        })
+    response = HttpResponse(diagnostics.collapsed(result['stacks']), content_type='text/plain; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="profile-{mode}.collapsed"'
+    return response
+
+
+@diagnostics_required
+@require_GET
+def diagnostics_memory(request):
+    """tracemalloc state and the ids of the kept snapshots"""
+    return JsonResponse(diagnostics.memory_status())
+
+
+@diagnostics_required
+@require_POST
+def diagnostics_memory_start(request):
+    """Start tracing allocations, ?frames= deep (default 1)"""
+    return JsonResponse(diagnostics.start_tracing(_number(request, 'frames', 1)))
+
+
+@diagnostics_required
+@require_POST
+def diagnostics_memory_snapshot(request):
+    """Snapshot traced allocations; ?top= sites, ?group_by=lineno|filename|traceback"""
+    group_by = request.GET.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        raise ValueError('group_by must be lineno, filename or traceback')
+    try:
+        data = diagnostics.take_snapshot(_number(request, 'top', 20), group_by)
+    except RuntimeError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse(data)
+
+
+@diagnostics_required
+@require_GET
+def diagnostics_memory_diff(request):
+    """Allocation changes from snapshot ?from= to snapshot ?to="""
+    old, new = _number(request, 'from', None), _number(request, 'to', None)
+    try:
+        data = diagnostics.diff_snapshots(old, new, _number(request, 'top', 20))
+    except KeyError:
+        return JsonResponse({'error': 'Unknown snapshot id'}, status=404)
+    return JsonResponse(data)
+
+
+@diagnostics_required
+@require_POST
+def diagnostics_memory_stop(request):
+    """Stop tracing and drop the snapshots"""
+    return JsonResponse(diagnostics.stop_tracing())
@@ -0,0 +1,64 @@
+"""
+Warm-up hook run once per worker before it serves traffic
+Imports the URLconf (views, DRF, the auth backend and the SDKs behind them)
+and builds the pooled clients, so the first request does not pay for it
+"""
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up() -> float:
+    """
+    Pre-build everything the first request would otherwise build lazily
+
+    Returns:
+        float: Seconds spent warming up
+    """
+    start = time.perf_counter()
+
+    from django.urls import get_resolver
+    from rest_framework.settings import api_settings
+
+    # Resolving the URLconf imports every view module and its dependencies
+    get_resolver().url_patterns
+    api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    api_settings.DEFAULT_RENDERER_CLASSES
+
+    from safycore_backend.groq_client import get_groq_client
+    from safycore_backend.supabase_client import get_shared_supabase_client
+
+    for build in (get_groq_client, get_shared_supabase_client):
+        try:
+            build()
+        except Exception as e:
+            # Missing credentials must not stop the worker from booting
+            logger.warning('Warm-up skipped %s: %s', build.__name__, e)
+
+    return time.perf_counter() - start
+
+
+def after_fork() -> None:
+    """
+    Give a forked worker its own connections
+    With a preloaded app the master has already built the pooled clients;
+    sockets a pool opened there must not be shared between workers, so each
+    worker drops the inherited clients and database connections and builds
+    fresh ones
+    """
+    from django.db import connections
+
+    from safycore_backend import groq_client, supabase_client
+
+    connections.close_all()
+    groq_client._client = None
+    supabase_client._shared_client = None
+    if warm_up_enabled():
+        warm_up()
+
+
+def warm_up_enabled() -> bool:
+    """WARMUP=0 disables the hook, e.g. for one-off scripts"""
+    return os.getenv('WARMUP', '1') != '0'
@@ -0,0 +1,344 @@
+"""
+Multiplexed chat protocol over one WebSocket
+Shared by the Django ASGI application and the FastAPI app: the transport
+adapters supply receive/send callables, the services supply authentication
+and the per-turn token generator
+
+Frames are JSON text messages. Client to server:
+    {"type": "auth", "token": "..."}                     first frame; send again with a fresh
+                                                          token before the current one expires
+    {"type": "chat", "id": "r1", "session_id": "s1", "message": "...", "training_data": "..."}
+                                                          or "catalog_id" instead of training_data
+    {"type": "cancel", "id": "r1"}
+    {"type": "ping"}
+Server to client:
+    {"type": "ready"}                                    after each accepted auth frame
+    {"type": "token", "id": "r1", "session_id": "s1", "seq": 0, "content": "..."}
+    {"type": "done", "id": "r1", "session_id": "s1", "content": "<cleaned reply>"}
+    {"type": "cancelled", "id": "r1", "session_id": "s1"}
+    {"type": "error", "id": "r1", "status": 503, "error": "..."}
+    {"type": "pong"}
+
+This module has no Django imports so app.py can use it too.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from safycore_backend import fastjson, metrics
+from safycore_backend.resilience import upstream_error_status
+
+# Seconds a new connection has to send its auth frame
+WEBSOCKET_AUTH_TIMEOUT_SECONDS = float(os.getenv('WEBSOCKET_AUTH_TIMEOUT_SECONDS', '10'))
+
+# Concurrent generations per connection
+WEBSOCKET_MAX_IN_FLIGHT = int(os.getenv('WEBSOCKET_MAX_IN_FLIGHT', '4'))
+
+# Outbound frames buffered per connection before generators are paused
+WEBSOCKET_SEND_QUEUE_SIZE = int(os.getenv('WEBSOCKET_SEND_QUEUE_SIZE', '64'))
+
+# Threads running blocking turns (Supabase, Groq) for all connections
+WEBSOCKET_TURN_WORKERS = int(os.getenv('WEBSOCKET_TURN_WORKERS', '32'))
+
+# Close codes in the private-use range
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_AUTH_TIMEOUT = 4408
+
+_turn_executor = ThreadPoolExecutor(max_workers=WEBSOCKET_TURN_WORKERS, thread_name_prefix='ws-turn')
+
+
+class TurnCancelled(Exception):
+    """The client cancelled the turn or disconnected"""
+
+
+class TurnError(Exception):
+    """A turn was rejected before it started; carries the HTTP-style status"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class ChatSocket:
+    """
+    One client connection: authenticates, then runs chat turns
+    concurrently, keyed by the client's request id
+
+    A principal with an expires_at (epoch seconds) is only trusted until
+    then: later auth frames replace it, and any other frame after it
+    expired closes the connection with CLOSE_UNAUTHORIZED. A replacement
+    must have the same identity attribute as the principal it replaces.
+
+    Args:
+        receive_text: async () -> str, or None once the client disconnected
+        send_text: async (str) -> None
+        authenticate: blocking (auth_frame) -> principal; raises to reject
+        start_turn: blocking (principal, chat_frame) -> generator of text
+            chunks whose return value is the final reply; raises TurnError
+            to reject the turn with a status
+        close: async (code) -> None, closes the transport
+    """
+
+    def __init__(self, receive_text, send_text, authenticate, start_turn, close, name='ws'):
+        self.receive_text = receive_text
+        self.send_text = send_text
+        self.authenticate = authenticate
+        self.start_turn = start_turn
+        self.close = close
+        self.name = name
+        self.principal = None
+        self.loop = None
+        self.queue = None
+        self.turns = {}  # request id -> (session_id, cancel Event)
+        self.tasks = set()
+        self.closed = False
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=WEBSOCKET_SEND_QUEUE_SIZE)
+        metrics.incr(f'{self.name}.connections')
+
+        if not await self._authenticate():
+            return
+
+        writer = asyncio.create_task(self._writer())
+        try:
+            while True:
+                text = await self.receive_text()
+                if text is None:
+                    break
+                await self._dispatch(text)
+                if self.closed:
+                    break
+        finally:
+            self.closed = True
+            for _, cancel in self.turns.values():
+                cancel.set()
+            writer.cancel()
+
+    async def _authenticate(self) -> bool:
+        try:
+            text = await asyncio.wait_for(self.receive_text(), WEBSOCKET_AUTH_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            await self.close(CLOSE_AUTH_TIMEOUT)
+            return False
+        if text is None:
+            return False
+
+        frame = self._parse(text)
+        if not frame or frame.get('type') != 'auth':
+            await self.send_text(self._encode({'type': 'error', 'status': 401, 'error': 'First frame must be auth'}))
+            await self.close(CLOSE_UNAUTHORIZED)
+            return False
+        try:
+            self.principal = await self._in_thread(self.authenticate, frame)
+        except Exception as e:
+            metrics.incr(f'{self.name}.auth_failures')
+            await self.send_text(self._encode({'type': 'error', 'status': 401, 'error': str(e)}))
+            await self.close(CLOSE_UNAUTHORIZED)
+            return False
+
+        await self.send_text(self._encode({'type': 'ready'}))
+        return True
+
+    async def _dispatch(self, text):
+        frame = self._parse(text)
+        if frame is None:
+            await self._put({'type': 'error', 'status': 400, 'error': 'Frames must be JSON objects'})
+            return
+
+        kind = frame.get('type')
+        if kind == 'auth':
+            await self._reauthenticate(frame)
+            return
+        if self._expired():
+            metrics.incr(f'{self.name}.expired')
+            self.closed = True
+            await self.send_text(self._encode({'type': 'error', 'status': 401, 'error': 'Access token expired'}))
+            await self.close(CLOSE_UNAUTHORIZED)
+            return
+
+        if kind == 'ping':
+            await self._put({'type': 'pong'})
+        elif kind == 'cancel':
+            turn = self.turns.get(frame.get('id'))
+            if turn is not None:
+                turn[1].set()
+        elif kind == 'chat':
+            try:
+                self._admit(frame)
+            except TurnError as e:
+                await self._put({'type': 'error', 'id': frame.get('id'), 'status': e.status, 'error': str(e)})
+                return
+            cancel = threading.Event()
+            self.turns[frame['id']] = (frame['session_id'], cancel)
+            task = asyncio.ensure_future(self._run_turn(frame, cancel))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        else:
+            await self._put({'type': 'error', 'id': frame.get('id'), 'status': 400,
+                             'error': f'Unknown frame type: {kind}'})
+
+    def _expired(self) -> bool:
+        expires_at = getattr(self.principal, 'expires_at', None)
+        return expires_at is not None and time.time() >= expires_at
+
+    async def _reauthenticate(self, frame):
+        """Replace the principal with one from a fresh token; turns in flight keep the old one"""
+        try:
+            principal = await self._in_thread(self.authenticate, frame)
+        except Exception as e:
+            metrics.incr(f'{self.name}.auth_failures')
+            await self._put({'type': 'error', 'status': 401, 'error': str(e)})
+            return
+        if getattr(principal, 'identity', None) != getattr(self.principal, 'identity', None):
+            await self._put({'type': 'error', 'status': 403, 'error': 'A connection cannot switch users'})
+            return
+        self.principal = principal
+        await self._put({'type': 'ready'})
+
+    def _admit(self, frame):
+        request_id = frame.get('id')
+        if not isinstance(request_id, str) or not request_id:
+            raise TurnError('Chat frames require a string id')
+        if not frame.get('message'):
+            raise TurnError('Message is required')
+        frame.setdefault('session_id', 'default')
+        if request_id in self.turns:
+            raise TurnError(f'Request {request_id} is already in flight', 409)
+        if any(session_id == frame['session_id'] for session_id, _ in self.turns.values()):
+            raise TurnError(f"Session {frame['session_id']} already has a reply in progress", 409)
+        if len(self.turns) >= WEBSOCKET_MAX_IN_FLIGHT:
+            raise TurnError(f'At most {WEBSOCKET_MAX_IN_FLIGHT} replies in flight per connection', 429)
+
+    async def _run_turn(self, frame, cancel):
+        request_id, session_id = frame['id'], frame['session_id']
+        try:
+            await self._in_thread(self._pump, frame, cancel)
+        except TurnCancelled:
+            metrics.incr(f'{self.name}.cancelled')
+            await self._put({'type': 'cancelled', 'id': request_id, 'session_id': session_id})
+        except TurnError as e:
+            await self._put({'type': 'error', 'id': request_id, 'session_id': session_id,
+                             'status': e.status, 'error': str(e)})
+        except Exception as e:
+            await self._put({'type': 'error', 'id': request_id, 'session_id': session_id,
+                             'status': upstream_error_status(e, 500), 'error': str(e)})
+        finally:
+            self.turns.pop(request_id, None)
+
+    def _pump(self, frame, cancel):
+        """Runs in a worker thread: pulls tokens and forwards them with backpressure"""
+        request_id, session_id = frame['id'], frame['session_id']
+        generator = self.start_turn(self.principal, frame)
+        seq = 0
+        try:
+            while True:
+                if cancel.is_set():
+                    raise TurnCancelled()
+                try:
+                    content = next(generator)
+                except StopIteration as stop:
+                    reply = stop.value
+                    break
+                self._put_blocking({'type': 'token', 'id': request_id, 'session_id': session_id,
+                                    'seq': seq, 'content': content}, cancel)
+                seq += 1
+        finally:
+            # Closing the generator stops the upstream stream on cancellation
+            generator.close()
+
+        self._put_blocking({'type': 'done', 'id': request_id, 'session_id': session_id,
+                            'content': reply}, cancel)
+
+    def _put_blocking(self, frame, cancel):
+        """Queue a frame from a worker thread, waiting while the client reads slowly"""
+        future = asyncio.run_coroutine_threadsafe(self._put(frame), self.loop)
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except FutureTimeout:
+                if cancel.is_set():
+                    future.cancel()
+                    raise TurnCancelled()
+                metrics.incr(f'{self.name}.backpressure_waits')
+
+    async def _put(self, frame):
+        if not self.closed:
+            await self.queue.put(frame)
+
+    async def _writer(self):
+        while True:
+            frame = await self.queue.get()
+            try:
+                await self.send_text(self._encode(frame))
+            except Exception:
+                # The client went away; the reader loop will see the disconnect
+                self.closed = True
+                for _, cancel in self.turns.values():
+                    cancel.set()
+                return
+
+    async def _in_thread(self, fn, *args):
+        context = contextvars.copy_context()
+        return await self.loop.run_in_executor(_turn_executor, context.run, fn, *args)
+
+    @staticmethod
+    def _parse(text):
+        try:
+            frame = fastjson.loads(text)
+        except ValueError:
+            return None
+        return frame if isinstance(frame, dict) else None
+
+    @staticmethod
+    def _encode(frame) -> str:
+        return fastjson.dumps(frame).decode('utf-8')
+
+
+async def serve_asgi(scope, receive, send, authenticate, start_turn, name='ws'):
+    """
+    Run a ChatSocket on a raw ASGI websocket connection
+
+    Args:
+        scope, receive, send: ASGI websocket connection
+        authenticate, start_turn: See ChatSocket
+    """
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    await send({'type': 'websocket.accept'})
+
+    disconnected = False
+
+    async def receive_text():
+        nonlocal disconnected
+        while not disconnected:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                disconnected = True
+                return None
+            if message['type'] == 'websocket.receive':
+                if message.get('text') is not None:
+                    return message['text']
+                if message.get('bytes') is not None:
+                    return message['bytes'].decode('utf-8', errors='replace')
+        return None
+
+    async def send_text(text):
+        await send({'type': 'websocket.send', 'text': text})
+
+    async def close(code):
+        nonlocal disconnected
+        if not disconnected:
+            disconnected = True
+            await send({'type': 'websocket.close', 'code': code})
+
+    socket = ChatSocket(receive_text, send_text, authenticate, start_turn, close, name=name)
+    try:
+        await socket.run()
+    finally:
+        await close(1000)
@@ -11,9 +11,13 @@ CREATE TABLE IF NOT EXISTS messages (
   session_id VARCHAR(255) NOT NULL,
   role VARCHAR(50) NOT NULL CHECK (role IN ('system', 'user', 'assistant')),
   content TEXT NOT NULL,
+  truncated BOOLEAN NOT NULL DEFAULT FALSE,  -- reply cut short because the client disconnected
   created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Existing installations: add the column introduced for cancelled streams
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS truncated BOOLEAN NOT NULL DEFAULT FALSE;
+
 -- Create index for faster queries
 CREATE INDEX IF NOT EXISTS idx_messages_user_session
   ON messages(user_id, session_id);
@@ -81,7 +85,39 @@ CREATE TRIGGER update_training_data_updated_at
   EXECUTE FUNCTION update_updated_at_column();
 
 -- ============================================================
--- 7. VERIFY SETUP (Optional - Run to check)
+-- 7. FULL-TEXT SEARCH OVER MESSAGES (SEARCH_BACKEND=supabase)
+-- ============================================================
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS content_tsv tsvector
+  GENERATED ALWAYS AS (to_tsvector('english', content)) STORED;
+
+-- user_id leads so one user's matches are found without scanning others'
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+CREATE INDEX IF NOT EXISTS idx_messages_user_content_tsv
+  ON messages USING GIN (user_id, content_tsv);
+
+-- SECURITY INVOKER keeps RLS in force: callers only ever see their own rows
+CREATE OR REPLACE FUNCTION search_messages(q TEXT, max_results INT DEFAULT 20, skip INT DEFAULT 0)
+RETURNS TABLE (session_id VARCHAR, role VARCHAR, snippet TEXT, created_at TIMESTAMP WITH TIME ZONE, rank REAL)
+LANGUAGE sql STABLE SECURITY INVOKER AS $$
+  -- Matches are delimited with control characters, the snippet is HTML-escaped,
+  -- then the delimiters become <mark> tags, so message content is never markup
+  SELECT m.session_id, m.role,
+         replace(replace(
+           replace(replace(replace(replace(replace(
+             ts_headline('english', translate(m.content, chr(2) || chr(3), ''), query,
+                         'StartSel=' || chr(2) || ', StopSel=' || chr(3) ||
+                         ', MaxWords=24, MinWords=8, MaxFragments=1'),
+             '&', '&amp;'), '<', '&lt;'), '>', '&gt;'), '"', '&quot;'), '''', '&#x27;'),
+           chr(2), '<mark>'), chr(3), '</mark>'),
+         m.created_at, ts_rank(m.content_tsv, query) AS rank
+  FROM messages m, websearch_to_tsquery('english', q) query
+  WHERE m.user_id = auth.uid() AND m.role <> 'system' AND m.content_tsv @@ query
+  ORDER BY rank DESC, m.created_at DESC
+  LIMIT max_results OFFSET skip;
+$$;
+
+-- ============================================================
+-- 8. VERIFY SETUP (Optional - Run to check)
 -- ============================================================
 -- Check if tables exist
 SELECT table_name
@@ -3,8 +3,9 @@ Supabase JWT authentication backend for Django REST Framework
 """
 from rest_framework import authentication, exceptions
 from django.conf import settings
-from safycore_backend.supabase_client import get_supabase_client
-from .models import UserProfile
+from safycore_backend.supabase_client import get_shared_supabase_client
+from safycore_backend.resilience import guarded_call
+from .cache import get_profile
 
 
 class SupabaseAuthentication(authentication.BaseAuthentication):
@@ -27,27 +28,36 @@ class SupabaseAuthentication(authentication.BaseAuthentication):
 
         token = auth_header.split(' ')[1]
 
+        user_profile, supabase_user = self.authenticate_token(token)
+
+        # Store token in request for later use
+        request.supabase_token = token
+        request.supabase_user = supabase_user
+
+        return (user_profile, token)
+
+    def authenticate_token(self, token):
+        """
+        Validate a Supabase access token outside of a DRF request
+        Also used by the WebSocket channel, which authenticates once per connection
+
+        Returns:
+            tuple: (user_profile, supabase_user)
+        """
         try:
-            # Verify token with Supabase
-            supabase = get_supabase_client()
-            user_response = supabase.auth.get_user(token)
+            # Verify token with Supabase (stateless, so the pooled client is safe)
+            supabase = get_shared_supabase_client()
+            user_response = guarded_call('supabase_auth', supabase.auth.get_user, token)
 
             if not user_response or not user_response.user:
                 raise exceptions.AuthenticationFailed('Invalid token')
 
             supabase_user = user_response.user
 
-            # Get or create UserProfile
-            user_profile, created = UserProfile.objects.get_or_create(
-                user_id=supabase_user.id,
-                defaults={'email': supabase_user.email}
-            )
-
-            # Store token in request for later use
-            request.supabase_token = token
-            request.supabase_user = supabase_user
+            # Get or create UserProfile (served from the profile cache after the first request)
+            user_profile = get_profile(supabase_user.id, supabase_user.email)
 
-            return (user_profile, token)
+            return user_profile, supabase_user
 
         except Exception as e:
             raise exceptions.AuthenticationFailed(f'Authentication failed: {str(e)}')
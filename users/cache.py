@@ -0,0 +1,42 @@
+"""
+Per-process UserProfile cache keyed by Supabase user id
+Authentication resolves the profile on every request; profiles change
+almost never, so they are served from the local cache and dropped by the
+UserProfile save/delete signals (see users/signals.py)
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from safycore_backend import metrics
+from .models import UserProfile
+
+
+def profile_key(user_id) -> str:
+    return f'profile:{user_id}'
+
+
+def get_profile(user_id, email=None) -> UserProfile:
+    """
+    Return the user's profile, creating it on first sight
+
+    The cache hands out a fresh copy on every hit, so callers may modify
+    and save the instance they get.
+    """
+    key = profile_key(user_id)
+    profile = cache.get(key)
+    if profile is not None:
+        metrics.incr('profile_cache.hits')
+        return profile
+
+    metrics.incr('profile_cache.misses')
+    profile, created = UserProfile.objects.get_or_create(
+        user_id=user_id,
+        defaults={'email': email}
+    )
+    cache.set(key, profile, settings.PROFILE_CACHE_SECONDS)
+    return profile
+
+
+def invalidate_profile(user_id) -> None:
+    """Drop a cached profile"""
+    cache.delete(profile_key(user_id))
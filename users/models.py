@@ -23,3 +23,8 @@ class UserProfile(models.Model):
 
     def __str__(self):
         return f"{self.email} ({self.user_id})"
+
+    @property
+    def is_authenticated(self):
+        """Profiles are only ever resolved from a valid token, so DRF's IsAuthenticated accepts them"""
+        return True
@@ -0,0 +1,13 @@
+"""
+Keep the profile cache consistent with UserProfile writes
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_profile
+from .models import UserProfile
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def drop_cached_profile(sender, instance, **kwargs):
+    invalidate_profile(instance.user_id)
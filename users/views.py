@@ -6,6 +6,9 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from safycore_backend.supabase_client import get_supabase_client
+from safycore_backend.resilience import guarded_call, upstream_error_status
+from chat.cache import warm_user_later
+from .cache import get_profile
 from .models import UserProfile
 
 
@@ -29,7 +32,7 @@ class SignupView(APIView):
             supabase = get_supabase_client()
 
             # Sign up user in Supabase
-            auth_response = supabase.auth.sign_up({
+            auth_response = guarded_call('supabase_auth', supabase.auth.sign_up, {
                 'email': email,
                 'password': password
             })
@@ -59,7 +62,7 @@ class SignupView(APIView):
         except Exception as e:
             return Response(
                 {'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
             )
 
 
@@ -83,7 +86,7 @@ class LoginView(APIView):
             supabase = get_supabase_client()
 
             # Sign in user with Supabase
-            auth_response = supabase.auth.sign_in_with_password({
+            auth_response = guarded_call('supabase_auth', supabase.auth.sign_in_with_password, {
                 'email': email,
                 'password': password
             })
@@ -94,11 +97,11 @@ class LoginView(APIView):
                     status=status.HTTP_401_UNAUTHORIZED
                 )
 
-            # Get or create UserProfile
-            user_profile, created = UserProfile.objects.get_or_create(
-                user_id=auth_response.user.id,
-                defaults={'email': auth_response.user.email}
-            )
+            # Get or create UserProfile; cached for the requests that follow
+            user_profile = get_profile(auth_response.user.id, auth_response.user.email)
+
+            # Prefetch the first chat screen (session list, default session history)
+            warm_user_later(user_profile, auth_response.user.id, auth_response.session.access_token)
 
             return Response({
                 'message': 'Login successful',
@@ -113,7 +116,7 @@ class LoginView(APIView):
         except Exception as e:
             return Response(
                 {'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
             )
 
 
@@ -129,7 +132,7 @@ class LogoutView(APIView):
             token = request.supabase_token
 
             # Sign out from Supabase
-            supabase.auth.sign_out()
+            guarded_call('supabase_auth', supabase.auth.sign_out)
 
             return Response({
                 'message': 'Logout successful'
@@ -138,7 +141,7 @@ class LogoutView(APIView):
         except Exception as e:
             return Response(
                 {'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
             )
 
 
@@ -166,7 +169,7 @@ class ProfileView(APIView):
         """
         user_profile = request.user
 
-        # Update default_session_id if provided
+        # Update default_session_id if provided (saving drops the cached profile)
         if 'default_session_id' in request.data:
             user_profile.default_session_id = request.data['default_session_id']
             user_profile.save()
@@ -201,7 +204,7 @@ class PasswordResetRequestView(APIView):
 
             # Send password reset email
             # Supabase will send email with reset link automatically
-            supabase.auth.reset_password_email(email)
+            guarded_call('supabase_auth', supabase.auth.reset_password_email, email)
 
             return Response({
                 'message': 'Password reset email sent. Please check your inbox.',
@@ -235,10 +238,10 @@ class PasswordResetConfirmView(APIView):
             supabase = get_supabase_client()
 
             # Set session with the reset token
-            supabase.auth.set_session(access_token, access_token)
+            guarded_call('supabase_auth', supabase.auth.set_session, access_token, access_token)
 
             # Update password
-            supabase.auth.update_user({
+            guarded_call('supabase_auth', supabase.auth.update_user, {
                 'password': new_password
             })
 
@@ -275,7 +278,7 @@ class ChangePasswordView(APIView):
 
             # Verify current password by attempting to sign in
             try:
-                supabase.auth.sign_in_with_password({
+                guarded_call('supabase_auth', supabase.auth.sign_in_with_password, {
                     'email': user_profile.email,
                     'password': current_password
                 })
@@ -287,8 +290,8 @@ class ChangePasswordView(APIView):
 
             # Update to new password
             token = request.supabase_token
-            supabase.auth.set_session(token, token)
-            supabase.auth.update_user({
+            guarded_call('supabase_auth', supabase.auth.set_session, token, token)
+            guarded_call('supabase_auth', supabase.auth.update_user, {
                 'password': new_password
             })
 
@@ -299,5 +302,5 @@ class ChangePasswordView(APIView):
         except Exception as e:
             return Response(
                 {'error': f'Failed to change password: {str(e)}'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                status=upstream_error_status(e, status.HTTP_500_INTERNAL_SERVER_ERROR)
             )